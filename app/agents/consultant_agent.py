@@ -1,8 +1,6 @@
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_groq import ChatGroq
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+from functools import lru_cache
+import hashlib
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -10,30 +8,17 @@ import os
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-# Get the root project directory (parent of scripts/)
-root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
 from app.state import GraphState
+from app.resources import get_llm, get_index
+from app.cache import TTLCache
+from app.trace import render_trace
 
 # --- 1. Set up the Retriever ---
-# This is the component that searches the vector store
-DB_PATH = os.path.join(root_dir, "vector_store")
-
-# Load the same embedding model used during ingestion
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2",
-    model_kwargs={"device": "cpu"},
-)
-
-# Load the vector store from disk
-db = FAISS.load_local(DB_PATH, embeddings, allow_dangerous_deserialization=True)
-
-# Create the retriever
-retriever = db.as_retriever()
-
-# --- 2. Define the LLM and Prompt ---
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
+# The embedding model and the FAISS index (vector_store/) are loaded lazily by
+# app.resources the first time a playbook is consulted, and swapped in place when
+# a new index is ingested (see app.resources.reload_vector_store).
 
+# --- 2. Define the Prompt ---
 consultant_prompt = ChatPromptTemplate.from_template(
 """You are an expert cybersecurity consultant. Your role is to provide specific, actionable steps from the official company playbooks.
 
@@ -50,13 +35,29 @@ Incident Summary:
 )
 
 # --- 3. Create the RAG Chain ---
-rag_chain = (
-    {"context": retriever, "incident_summary": RunnablePassthrough()}
-    | consultant_prompt
-    | llm
+# Retrieval runs separately (see below) so its result can key the answer cache
+@lru_cache(maxsize=None)
+def get_rag_chain():
+    return consultant_prompt | get_llm()
+
+# --- 4. Cache Answers by Retrieved Chunks ---
+# Incidents of the same type retrieve the same playbook chunks, and the answer is
+# drawn from those chunks, so it is reused for a retrieval set seen before. The
+# index version is part of the key and the cache is cleared when it changes.
+answer_cache = TTLCache(
+    max_entries=int(os.getenv("PLAYBOOK_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("PLAYBOOK_CACHE_TTL", "86400")),
+    name="playbook_answers",
 )
 
-# --- 4. Define the Node for the Graph ---
+def chunk_id(doc) -> str:
+    """Stable ID of a retrieved chunk (set by scripts/ingest.py, with fallbacks for older indexes)."""
+    return doc.metadata.get("chunk_id") or doc.id or hashlib.sha256(doc.page_content.encode()).hexdigest()
+
+def answer_cache_key(index_version: str, docs) -> str:
+    return index_version + ":" + ",".join(sorted(chunk_id(doc) for doc in docs))
+
+# --- 5. Define the Node for the Graph ---
 def run_consultant_agent(state: GraphState) -> dict:
     """
     Runs the consultant agent to get advice from the knowledge base.
@@ -72,12 +73,20 @@ def run_consultant_agent(state: GraphState) -> dict:
 
     # Use the high-level trace as a fallback if no detailed summaries are present
     if not summary_points:
-        summary_points.append("\n".join(state["investigation_trace"]))
+        summary_points.append(render_trace(state.get("investigation_trace")))
 
     incident_summary = "\n".join(summary_points)
-    
-    response = rag_chain.invoke(incident_summary)
+
+    # One snapshot of the index and its version, even if a reload swaps them meanwhile
+    store, index_version = get_index()
+    answer_cache.clear_on_change(index_version)
+
+    docs = store.as_retriever().invoke(incident_summary)
+    playbook = answer_cache.get_or_compute(
+        answer_cache_key(index_version, docs),
+        lambda: get_rag_chain().invoke({"context": docs, "incident_summary": incident_summary}).content,
+    )
     
     return {
-        "playbook_steps": [response.content]
+        "playbook_steps": [playbook]
     }
\ No newline at end of file
@@ -1,6 +1,7 @@
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
+from functools import lru_cache
+from itertools import islice
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -10,8 +11,21 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.state import GraphState
+from app.resources import get_llm
+from app.tokens import count_tokens
+from app.trace import trace_entry
+from app.log_preprocessing import LogDigest, iter_lines, pack_windows
 
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
+# Logs that fit this many tokens go to the LLM as-is. Bigger logs are reduced to
+# their suspicious windows first, and analysed in batches of this size.
+LOG_TOKEN_BUDGET = int(os.getenv("LOG_TOKEN_BUDGET", "3000"))
+# At most this many batches per log: if the suspicious windows need more, only
+# the most severe ones are analysed.
+LOG_MAX_BATCHES = int(os.getenv("LOG_MAX_BATCHES", "8"))
+# Prefix of the summary of a large log that no detector flagged: no flag is no
+# benign verdict (some patterns, e.g. connections from unexpected addresses, have
+# no detector), so the LLM reviews the rarest lines of the log instead
+RARE_LINES_ONLY = "Only the rarest lines were reviewed: the log is too large to send whole and no detector matched any line."
 
 class LogAnalysis(BaseModel):
     """Structured Output for the Log Analysis agent."""
@@ -34,7 +48,65 @@ log_analyst_prompt = ChatPromptTemplate.from_messages([
         ('human', "Please analyze the following logs related to the alert:\n\n{logs}")
 ])
 
-log_analyst_chain = log_analyst_prompt | llm.with_structured_output(LogAnalysis)
+# Combines the per-batch analyses of a large log into one verdict
+log_reduce_prompt = ChatPromptTemplate.from_messages([
+    ('system',
+    """You are a senior cybersecurity analyst. A large log was pre-filtered down to its suspicious sections, which were analysed in batches.
+        Combine the batch analyses below into a single summary of the key events and a final verdict on whether an anomaly is present.
+        You must respond in the format of the `LogAnalysis` tool."""),
+
+        ('human', "{overview}\n\nBatch analyses:\n\n{analyses}")
+])
+
+@lru_cache(maxsize=None)
+def get_log_analyst_chain():
+    return log_analyst_prompt | get_llm().with_structured_output(LogAnalysis)
+
+@lru_cache(maxsize=None)
+def get_log_reduce_chain():
+    return log_reduce_prompt | get_llm().with_structured_output(LogAnalysis)
+
+def fits_budget(logs: str) -> bool:
+    # Cheap length check first so multi-megabyte logs are never tokenized whole
+    return len(logs) <= LOG_TOKEN_BUDGET * 8 and count_tokens(logs) <= LOG_TOKEN_BUDGET
+
+def analyze_large_logs(logs) -> LogAnalysis:
+    """
+    Streams the logs through LogDigest and sends only the suspicious windows to the
+    LLM, the most severe first if they do not all fit in LOG_MAX_BATCHES batches.
+    If they do not fit in one batch, each batch is analysed separately (map) and the
+    results are combined (reduce). For a log without detector hits, the LLM
+    reviews its rarest lines.
+    """
+    digest = LogDigest()
+    windows = digest.top_windows(iter_lines(logs), LOG_TOKEN_BUDGET * LOG_MAX_BATCHES, LOG_TOKEN_BUDGET)
+    batches = islice(pack_windows(windows, LOG_TOKEN_BUDGET), LOG_MAX_BATCHES)
+
+    first = next(batches, None)
+    if first is None:
+        overview = digest.overview()
+        rare = digest.rare_lines(LOG_TOKEN_BUDGET - count_tokens(overview))
+        response = get_log_analyst_chain().invoke({
+            "logs": f"{overview}\n\nNo detector matched any line. The rarest lines, with their counts:\n{rare}"})
+        response.summary = f"{RARE_LINES_ONLY} {response.summary}"
+        return response
+    second = next(batches, None)
+    if second is None:
+        return get_log_analyst_chain().invoke({"logs": f"{digest.overview()}\n\nSuspicious sections:\n{first}"})
+
+    analyses = []
+    for batch in (first, second, *batches):
+        analyses.append(get_log_analyst_chain().invoke({"logs": f"Suspicious sections:\n{batch}"}))
+    # The reduce prompt stays within one batch's budget however long the summaries are
+    summary_chars = LOG_TOKEN_BUDGET * 3 // len(analyses)
+    combined = get_log_reduce_chain().invoke({
+        "overview": digest.overview(),
+        "analyses": "\n\n".join(f"{i + 1}. anomaly={a.contains_anomaly}: {a.summary[:summary_chars]}"
+                                 for i, a in enumerate(analyses)),
+    })
+    # A batch that found an anomaly cannot be overruled by the summary step
+    combined.contains_anomaly = combined.contains_anomaly or any(a.contains_anomaly for a in analyses)
+    return combined
 
 def run_log_analyst(state: GraphState) -> dict: # <-- Change return type to dict
     """Executes the log analysis agent."""
@@ -42,10 +114,17 @@ def run_log_analyst(state: GraphState) -> dict: # <-- Change return type to dict
     logs = state.get("logs", "")
     if not logs:
         return {} # Return an empty dictionary if there's nothing to do
-        
-    response = log_analyst_chain.invoke({"logs": logs})
 
-    trace_message = f"Log Analyst conclusion: Anomaly detected: {response.contains_anomaly}."
+    if fits_budget(logs):
+        response = get_log_analyst_chain().invoke({"logs": logs})
+    else:
+        response = analyze_large_logs(logs)
+
+    if response.summary.startswith(RARE_LINES_ONLY):
+        trace_message = trace_entry("Log Analyst", f"Anomaly detected: {response.contains_anomaly} "
+                                                   "(no detector hits, the rarest lines were reviewed).")
+    else:
+        trace_message = trace_entry("Log Analyst", f"Anomaly detected: {response.contains_anomaly}.")
 
     # Return ONLY the fields that have been updated
     return {
@@ -1,7 +1,7 @@
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from typing import Literal
+from functools import lru_cache
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -11,10 +11,13 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from app.state import GraphState
+from app.resources import get_llm
+from app.trace import trace_entry
+from app.ruleset import get_ruleset
+from app.agents.threat_analyst import is_ip_address
+from langgraph.config import get_config
 
-# --- 1. Define the LLM and the Output Structure ---
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
-
+# --- 1. Define the Output Structure ---
 class FirewallRule(BaseModel):
     """Represents a single firewall rule to be generated."""
     name: str = Field(description="A descriptive name for the rule, e.g., 'Block-Malicious-IP-123.45.67.89'.")
@@ -30,26 +33,52 @@ The investigation has confirmed that the following indicator is malicious:
 Indicator: {indicator}
 
 Summary of findings:
-{investigation_trace}
+{findings}
 
 Based on this, generate a BLOCK rule for the malicious IP address. The rule should apply to any protocol.
 You must respond in the format of the `FirewallRule` tool."""
 )
 
 # --- 3. Create the Policy Agent Chain ---
-policy_agent_chain = policy_agent_prompt | llm.with_structured_output(FirewallRule)
+@lru_cache(maxsize=None)
+def get_policy_agent_chain():
+    return policy_agent_prompt | get_llm().with_structured_output(FirewallRule)
+
+# --- 4. Deterministic Rule for IP Indicators ---
+# Every field of the rule the prompt asks for is fixed or taken from the indicator,
+# so for an IP address it is built directly instead of by the LLM.
+def build_firewall_rule(ip_address: str) -> FirewallRule:
+    ip_address = ip_address.strip()
+    return FirewallRule(name=f"Block-Malicious-IP-{ip_address}", action="BLOCK", source_ip=ip_address, protocol="ANY")
+
+def _investigation_id():
+    try:
+        return get_config()["configurable"].get("thread_id")
+    except (RuntimeError, KeyError):
+        return None
 
-# --- 4. Define the Node for the Graph ---
+# --- 5. Define the Node for the Graph ---
 def run_policy_agent(state: GraphState) -> dict: # <-- Change return type to dict
     """Executes the policy agent to generate a firewall rule."""
     print("---GENERATING SECURITY POLICY---")
+
+    if is_ip_address(state["indicator"]):
+        response = build_firewall_rule(state["indicator"])
+    else:
+        # Only the findings that flagged the threat are needed here, not the whole trace
+        intel, log_summary = state.get("intel"), state.get("log_summary")
+        findings = [finding.summary for finding, flagged in ((intel, intel and intel.is_malicious),
+                                                             (log_summary, log_summary and log_summary.contains_anomaly)) if flagged]
+        response = get_policy_agent_chain().invoke({
+            "indicator": state["indicator"],
+            "findings": "\n".join(findings),
+        })
+
+    # Collected across investigations and exported in bulk (see app/ruleset.py)
+    if is_ip_address(response.source_ip):
+        get_ruleset().add(response, _investigation_id())
     
-    response = policy_agent_chain.invoke({
-        "indicator": state["indicator"],
-        "investigation_trace": "\n".join(state["investigation_trace"])
-    })
-    
-    trace_message = f"Policy Agent generated rule: {response.name}"
+    trace_message = trace_entry("Policy Agent", f"Generated rule: {response.name}")
     
     # Return ONLY the fields that have been updated
     return {
@@ -5,14 +5,14 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspa
 from dotenv import load_dotenv
 load_dotenv()
 
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
-from typing import Literal
+from typing import Literal, Optional
+from functools import lru_cache
 
-# --- 1. Define the LLM ---
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
+from app.resources import get_llm
 
+# --- 1. Define the Output Structure ---
 class Route(BaseModel):
     next: Literal["Threat_Analyst", "Log_Analyst", "Consultant_Agent", "Policy_Agent", "end_investigation"]
 
@@ -46,4 +46,32 @@ What is the next step?"""
 )
 
 # --- 3. Create the Supervisor Chain ---
-supervisor_chain = supervisor_prompt | llm.with_structured_output(Route)
\ No newline at end of file
+# Built on first use so importing this module does not create an LLM client
+@lru_cache(maxsize=None)
+def get_supervisor_chain():
+    return supervisor_prompt | get_llm().with_structured_output(Route)
+
+# --- 4. Deterministic Routing Table ---
+# The five rules above are fully determined by the state flags, so we apply them
+# in plain Python and only fall back to the supervisor chain for combinations the
+# rules leave ambiguous (e.g. a policy exists but no playbook was consulted).
+def route_by_rules(intel_available: bool, log_summary_available: bool, threat_detected: bool,
+                   playbook_consulted: bool, policy_generated: bool) -> Optional[str]:
+    """
+    Applies the supervisor's decision rules without an LLM call.
+    Returns the next agent, or None if the state is not covered by the rules.
+    """
+    if not intel_available:
+        # Rule 1, unless a threat is already known and rules 3-5 would compete with it
+        return None if threat_detected else "Threat_Analyst"
+
+    if not threat_detected:
+        # Rule 2, otherwise rule 5 (all analyses complete, no threat found)
+        return "Log_Analyst" if not log_summary_available else "end_investigation"
+
+    if not playbook_consulted:
+        # Rule 3 - but rule 5 also matches if a policy somehow exists already
+        return None if policy_generated else "Consultant_Agent"
+
+    # Rule 4, or rule 5 once the policy has been generated
+    return "end_investigation" if policy_generated else "Policy_Agent"
@@ -1,7 +1,7 @@
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from langchain.agents import AgentExecutor, create_tool_calling_agent
+from functools import lru_cache
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -11,17 +11,20 @@ import os
 # Add the parent directory to Python path to enable imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from app.tools import virustotal_ip_lookup
+from app.tools import virustotal_ip_lookup, lookup_indicators
+from app.ioc import classify, extract_iocs
 from app.state import GraphState
+from app.resources import get_llm
+from app.trace import trace_entry
+import ipaddress
 import json
 
-# --- 1. Define the LLM and the Output Structure ---
-llm = ChatGroq(model="llama-3.3-70b-versatile", temperature=0)
-
+# --- 1. Define the Output Structure ---
 class ThreatIntel(BaseModel):
     """Structured output for the Threat Intelligence Analyst agent."""
     summary: str = Field(description="A concise summary of the threat intelligence findings, including reputation and analysis stats.")
     is_malicious: bool = Field(description="The final verdict on whether the indicator is malicious, based on the analysis.")
+    lookup_failed: bool = Field(default=False, description="True if the threat intelligence lookup failed, so there is no verdict.")
 
 # --- 2. Create the "Tool User" Agent ---
 # This agent's only job is to call the VirusTotal tool.
@@ -32,8 +35,11 @@ tool_user_prompt = ChatPromptTemplate.from_messages(
         ("placeholder", "{agent_scratchpad}"),
     ]
 )
-tool_user_agent = create_tool_calling_agent(llm, [virustotal_ip_lookup], tool_user_prompt)
-tool_user_executor = AgentExecutor(agent=tool_user_agent, tools=[virustotal_ip_lookup], verbose=True)
+@lru_cache(maxsize=None)
+def get_tool_user_executor():
+    # Only picks the tool call, so it may run on the small model when the LLM budget is tight
+    tool_user_agent = create_tool_calling_agent(get_llm(low_stakes=True), [virustotal_ip_lookup], tool_user_prompt)
+    return AgentExecutor(agent=tool_user_agent, tools=[virustotal_ip_lookup], verbose=True)
 
 
 # --- 3. Create the "Formatter" Chain ---
@@ -56,23 +62,107 @@ formatter_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 # We cleanly apply structured output here, with no tools to cause conflicts.
-formatter_chain = formatter_prompt | llm.with_structured_output(ThreatIntel)
+@lru_cache(maxsize=None)
+def get_formatter_chain():
+    return formatter_prompt | get_llm().with_structured_output(ThreatIntel)
+
+# In direct mode only the wording of the summary comes from the LLM
+@lru_cache(maxsize=None)
+def get_prose_chain():
+    return formatter_prompt | get_llm(low_stakes=True).with_structured_output(ThreatIntel)
+
+
+# --- 4. Deterministic Verdict for Direct Lookups ---
+def is_ip_address(indicator: str) -> bool:
+    """Returns True if the indicator is a valid IPv4 or IPv6 address."""
+    try:
+        ipaddress.ip_address(indicator.strip())
+        return True
+    except ValueError:
+        return False
+
+def assess_report(raw_data: str) -> ThreatIntel:
+    """
+    Builds the ThreatIntel verdict straight from a VirusTotal lookup's output.
+    Any malicious or suspicious detection, or a negative reputation, is a threat.
+    (A reputation of exactly 0 is VirusTotal's default for unscored indicators.)
+    A failed lookup is not a benign verdict: it is flagged `lookup_failed`.
+    """
+    try:
+        report = json.loads(raw_data)
+    except (TypeError, ValueError):
+        # The tool returns a plain error string when the lookup fails
+        return ThreatIntel(summary=f"Threat intelligence lookup failed: {raw_data}", is_malicious=False,
+                           lookup_failed=True)
+
+    stats = report.get("analysis_stats", {})
+    reputation = report.get("reputation")
+    is_malicious = stats.get("malicious", 0) > 0 or stats.get("suspicious", 0) > 0 or \
+                   (reputation is not None and reputation < 0)
+
+    summary = (
+        f"VirusTotal reports {stats.get('malicious', 0)} malicious, {stats.get('suspicious', 0)} suspicious, "
+        f"{stats.get('harmless', 0)} harmless and {stats.get('undetected', 0)} undetected verdicts "
+        f"for {report.get('indicator', report.get('ip_address'))} (reputation: {reputation})."
+    )
+    return ThreatIntel(summary=summary, is_malicious=is_malicious)
+
+
+# --- 5. Define the Node that Orchestrates the Two Steps ---
+def collect_iocs(state: GraphState, indicator: str, indicator_type: str) -> list:
+    """The investigated indicator first, then every other IOC in the alert and logs."""
+    iocs = [{"type": indicator_type, "value": indicator}] if indicator_type else []
+    if (state.get("options") or {}).get("ioc_lookups", True):
+        alert = state.get("alert") or {}
+        iocs += [ioc for ioc in extract_iocs(str(alert.get("details") or ""), state.get("logs") or "")
+                 if ioc["value"] != indicator]
+    return iocs
 
 
-# --- 4. Define the Node that Orchestrates the Two Steps ---
 def run_threat_analyst(state: GraphState) -> dict: # <-- Change return type to dict
     """Executes the threat intelligence analysis."""
     print("---RUNNING THREAT ANALYST---")
-    indicator = state["indicator"]
-    
-    tool_response = tool_user_executor.invoke({"input": indicator})
-    raw_data_str = tool_response["output"]
-    structured_output = formatter_chain.invoke({"indicator":indicator, "raw_data": raw_data_str})
-    
-    trace_message = f"Threat Analyst conclusion: The indicator '{indicator}' is {'malicious' if structured_output.is_malicious else 'benign'}."
-    
+    indicator = state["indicator"].strip()
+    options = state.get("options") or {}
+    indicator_type = classify(indicator)
+    if indicator_type in ("domain", "hash"):
+        indicator = indicator.lower()
+
+    # The investigated indicator is looked up on its own first, so it never queues
+    # behind secondary IOCs. Those are then looked up at once, on a best-effort basis.
+    iocs = collect_iocs(state, indicator, indicator_type)
+    reports = lookup_indicators([ioc for ioc in iocs if ioc["value"] == indicator])
+    reports.update(lookup_indicators([ioc for ioc in iocs if ioc["value"] != indicator], best_effort=True))
+    ioc_intel = {value: assess_report(raw) for value, raw in reports.items()}
+
+    if indicator_type:
+        # Direct mode: no agent needed to decide to call the one tool we have
+        raw_data_str = reports[indicator]
+        structured_output = ioc_intel[indicator]
+        if options.get("intel_prose") and not structured_output.lookup_failed:
+            # Only the wording comes from the LLM, the verdict stays deterministic
+            prose = get_prose_chain().invoke({"indicator": indicator, "raw_data": raw_data_str})
+            structured_output = ThreatIntel(summary=prose.summary, is_malicious=structured_output.is_malicious)
+    else:
+        tool_response = get_tool_user_executor().invoke({"input": indicator})
+        raw_data_str = tool_response["output"]
+        structured_output = get_formatter_chain().invoke({"indicator":indicator, "raw_data": raw_data_str})
+
+    if structured_output.lookup_failed:
+        message = f"The indicator '{indicator}' could not be assessed, it needs analyst review. {structured_output.summary}"
+    else:
+        message = f"The indicator '{indicator}' is {'malicious' if structured_output.is_malicious else 'benign'}."
+    others = [value for value, intel in ioc_intel.items() if value != indicator and intel.is_malicious]
+    if others:
+        message += f" Other malicious indicators in the alert: {', '.join(others)}."
+    unchecked = [value for value, intel in ioc_intel.items() if value != indicator and intel.lookup_failed]
+    if unchecked:
+        message += f" {len(unchecked)} other indicator(s) could not be looked up."
+    trace_message = trace_entry("Threat Analyst", message)
+
     # Return ONLY the fields that have been updated
     return {
         "intel": structured_output,
+        "ioc_intel": ioc_intel,
         "investigation_trace": [trace_message] # Return the new trace message as a list
-    }
\ No newline at end of file
+    }
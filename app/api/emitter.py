@@ -0,0 +1,172 @@
+import os
+import time
+import asyncio
+from collections import deque
+
+import orjson
+
+from app.telemetry import EMIT_SECONDS, EMITTED_EVENTS
+
+# At most this many events wait per client. When a slow client's queue is full,
+# a new graph_event is merged into the investigation's last pending one.
+EMIT_QUEUE_SIZE = int(os.getenv("EMIT_QUEUE_SIZE", "32"))
+# Stop handing events to the transport while this many packets are still unsent
+EMIT_TRANSPORT_BACKLOG = int(os.getenv("EMIT_TRANSPORT_BACKLOG", "16"))
+# Events that cannot be coalesced (the first one of an investigation, graph_finished,
+# graph_error) still queue past EMIT_QUEUE_SIZE. A client with this many pending
+# events is disconnected instead; it can follow its investigations again on reconnect.
+EMIT_QUEUE_LIMIT = int(os.getenv("EMIT_QUEUE_LIMIT", str(EMIT_QUEUE_SIZE * 4)))
+
+
+class _Pending:
+    __slots__ = ("event", "payload", "investigation_id", "coalescable", "enqueued_at")
+
+    def __init__(self, event, payload, investigation_id, coalescable):
+        self.event = event
+        self.payload = payload
+        self.investigation_id = investigation_id
+        self.coalescable = coalescable
+        self.enqueued_at = time.perf_counter()
+
+
+# Fields that the graph accumulates (see GraphState) rather than overwrites
+APPEND_FIELDS = {"investigation_trace"}
+
+
+def merge_updates(older: dict, newer: dict) -> dict:
+    """
+    Combines two per-node update events into one, the way the graph applies them:
+    accumulated fields are concatenated, everything else is overwritten.
+    """
+    merged = dict(older)
+    for key, value in newer.items():
+        previous = merged.get(key)
+        if isinstance(previous, dict) and isinstance(value, dict) and key != "telemetry":
+            combined = dict(previous)
+            for field, field_value in value.items():
+                if field in APPEND_FIELDS and isinstance(combined.get(field), list):
+                    combined[field] = combined[field] + list(field_value or [])
+                else:
+                    combined[field] = field_value
+            merged[key] = combined
+        else:
+            merged[key] = value
+    return merged
+
+
+class EventEmitter:
+    """
+    Sends events to each Socket.IO client from a bounded per-client queue, drained
+    by one sender task per client. A client that does not keep up applies
+    backpressure: its intermediate graph_events are coalesced instead of piling
+    up, while control events (graph_finished, graph_error) are always delivered.
+    A client whose queue still reaches `max_queue` is disconnected.
+    """
+
+    def __init__(self, sio, max_pending: int = EMIT_QUEUE_SIZE, max_backlog: int = EMIT_TRANSPORT_BACKLOG,
+                 max_queue: int = EMIT_QUEUE_LIMIT):
+        self.sio = sio
+        self.max_pending = max_pending
+        self.max_backlog = max_backlog
+        self.max_queue = max(max_queue, max_pending)
+        self._queues = {}
+        self._wakeups = {}
+        self._senders = {}
+        self._overflowed = {}  # sid -> task disconnecting it
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._queues),
+            "pending": sum(len(q) for q in self._queues.values()),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "disconnected": self.disconnected,
+        }
+
+    def emit(self, sid, event: str, payload: bytes, investigation_id: str = None, coalescable: bool = False):
+        """
+        Queues an already serialized payload for `sid`. Must be called on the event
+        loop; never blocks.
+        """
+        if sid in self._overflowed:
+            # Being disconnected for falling too far behind
+            self.dropped += 1
+            EMITTED_EVENTS.inc(outcome="dropped")
+            return
+        queue = self._queues.get(sid)
+        if queue is None:
+            if not self.sio.manager.is_connected(sid, "/"):
+                # The client went away while its investigation kept running
+                self.dropped += 1
+                EMITTED_EVENTS.inc(outcome="dropped")
+                return
+            queue = self._queues[sid] = deque()
+            self._wakeups[sid] = asyncio.Event()
+            self._senders[sid] = asyncio.ensure_future(self._send_loop(sid))
+
+        if coalescable and len(queue) >= self.max_pending and self._coalesce(queue, payload, investigation_id):
+            return
+        if len(queue) >= self.max_queue:
+            self._overflow(sid)
+            return
+        queue.append(_Pending(event, payload, investigation_id, coalescable))
+        self._wakeups[sid].set()
+
+    def _coalesce(self, queue: deque, payload: bytes, investigation_id: str) -> bool:
+        # Only the investigation's newest pending event may absorb it, to keep order
+        for pending in reversed(queue):
+            if pending.investigation_id != investigation_id:
+                continue
+            if not pending.coalescable:
+                return False
+            pending.payload = orjson.dumps(merge_updates(orjson.loads(pending.payload), orjson.loads(payload)))
+            self.coalesced += 1
+            EMITTED_EVENTS.inc(outcome="coalesced")
+            return True
+        return False
+
+    def _overflow(self, sid):
+        """Disconnects a client that is too far behind, rather than buffering for it without bound."""
+        self.dropped += 1
+        self.disconnected += 1
+        EMITTED_EVENTS.inc(outcome="dropped")
+        self._overflowed[sid] = asyncio.ensure_future(self.sio.disconnect(sid))
+
+    def _transport_backlog(self, sid) -> int:
+        """Packets queued in the Engine.IO socket that have not been written to the client yet."""
+        eio_sid = self.sio.manager.eio_sid_from_sid(sid, "/")
+        socket = self.sio.eio.sockets.get(eio_sid) if eio_sid else None
+        return socket.queue.qsize() if socket is not None else 0
+
+    async def _send_loop(self, sid):
+        queue, wakeup = self._queues[sid], self._wakeups[sid]
+        while True:
+            if not queue:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            while self._transport_backlog(sid) >= self.max_backlog:
+                await asyncio.sleep(0.01)
+            pending = queue.popleft()
+            # The client is connected here, so skip the scale-out pub/sub channel
+            await self.sio.emit(pending.event, data=orjson.Fragment(pending.payload), to=sid, ignore_queue=True)
+            self.sent += 1
+            EMITTED_EVENTS.inc(outcome="sent")
+            EMIT_SECONDS.observe(time.perf_counter() - pending.enqueued_at, event=pending.event)
+
+    def close(self, sid):
+        """Forgets a disconnected client, dropping whatever it had not received yet."""
+        queue = self._queues.pop(sid, None)
+        self._wakeups.pop(sid, None)
+        self._overflowed.pop(sid, None)
+        sender = self._senders.pop(sid, None)
+        if sender is not None:
+            sender.cancel()
+        if queue:
+            self.dropped += len(queue)
+            EMITTED_EVENTS.inc(len(queue), outcome="dropped")
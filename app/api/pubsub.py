@@ -0,0 +1,114 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+
+import orjson
+from socketio.async_pubsub_manager import AsyncPubSubManager
+
+from app.serialization import dumps
+
+# Messages are read by every API process within this interval, and kept for
+# PUBSUB_RETENTION_SECONDS so a briefly stalled process does not miss any.
+PUBSUB_POLL_INTERVAL = float(os.getenv("PUBSUB_POLL_INTERVAL", "0.02"))
+PUBSUB_RETENTION_SECONDS = float(os.getenv("PUBSUB_RETENTION_SECONDS", "60"))
+_PRUNE_EVERY = 500
+
+
+class SQLitePubSubManager(AsyncPubSubManager):
+    """
+    A Socket.IO client manager whose pub/sub channel is a table in a local SQLite
+    file, so any process on the machine (API or graph worker) can emit to a client
+    connected to another one.
+
+    Payloads that are already serialized (bytes from app.serialization.dumps) are
+    passed through untouched. With a `deliver(sid, message)` hook, emits of such
+    payloads to a room are handed to it for each local member instead of being
+    sent directly, so the server can route them through its EventEmitter.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, channel: str = "socketio", write_only: bool = False, deliver=None, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.deliver = deliver
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS socketio_messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel TEXT NOT NULL,
+                    message BLOB NOT NULL,
+                    data BLOB,
+                    created_at REAL NOT NULL
+                )"""
+            )
+        self._published = 0
+
+    def _write(self, message: bytes, data: bytes):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO socketio_messages (channel, message, data, created_at) VALUES (?, ?, ?, ?)",
+                (self.channel, message, data, now),
+            )
+            self._published += 1
+            if self._published % _PRUNE_EVERY == 0:
+                self._conn.execute("DELETE FROM socketio_messages WHERE created_at < ?",
+                                   (now - PUBSUB_RETENTION_SECONDS,))
+
+    def _read(self, after_id: int) -> list:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, message, data FROM socketio_messages WHERE id > ? AND channel = ? ORDER BY id LIMIT 500",
+                (after_id, self.channel),
+            ).fetchall()
+
+    def _last_id(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM socketio_messages").fetchone()[0]
+
+    async def _publish(self, data: dict):
+        # The event payload travels as raw JSON next to the message
+        message = {k: v for k, v in data.items() if k != "data"}
+        payload = data.get("data")
+        if "data" in data and not isinstance(payload, (bytes, bytearray)):
+            payload = dumps(payload)
+        await asyncio.to_thread(self._write, orjson.dumps(message), bytes(payload) if payload is not None else None)
+
+    async def _listen(self):
+        last_id = await asyncio.to_thread(self._last_id)
+        while True:
+            rows = await asyncio.to_thread(self._read, last_id)
+            for row_id, message, data in rows:
+                last_id = row_id
+                message = orjson.loads(message)
+                if data is not None:
+                    message["data"] = bytes(data)
+                yield message
+            if not rows:
+                await asyncio.sleep(PUBSUB_POLL_INTERVAL)
+
+    async def _handle_emit(self, message: dict):
+        data = message.get("data")
+        if isinstance(data, (bytes, bytearray)):
+            if self.deliver is not None and message.get("room") and message.get("callback") is None:
+                for sid, _ in self.get_participants(message.get("namespace") or "/", message["room"]):
+                    self.deliver(sid, message)
+                return
+            message = {**message, "data": orjson.Fragment(data)}
+        await super()._handle_emit(message)
+
+    async def publish_event(self, room: str, event: str, payload: bytes, seq: int = None):
+        """
+        Emits a serialized payload to a room from any process (e.g. a graph worker).
+        `seq` numbers an investigation's events, so a client that caught up from the
+        store can skip the ones it already has.
+        """
+        await self._publish({
+            "method": "emit", "event": event, "data": payload, "namespace": "/", "room": room,
+            "skip_sid": None, "callback": None, "host_id": self.host_id, "seq": seq,
+        })
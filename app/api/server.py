@@ -2,14 +2,43 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
+import time
+_import_started = time.perf_counter()
+
 import socketio
 import asyncio
-from fastapi import FastAPI
+import json
+from typing import List
+from fastapi import FastAPI, Body, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
 # Import our compiled graph from main.py
-from app.main import graph
+from app.main import get_graph, batch_graph
+from app.executor import InvestigationExecutor
+from app.tools import reputation_cache
+from app.agents.consultant_agent import answer_cache
+from app.state import make_initial_state
+from app.serialization import OrjsonModule, convert_pydantic_to_dict, dumps
+from app.batch import run_batch
+from app.investigations import (
+    CHECKPOINT_DB, INVESTIGATION_RETENTION_DAYS, InflightRegistry, InvestigationStore, alert_fingerprint, investigation_config, new_investigation_id,
+)
+from app.telemetry import registry, ALERTS
+from app.api.emitter import EventEmitter
+from app.api.pubsub import SQLitePubSubManager
+from app.job_queue import JOB_QUEUE_DB, JobQueue
+from app.runner import run_investigation
+from app.ruleset import get_ruleset
+from app.llm_gateway import gateway as llm_gateway, priority_level
+from app import resources
+
+# Time to import the app and compile the graph, before any model/index is loaded
+COLD_START_SECONDS = round(time.perf_counter() - _import_started, 3)
+print(f"Cold start (imports + graph compile) took {COLD_START_SECONDS}s")
+
+# Set WARM_UP_ON_STARTUP=0 to skip loading the models/index before serving
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "1") == "1"
 
 # --- FastAPI and CORS Setup ---
 fast_api_app = FastAPI()
@@ -19,40 +48,338 @@ fast_api_app.add_middleware(
     allow_methods=["*"], allow_headers=["*"],
 )
 
+# --- Scale-Out Mode ---
+# With JOB_QUEUE_DB set (see app/job_queue.py), investigations are queued for the
+# `python -m app.worker` processes instead of running here, and their events come
+# back through the SQLite pub/sub channel to whichever API process holds the client.
+job_queue = JobQueue(JOB_QUEUE_DB) if JOB_QUEUE_DB else None
+# Per client, the queued investigations it follows and the last event it was sent
+# from the record, so the live copies of those events are skipped. While the
+# record is being read, the live events are held in a list instead.
+followers = {}
+
+def deliver_event(sid, message: dict):
+    """Hands an event published by a worker to a local client following the investigation."""
+    investigation_id, event, seq = message["room"], message["event"], message.get("seq")
+    following = followers.get(sid, {})
+    if investigation_id not in following:
+        return
+    if isinstance(following[investigation_id], list):
+        following[investigation_id].append(message)
+        return
+    if seq is not None and seq <= following[investigation_id]:
+        return
+    if event != 'graph_event':
+        del following[investigation_id]
+    emitter.emit(sid, event, message["data"], investigation_id, coalescable=event == 'graph_event')
+
 # --- Socket.IO Server Setup ---
-sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*")
+client_manager = SQLitePubSubManager(JOB_QUEUE_DB, deliver=deliver_event) if job_queue is not None else None
+sio = socketio.AsyncServer(async_mode="asgi", cors_allowed_origins="*", json=OrjsonModule,
+                           client_manager=client_manager)
 socket_app = socketio.ASGIApp(sio, other_asgi_app=fast_api_app)
 
-# --- Helper Function for Serialization ---
-def convert_pydantic_to_dict(obj):
-    """
-    Recursively converts Pydantic models in an object to dictionaries.
-    """
-    if isinstance(obj, BaseModel):
-        return obj.model_dump()
-    if isinstance(obj, dict):
-        return {k: convert_pydantic_to_dict(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [convert_pydantic_to_dict(i) for i in obj]
-    return obj
+# Investigation events go through per-client bounded queues (see app/api/emitter.py)
+emitter = EventEmitter(sio)
+
+# Long-running startup tasks, referenced here so they are not garbage collected
+background_tasks = set()
+
+def start_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+@fast_api_app.on_event("startup")
+async def warm_up_resources():
+    """Loads the shared LLM client, embedding model and FAISS index before serving."""
+    if WARM_UP_ON_STARTUP:
+        started = time.perf_counter()
+        await asyncio.to_thread(resources.warm_up)
+        print(f"Warm-up took {round(time.perf_counter() - started, 3)}s")
+
+# --- Playbook Index Hot Reload ---
+# scripts/ingest.py swaps a new vector_store/ into place; the server notices (unless
+# INDEX_WATCH=0) and swaps the new index in without a restart. POST
+# /admin/reload-index does the same on demand.
+INDEX_WATCH = os.getenv("INDEX_WATCH", "1") == "1"
+# Changes are acted on once none came for this many milliseconds, so the renames
+# of one ingest run trigger a single reload
+INDEX_WATCH_SETTLE_MS = int(os.getenv("INDEX_WATCH_SETTLE_MS", "500"))
+
+async def reload_index(force: bool = False) -> dict:
+    result = await asyncio.to_thread(resources.reload_vector_store, force)
+    if result["reloaded"]:
+        print(f"Playbook index version {result['version']} is now serving (loaded in {result['load_s']}s)")
+    return result
+
+async def watch_index():
+    from watchfiles import awatch
+    # ingest.py repoints the DB_PATH symlink, so watch its parent
+    name = os.path.basename(resources.DB_PATH)
+    async for _ in awatch(os.path.dirname(resources.DB_PATH), recursive=False,
+                          watch_filter=lambda change, path: os.path.basename(path) == name,
+                          step=INDEX_WATCH_SETTLE_MS, debounce=max(INDEX_WATCH_SETTLE_MS * 10, 1600)):
+        try:
+            await reload_index()
+        except Exception as e:
+            print(f"Could not reload the playbook index, still serving version {resources._index_version}: {e}")
+
+@fast_api_app.on_event("startup")
+async def start_index_watch():
+    if INDEX_WATCH:
+        start_background(watch_index())
+
+# --- Firewall Rule Set Export ---
+# The collected rules are written to RULESET_EXPORT_DIR (iptables, ip6tables and
+# nftables formats) every RULESET_EXPORT_INTERVAL seconds, when they changed.
+RULESET_EXPORT_DIR = os.getenv("RULESET_EXPORT_DIR", "")
+RULESET_EXPORT_INTERVAL = float(os.getenv("RULESET_EXPORT_INTERVAL", "60"))
+
+async def export_ruleset_periodically():
+    exported_version = None
+    while True:
+        ruleset = get_ruleset()
+        # Read from RULESET_DB, so rules added by the worker processes count too
+        version = await asyncio.to_thread(lambda: ruleset.version)
+        if version != exported_version:
+            exported_version = version
+            paths = await asyncio.to_thread(ruleset.export, RULESET_EXPORT_DIR)
+            print(f"Exported firewall rule set version {exported_version} to {', '.join(paths)}")
+        await asyncio.sleep(RULESET_EXPORT_INTERVAL)
+
+@fast_api_app.on_event("startup")
+async def start_ruleset_export():
+    if RULESET_EXPORT_DIR:
+        start_background(export_ruleset_periodically())
+
+# --- Bounded Worker Pool for Graph Execution ---
+# The graph is synchronous, so it runs on worker threads and only the emits
+# happen on the event loop. Tune with MAX_CONCURRENT_INVESTIGATIONS. In scale-out
+# mode only batches run here.
+executor = InvestigationExecutor()
+
+# --- Investigation Records ---
+# An alert with the same fingerprint as a running investigation follows that one
+# instead of starting another, and one matching an investigation completed within
+# DEDUP_WINDOW_SECONDS gets its result replayed. REPLAY_COMPLETED_INVESTIGATIONS=0
+# or options.replay=false on the request turns this off.
+store = InvestigationStore(CHECKPOINT_DB)
+REPLAY_COMPLETED_INVESTIGATIONS = os.getenv("REPLAY_COMPLETED_INVESTIGATIONS", "1") == "1"
+DEDUP_WINDOW_SECONDS = float(os.getenv("DEDUP_WINDOW_SECONDS", "600"))
+inflight = InflightRegistry()
+
+# Finished investigations are deleted after INVESTIGATION_RETENTION_DAYS
+async def purge_investigations_periodically():
+    while True:
+        purged = await asyncio.to_thread(store.purge, INVESTIGATION_RETENTION_DAYS * 86400)
+        if purged:
+            print(f"Deleted {purged} investigations older than {INVESTIGATION_RETENTION_DAYS} days")
+        await asyncio.sleep(3600)
+
+@fast_api_app.on_event("startup")
+async def start_investigation_purge():
+    if CHECKPOINT_DB and INVESTIGATION_RETENTION_DAYS > 0:
+        start_background(purge_investigations_periodically())
+
+# --- Metrics ---
+# Gauges are read at scrape time; counters and histograms live in app.telemetry.
+def _collect_gauges():
+    stats = executor.stats()
+    yield ("cypher_investigations_queued", "Investigations waiting for a worker slot.", {}, stats["queued"])
+    yield ("cypher_investigations_running", "Investigations currently running.", {}, stats["running"])
+    yield ("cypher_emit_queue_pending", "Events waiting to be sent to clients.", {}, emitter.stats()["pending"])
+    for cache, cache_stats in (("virustotal", reputation_cache.stats()), ("playbook_answers", answer_cache.stats())):
+        yield ("cypher_cache_entries", "Entries held by each in-memory cache.", {"cache": cache}, cache_stats["entries"])
+    yield ("cypher_alert_dedup_ratio", "Share of alerts answered by another investigation.", {}, dedup_stats()["ratio"])
+
+
+def dedup_stats() -> dict:
+    """How many alerts started, followed (subscribed) or reused (replayed) an investigation."""
+    outcomes = {outcome: int(ALERTS.value(outcome=outcome)) for outcome in ("investigated", "subscribed", "replayed")}
+    total = sum(outcomes.values())
+    return {**outcomes, "ratio": round((total - outcomes["investigated"]) / total, 4) if total else 0.0}
+
+registry.register_gauges(_collect_gauges)
 
 # --- Background Task for Graph Execution ---
-async def run_graph_streaming(sid, initial_state: dict):
+async def run_graph_streaming(sid, investigation_id: str, initial_state):
     """
     Runs the LangGraph stream in the background and emits events to the client.
+    An `initial_state` of None resumes the investigation from its last checkpoint.
     """
+    async def publish(event, payload, seq):
+        if event == 'graph_event':
+            inflight.add_event(investigation_id, payload)
+        for target in inflight.subscribers(investigation_id):
+            emitter.emit(target, event, payload, investigation_id, coalescable=event == 'graph_event')
+
+    try:
+        await run_investigation(executor, store, investigation_id, initial_state, publish)
+    finally:
+        inflight.finish(investigation_id)
+
+async def open_investigation(sid, investigation_id: str, fingerprint: str, prepare):
+    """
+    Runs `prepare` (creating or updating the investigation's record) on a thread.
+    A local investigation is registered as running first, so duplicate alerts
+    arriving meanwhile follow it instead of starting their own.
+    """
+    if job_queue is None:
+        inflight.start(investigation_id, fingerprint, sid)
     try:
-        for event in graph.stream(initial_state, {"recursion_limit": 25}):
-            # Convert the event to be JSON serializable BEFORE emitting
-            serializable_event = convert_pydantic_to_dict(event)
-            await sio.emit('graph_event', data=serializable_event, to=sid)
-            await asyncio.sleep(0.1)
-        
-        await sio.emit('graph_finished', to=sid)
+        await asyncio.to_thread(prepare)
+    except BaseException:
+        inflight.finish(investigation_id)
+        raise
+
+async def start_investigation(sid, investigation_id: str, initial_state, fingerprint: str):
+    """Runs the investigation here, or queues it for a worker in scale-out mode."""
+    if job_queue is None:
+        sio.start_background_task(run_graph_streaming, sid, investigation_id, initial_state)
+        return
+    await follow_queued(sid, investigation_id)
+    priority = ((initial_state or {}).get("options") or {}).get("priority")
+    await asyncio.to_thread(job_queue.put, investigation_id, initial_state, fingerprint, priority_level(priority))
 
+async def follow_queued(sid, investigation_id: str, catch_up: bool = False) -> str:
+    """
+    Makes `sid` follow a queued investigation and returns its status. With
+    `catch_up`, it is sent the recorded events so far before the live ones from
+    the worker; the live events that arrive while the record is read are held
+    back and then sent if the record did not have them, so none is missed or
+    sent twice.
+    """
+    await sio.enter_room(sid, investigation_id)
+    following = followers.setdefault(sid, {})
+    if not catch_up:
+        following[investigation_id] = 0
+        return "running"
+    following[investigation_id] = held = []
+    record = await asyncio.to_thread(store.get, investigation_id)
+    for event in record["events"]:
+        emitter.emit(sid, 'graph_event', dumps(event), investigation_id, coalescable=True)
+    if record["status"] != "running":
+        # Finished before the client joined
+        following.pop(investigation_id, None)
+        await sio.leave_room(sid, investigation_id)
+        return record["status"]
+    following[investigation_id] = len(record["events"])
+    for message in held:
+        deliver_event(sid, message)
+    return "running"
+
+async def replay_investigation(sid, record: dict):
+    """Re-emits the recorded events of a completed investigation."""
+    for event in record["events"]:
+        emitter.emit(sid, 'graph_event', dumps(event), record["id"], coalescable=True)
+    emitter.emit(sid, 'graph_finished', dumps({'investigation_id': record["id"]}), record["id"])
+
+async def find_running(fingerprint: str) -> str:
+    """The ID of the running (or queued) investigation of this alert, or None."""
+    if job_queue is None:
+        return inflight.find(fingerprint)
+    return await asyncio.to_thread(job_queue.find_active, fingerprint)
+
+# --- HTTP Endpoints ---
+@fast_api_app.get("/investigations/stats")
+async def investigation_stats():
+    """Reports the queue depth and utilisation of the investigation worker pool and the event emitter."""
+    stats = {**executor.stats(), "emitter": emitter.stats(), "llm_gateway": llm_gateway.stats(),
+             "dedup": {**dedup_stats(), **inflight.stats()}}
+    if job_queue is not None:
+        stats["job_queue"] = await asyncio.to_thread(job_queue.stats)
+    return stats
+
+@fast_api_app.get("/investigations/{investigation_id}")
+async def get_investigation(investigation_id: str):
+    """Returns the status of an investigation and its latest checkpointed state."""
+    record = await asyncio.to_thread(store.get, investigation_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Unknown investigation")
+    snapshot = await asyncio.to_thread(lambda: get_graph().get_state(investigation_config(investigation_id))) \
+        if CHECKPOINT_DB else None
+    return {
+        "id": record["id"],
+        "status": record["status"],
+        "fingerprint": record["fingerprint"],
+        "pending_nodes": list(snapshot.next) if snapshot else [],
+        "state": convert_pydantic_to_dict(snapshot.values) if snapshot else None,
+    }
+
+@fast_api_app.post("/investigations/batch")
+async def investigate_batch(alerts: List[dict] = Body(...)):
+    """
+    Investigates a batch of alerts on the shared worker pool and streams one
+    NDJSON record per alert as each finishes, then a summary record.
+    """
+    async def ndjson():
+        async for record in run_batch(batch_graph, alerts, executor):
+            yield json.dumps(record) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@fast_api_app.post("/admin/reload-index")
+async def admin_reload_index(force: bool = False):
+    """
+    Loads the playbook index from disk and swaps it in if it changed (or `force`).
+    Investigations keep running on the old index until the new one is ready.
+    """
+    try:
+        return await reload_index(force)
     except Exception as e:
-        print(f"Error during graph execution: {e}")
-        await sio.emit('graph_error', data={'error': str(e)}, to=sid)
+        raise HTTPException(status_code=500, detail=f"Reload failed, still serving version {resources._index_version}: {e}")
+
+@fast_api_app.get("/startup/timings")
+async def startup_timings():
+    """Reports the cold start time and how long each shared resource took to load."""
+    return {"cold_start_s": COLD_START_SECONDS, "resources_s": resources.load_timings}
+
+@fast_api_app.get("/ruleset")
+async def read_ruleset(format: str = Query("json", pattern="^(json|iptables|ip6tables|nftables)$")):
+    """
+    Returns the firewall rules collected across investigations, collapsed into
+    CIDR blocks: as JSON, or as iptables-restore / ip6tables-restore / nft input.
+    """
+    ruleset = get_ruleset()
+    if format == "iptables":
+        return PlainTextResponse(ruleset.to_iptables(4))
+    if format == "ip6tables":
+        return PlainTextResponse(ruleset.to_iptables(6))
+    if format == "nftables":
+        return PlainTextResponse(ruleset.to_nftables())
+    return {
+        **ruleset.stats(),
+        "entries": [
+            {"action": action, "protocol": protocol, "networks": [str(n) for n in networks]}
+            for (action, protocol), networks in ruleset.compile().items()
+        ],
+    }
+
+@fast_api_app.delete("/ruleset/{source_ip:path}")
+async def delete_rule(source_ip: str):
+    """Removes the rules for an address or network (e.g. after a false positive)."""
+    ruleset = get_ruleset()
+    try:
+        removed = ruleset.remove(source_ip)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Not an IP address or network")
+    return {"removed": removed, "version": ruleset.version}
+
+@fast_api_app.get("/cache/stats")
+async def cache_stats():
+    """Reports hit/miss/eviction counters for the lookup caches."""
+    return {
+        "virustotal": reputation_cache.stats(),
+        "embeddings": resources.embedding_cache_stats(),
+        "playbook_answers": answer_cache.stats(),
+    }
+
+@fast_api_app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: node, queue, LLM and tool latencies, token usage and cache hits."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 # --- WebSocket Event Handlers ---
 @sio.event
@@ -62,19 +389,84 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     print(f"Socket.IO client disconnected: {sid}")
+    emitter.close(sid)
+    followers.pop(sid, None)
 
 @sio.event
 async def investigate(sid, data: dict):
     """
     This event is triggered by the frontend to start an investigation.
+    Returns (as the Socket.IO ack) the ID to use with the `resume` event.
     """
     print(f"Received investigation request from {sid}: {data}")
     
-    initial_state = {
-        "alert": {"source": "manual", "details": data.get("prompt")},
-        "indicator": data.get("indicator", ""),
-        "logs": data.get("logs", ""),
-    }
-    
-    sio.start_background_task(run_graph_streaming, sid, initial_state)
-    await sio.emit('investigation_started', to=sid)
\ No newline at end of file
+    initial_state = make_initial_state(data)
+    fingerprint = alert_fingerprint(initial_state)
+
+    if REPLAY_COMPLETED_INVESTIGATIONS and initial_state["options"].get("replay", True):
+        running = await find_running(fingerprint)
+        if running is None:
+            previous = await asyncio.to_thread(store.find_completed, fingerprint, DEDUP_WINDOW_SECONDS)
+            if previous is not None:
+                ALERTS.inc(outcome="replayed")
+                await sio.emit('investigation_started', data={'investigation_id': previous["id"], 'replayed': True}, to=sid)
+                sio.start_background_task(replay_investigation, sid, previous)
+                return {"investigation_id": previous["id"], "replayed": True}
+            # The same alert may have started while the record was read
+            running = await find_running(fingerprint)
+        if running is not None:
+            ALERTS.inc(outcome="subscribed")
+            await sio.emit('investigation_started', data={'investigation_id': running, 'subscribed': True}, to=sid)
+            if job_queue is not None:
+                status = await follow_queued(sid, running, catch_up=True)
+            elif running in inflight:
+                # Catch up on the events so far, then follow the live ones. Nothing is
+                # awaited in between, so no event is missed or sent twice.
+                for payload in inflight.events(running):
+                    emitter.emit(sid, 'graph_event', payload, running, coalescable=True)
+                inflight.subscribe(running, sid)
+                status = "running"
+            else:
+                # Finished while the client was told about it
+                record = await asyncio.to_thread(store.get, running)
+                for event in record["events"]:
+                    emitter.emit(sid, 'graph_event', dumps(event), running, coalescable=True)
+                status = record["status"]
+            if status == "completed":
+                emitter.emit(sid, 'graph_finished', dumps({'investigation_id': running}), running)
+            elif status != "running":
+                emitter.emit(sid, 'graph_error', dumps({'error': 'Investigation failed', 'investigation_id': running}), running)
+            return {"investigation_id": running, "subscribed": True}
+
+    investigation_id = new_investigation_id()
+    await open_investigation(sid, investigation_id, fingerprint, lambda: store.create(investigation_id, fingerprint))
+    ALERTS.inc(outcome="investigated")
+    await sio.emit('investigation_started', data={'investigation_id': investigation_id}, to=sid)
+    await start_investigation(sid, investigation_id, initial_state, fingerprint)
+    return {"investigation_id": investigation_id}
+
+@sio.event
+async def resume(sid, data: dict):
+    """
+    Continues an interrupted investigation from its last finished node.
+    A completed investigation is replayed instead.
+    """
+    investigation_id = (data or {}).get("investigation_id")
+    record = await asyncio.to_thread(store.get, investigation_id) if investigation_id else None
+    if record is None:
+        await sio.emit('graph_error', data={'error': 'Unknown investigation', 'investigation_id': investigation_id}, to=sid)
+        return {"error": "Unknown investigation"}
+    if investigation_id in inflight or (
+            job_queue is not None and await asyncio.to_thread(job_queue.is_active, investigation_id)):
+        return {"error": "Investigation is still running", "investigation_id": investigation_id}
+
+    if record["status"] == "completed":
+        await sio.emit('investigation_started', data={'investigation_id': investigation_id, 'replayed': True}, to=sid)
+        sio.start_background_task(replay_investigation, sid, record)
+        return {"investigation_id": investigation_id, "replayed": True}
+
+    await open_investigation(sid, investigation_id, record["fingerprint"],
+                             lambda: store.set_status(investigation_id, "running"))
+    await sio.emit('investigation_started', data={'investigation_id': investigation_id, 'resumed': True}, to=sid)
+    await start_investigation(sid, investigation_id, None, record["fingerprint"])
+    return {"investigation_id": investigation_id, "resumed": True}
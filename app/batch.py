@@ -0,0 +1,127 @@
+import sys
+import os
+# Add the parent directory to Python path to enable imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import asyncio
+import json
+import math
+import time
+
+from app.state import make_initial_state
+from app.serialization import convert_pydantic_to_dict
+from app.investigations import alert_fingerprint, investigation_config, new_investigation_id
+
+
+def batch_key(alert: dict) -> str:
+    """Alerts with the same indicator, log signature and options produce the same investigation."""
+    return alert_fingerprint(make_initial_state(alert))
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+async def run_batch(graph, alerts: list, executor):
+    """
+    Investigates a batch of alerts over the executor's bounded pool.
+
+    Identical alerts are investigated once. Yields one result per alert in
+    completion order, followed by a final {"summary": ...} record with the
+    batch throughput and latency percentiles.
+    """
+    started = time.perf_counter()
+
+    groups = {}
+    for index, alert in enumerate(alerts):
+        groups.setdefault(batch_key(alert), []).append(index)
+
+    def investigate(initial_state):
+        t0 = time.perf_counter()
+        priority = initial_state["options"].get("priority")
+        final_state = graph.invoke(initial_state, investigation_config(new_investigation_id(), priority=priority))
+        return final_state, time.perf_counter() - t0
+
+    async def run_group(key, indices):
+        try:
+            initial_state = make_initial_state(alerts[indices[0]], source="batch")
+            final_state, latency = await executor.run(investigate, initial_state)
+            return key, indices, final_state, latency, None
+        except Exception as e:
+            return key, indices, None, None, e
+
+    latencies = []
+    failed = 0
+    tasks = [asyncio.ensure_future(run_group(key, indices)) for key, indices in groups.items()]
+    for next_done in asyncio.as_completed(tasks):
+        key, indices, final_state, latency, error = await next_done
+        if error is not None:
+            failed += len(indices)
+        else:
+            latencies.append(latency)
+
+        for position, index in enumerate(indices):
+            result = {
+                "index": index,
+                "id": alerts[index].get("id"),
+                "indicator": alerts[index].get("indicator", ""),
+                "deduplicated": position > 0,
+            }
+            if error is not None:
+                result.update({"status": "error", "error": str(error)})
+            else:
+                result.update({
+                    "status": "ok",
+                    "latency_ms": round(latency * 1000, 1),
+                    "result": convert_pydantic_to_dict(final_state),
+                })
+            yield result
+
+    elapsed = time.perf_counter() - started
+    yield {
+        "summary": {
+            "alerts": len(alerts),
+            "investigations": len(groups),
+            "failed": failed,
+            "elapsed_s": round(elapsed, 3),
+            "alerts_per_sec": round(len(alerts) / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 1),
+                "p95": round(percentile(latencies, 95) * 1000, 1),
+            },
+        }
+    }
+
+
+async def _main(args):
+    from app.main import batch_graph
+    from app.executor import InvestigationExecutor
+
+    alerts = [json.loads(line) for line in sys.stdin if line.strip()]
+    if args.mode:
+        for alert in alerts:
+            alert.setdefault("options", {}).setdefault("mode", args.mode)
+    executor = InvestigationExecutor(max_concurrent=args.concurrency)
+    async for record in run_batch(batch_graph, alerts, executor):
+        args.out.write(json.dumps(record) + "\n")
+        args.out.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Investigate a batch of alerts read as JSONL from stdin.")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("MAX_CONCURRENT_INVESTIGATIONS", "8")),
+                        help="Maximum number of investigations running at once.")
+    parser.add_argument("--mode", choices=["sequential", "parallel"],
+                        help="Investigation mode for alerts that do not set options.mode.")
+    args = parser.parse_args()
+
+    # The agents print progress banners; keep stdout clean for the NDJSON results
+    args.out = sys.stdout
+    sys.stdout = sys.stderr
+    asyncio.run(_main(args))
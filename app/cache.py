@@ -0,0 +1,195 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from app.telemetry import record_cache_lookup
+
+
+class SQLiteStore:
+    """
+    Optional on-disk tier for TTLCache so cached entries survive a restart.
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, path: str, table: str = "cache"):
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str):
+        """Returns (value, expires_at), or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value, expires_at: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+
+class _InflightCall:
+    """A computation in progress that other callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.value = None
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL, backed by an optional
+    SQLiteStore. Concurrent `get_or_compute` calls for the same key are coalesced
+    so only one of them does the (expensive) computation.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, store: SQLiteStore = None, name: str = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._inflight = {}  # key -> _InflightCall
+        self._lock = threading.Lock()
+        self._generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > time.time():
+                self._entries.move_to_end(key)
+                return True, entry[0]
+            del self._entries[key]
+        if self.store is not None:
+            stored = self.store.get(key)
+            if stored is not None:
+                self._put_locked(key, stored[0], stored[1])
+                return True, stored[0]
+        return False, None
+
+    def _put_locked(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _record(self, hit: bool):
+        if self.name:
+            record_cache_lookup(self.name, hit)
+
+    def get(self, key):
+        """Returns (found, value)."""
+        with self._lock:
+            found, value = self._get_locked(key)
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self._record(found)
+        return found, value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._put_locked(key, value, expires_at)
+        if self.store is not None:
+            self.store.set(key, value, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def clear_on_change(self, generation) -> bool:
+        """
+        Clears the cache if `generation` (e.g. an index version) differs from the
+        one of the previous call. The check and the clear are atomic, so two
+        threads seeing a new generation clear it once. Returns True if cleared.
+        """
+        with self._lock:
+            if generation == self._generation:
+                return False
+            self._generation = generation
+            self._entries.clear()
+            if self.store is not None:
+                self.store.clear()
+            return True
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """
+        Returns the cached value for `key`, or calls `compute()` and caches its result.
+
+        `ttl` may be a number or a callable taking the computed value and returning
+        the TTL to use for it, or None to leave that value uncached.
+        """
+        while True:
+            with self._lock:
+                found, value = self._get_locked(key)
+                if found:
+                    self.hits += 1
+                    self._record(True)
+                    return value
+                call = self._inflight.get(key)
+                if call is None:
+                    self.misses += 1
+                    call = self._inflight[key] = _InflightCall()
+                    break
+                self.coalesced += 1
+            # Someone else is computing this key; share their result
+            call.done.wait()
+            if call.ok:
+                # Counts as a hit: this call did not trigger a computation
+                self._record(True)
+                return call.value
+            # Their computation raised, so try again ourselves
+
+        self._record(False)
+        try:
+            call.value = compute()
+            call.ok = True
+            entry_ttl = ttl(call.value) if callable(ttl) else (self.ttl if ttl is None else ttl)
+            if entry_ttl is not None:
+                self.set(key, call.value, entry_ttl)
+            return call.value
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
@@ -0,0 +1,195 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.telemetry import record_cache_lookup
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings object with a disk-backed cache keyed by model + text hash.
+
+    Vectors live in a memory-mapped float32 array (`vectors.f32`), one row per
+    slot, and a small SQLite index maps each key to its slot and last-use time.
+    Once `max_entries` slots are used, the least recently used entries are evicted.
+    All misses of a call are embedded together in a single `embed_documents` call.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache_dir: str, model_name: str, max_entries: int = 50000):
+        self.embeddings = embeddings
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # Several processes may share the cache directory. Slots are allocated and
+        # written under an EXCLUSIVE lock, and readers copy vectors inside a read
+        # transaction, so a slot is never overwritten while someone reads it. That
+        # needs SQLite's default rollback journal: do not switch this file to WAL.
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False, timeout=30)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._vectors = None
+        self._layout = None
+        meta = dict(self._conn.execute("SELECT name, value FROM meta").fetchall())
+        if meta.get("capacity") not in (None, max_entries):
+            # The size cap changed, start over rather than remapping the array
+            self._reset()
+
+    # --- Storage helpers ---
+    def _vectors_path(self) -> str:
+        return os.path.join(self.cache_dir, "vectors.f32")
+
+    def _open_vectors(self, dim: int, capacity: int):
+        """Maps the array without truncating it: other processes may be using it."""
+        size = capacity * dim * np.dtype(np.float32).itemsize
+        with open(self._vectors_path(), "ab") as f:
+            if os.path.getsize(self._vectors_path()) < size:
+                f.truncate(size)
+        self._vectors = np.memmap(self._vectors_path(), dtype=np.float32, mode="r+", shape=(capacity, dim))
+        self._layout = (dim, capacity)
+
+    def _refresh(self):
+        """Follows the layout recorded in `meta`, which another process may have set or reset."""
+        meta = dict(self._conn.execute("SELECT name, value FROM meta").fetchall())
+        if "dim" not in meta:
+            self._vectors, self._layout = None, None
+        elif (meta["dim"], meta["capacity"]) != self._layout:
+            self._open_vectors(meta["dim"], meta["capacity"])
+
+    def _reset(self):
+        # The file is kept (and reused) since another process may still have it mapped
+        with self._conn:
+            self._conn.execute("BEGIN EXCLUSIVE")
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM meta")
+        self._vectors, self._layout = None, None
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{kind}\0{text}".encode()).hexdigest()
+
+    def _select(self, keys: List[str]) -> dict:
+        """Returns {key: slot} for the keys that are cached."""
+        found = {}
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.update(self._conn.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", batch
+            ).fetchall())
+        return found
+
+    def _lookup(self, keys: List[str]) -> dict:
+        """Returns {key: vector} for the keys that are cached, and refreshes their last-use time."""
+        with self._conn:
+            # Holds a shared lock while the vectors are copied, so no writer reuses their slots
+            self._conn.execute("BEGIN")
+            self._refresh()
+            found = self._select(keys)
+            result = {k: self._vectors[slot].tolist() for k, slot in found.items()}
+        if found:
+            now = time.time()
+            with self._conn:
+                self._conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+        return result
+
+    def _allocate(self, count: int) -> List[int]:
+        """Returns `count` free slots, evicting the least recently used entries if needed.
+        Must run inside the transaction that stores the new entries."""
+        capacity = self._layout[1]
+        start = self._conn.execute("SELECT COALESCE(MAX(slot), -1) + 1 FROM entries").fetchone()[0]
+        free = list(range(start, min(capacity, start + count)))
+        if len(free) < count:
+            victims = self._conn.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (count - len(free),)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+            self.evictions += len(victims)
+            free.extend(slot for _, slot in victims)
+        return free
+
+    def _store(self, keys: List[str], vectors: List[List[float]]):
+        with self._conn:
+            # Allocating, writing and indexing the slots is one transaction, which
+            # waits for other processes' readers and writers to finish
+            self._conn.execute("BEGIN EXCLUSIVE")
+            self._refresh()
+            if self._vectors is None:
+                self._conn.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                                       [("dim", len(vectors[0])), ("capacity", self.max_entries)])
+                self._open_vectors(len(vectors[0]), self.max_entries)
+
+            # Another thread or process may have stored some of these keys in the meantime
+            present = self._select(keys)
+            pending = [(k, v) for k, v in zip(keys, vectors) if k not in present]
+            # Keep at most one array's worth of this call, the rest simply is not cached
+            pending = pending[:self._layout[1]]
+            if not pending:
+                return
+            keys, vectors = [k for k, _ in pending], [v for _, v in pending]
+            slots = self._allocate(len(keys))
+            self._vectors[slots] = np.asarray(vectors, dtype=np.float32)
+            self._vectors.flush()
+            now = time.time()
+            self._conn.executemany("INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                                   [(k, s, now) for k, s in zip(keys, slots)])
+
+    def _embed(self, kind: str, texts: List[str], embed_misses) -> List[List[float]]:
+        keys = [self._key(kind, t) for t in texts]
+        with self._lock:
+            result = self._lookup(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in result:
+                missing.setdefault(key, text)
+        misses = sum(1 for k in keys if k in missing)
+        self.hits += len(keys) - misses
+        self.misses += misses
+        record_cache_lookup("embeddings", True, len(keys) - misses)
+        record_cache_lookup("embeddings", False, misses)
+
+        if missing:
+            vectors = embed_misses(list(missing.values()))
+            with self._lock:
+                self._store(list(missing.keys()), vectors)
+            result.update(zip(missing.keys(), vectors))
+        return [list(result[k]) for k in keys]
+
+    # --- Embeddings interface ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed("doc", texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed("query", [text], lambda misses: [self.embeddings.embed_query(misses[0])])[0]
+
+    def clear(self):
+        """Forgets every cached vector (in all processes sharing the directory)."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN EXCLUSIVE")
+                self._conn.execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
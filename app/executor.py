@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.telemetry import QUEUE_WAIT_SECONDS
+
+# How many investigations may run their graph at the same time. Everything above
+# this limit waits in the queue until a slot frees up.
+MAX_CONCURRENT_INVESTIGATIONS = int(os.getenv("MAX_CONCURRENT_INVESTIGATIONS", "8"))
+
+_DONE = object()
+
+
+class InvestigationExecutor:
+    """
+    Runs the synchronous LangGraph graph on a bounded pool of worker threads so the
+    blocking Groq / VirusTotal calls never stall the asyncio event loop.
+
+    Events produced in a worker thread are handed back to the loop through an
+    asyncio.Queue using `call_soon_threadsafe`, so callers can simply `async for`
+    over them and emit on the loop as before.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_INVESTIGATIONS):
+        self.max_concurrent = max_concurrent
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="investigation")
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def stats(self) -> dict:
+        """Returns the current queue depth and pool utilisation."""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    async def _acquire(self) -> float:
+        """Waits for a free slot and returns how long that took."""
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        waited = time.perf_counter() - started
+        QUEUE_WAIT_SECONDS.observe(waited)
+        return waited
+
+    def _release(self, failed: bool):
+        self.running -= 1
+        if failed:
+            self.failed += 1
+        else:
+            self.completed += 1
+        self._slots.release()
+
+    async def run(self, fn, *args):
+        """Runs a blocking callable (e.g. `graph.invoke`) in the pool once a slot is free."""
+        await self._acquire()
+        failed = True
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+            failed = False
+            return result
+        finally:
+            self._release(failed)
+
+    async def stream(self, graph, initial_state, config: dict):
+        """
+        Streams the per-node state updates of `graph.stream(initial_state, config)`
+        from a worker thread.
+        Exceptions raised inside the graph are re-raised in the caller.
+        """
+        waited = await self._acquire()
+        telemetry = (config.get("configurable") or {}).get("telemetry")
+        if telemetry is not None:
+            telemetry.queue_wait_s = waited
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                for event in graph.stream(initial_state, config, stream_mode="updates"):
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+                    if cancelled.is_set():
+                        break
+                loop.call_soon_threadsafe(events.put_nowait, _DONE)
+            except BaseException as e:
+                loop.call_soon_threadsafe(events.put_nowait, e)
+
+        worker = loop.run_in_executor(self._pool, produce)
+        failed = True
+        try:
+            while True:
+                item = await events.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+            failed = False
+        finally:
+            # Stop the worker at the next step if the consumer went away early
+            cancelled.set()
+            await asyncio.shield(worker)
+            self._release(failed)
@@ -0,0 +1,82 @@
+import os
+import math
+
+import numpy as np
+
+# --- FAISS Index Types ---
+# "flat" is exact search and fine for a few thousand chunks. The others trade a
+# little recall for much less memory (ivf-pq) or much faster search on large
+# corpora (ivf-flat, hnsw). scripts/ingest.py builds them and records the type and
+# parameters in the index manifest; app.resources applies the search parameters
+# when the index is loaded.
+INDEX_TYPES = ("flat", "ivf-flat", "ivf-pq", "hnsw")
+
+# FAISS wants roughly this many training vectors per IVF centroid / PQ code
+TRAINING_POINTS_PER_CENTROID = 39
+
+
+def default_params(index_type: str, n_vectors: int, dim: int) -> dict:
+    """Build and search parameters suited to a corpus of `n_vectors` vectors."""
+    if index_type in ("ivf-flat", "ivf-pq"):
+        # ~4*sqrt(n) lists, but never more than the vectors can train
+        nlist = max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // TRAINING_POINTS_PER_CENTROID))
+        params = {"nlist": nlist, "nprobe": max(1, min(64, nlist // 16))}
+        if index_type == "ivf-pq":
+            # m sub-quantizers (4 dims each) must divide the dimension; 8 bits each unless the corpus is tiny
+            m = next(m for m in range(max(1, dim // 4), 0, -1) if dim % m == 0)
+            nbits = max(1, min(8, int(math.log2(max(2, n_vectors // TRAINING_POINTS_PER_CENTROID)))))
+            params.update({"m": m, "nbits": nbits})
+        return params
+    if index_type == "hnsw":
+        return {"M": 32, "efConstruction": 80, "efSearch": 64}
+    return {}
+
+
+def build_index(index_type: str, vectors: np.ndarray, params: dict):
+    """Creates an empty FAISS index of this type, trained on `vectors` if it needs training."""
+    import faiss
+
+    dim = vectors.shape[1]
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "ivf-flat":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, params["nlist"])
+    elif index_type == "ivf-pq":
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, params["nlist"], params["m"], params["nbits"])
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["M"])
+        index.hnsw.efConstruction = params["efConstruction"]
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {', '.join(INDEX_TYPES)}")
+
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+    apply_search_params(index, {"type": index_type, "params": params})
+    return index
+
+
+def apply_search_params(index, index_meta: dict):
+    """
+    Sets nprobe (IVF) or efSearch (HNSW) from the manifest's index metadata.
+    FAISS_NPROBE / FAISS_EF_SEARCH override them for a deployment.
+    """
+    import faiss
+
+    params = (index_meta or {}).get("params", {})
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = int(os.getenv("FAISS_NPROBE") or params.get("nprobe", 1))
+    elif hasattr(index, "hnsw"):
+        index.hnsw.efSearch = int(os.getenv("FAISS_EF_SEARCH") or params.get("efSearch", 16))
+
+
+def supports_removal(index_type: str) -> bool:
+    # LangChain renumbers positions after FAISS.delete, which only holds for flat
+    # indexes (IVF keeps the old IDs, HNSW cannot remove at all)
+    return index_type == "flat"
+
+
+def index_size_bytes(index) -> int:
+    """Size of the serialized index, a good proxy for its memory footprint."""
+    import faiss
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+
+from app.log_preprocessing import log_signature
+
+# Get the root project directory (parent of app/)
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# LangGraph checkpoints and the investigation records share one local SQLite
+# file. Set CHECKPOINT_DB to an empty string to run without checkpoints.
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", os.path.join(root_dir, "investigations.sqlite"))
+# Finished investigations (their record and checkpoints) are deleted after this
+# many days. 0 keeps them forever.
+INVESTIGATION_RETENTION_DAYS = float(os.getenv("INVESTIGATION_RETENTION_DAYS", "7"))
+
+# Options that do not change what an investigation concludes
+FINGERPRINT_IGNORED_OPTIONS = {"priority", "replay"}
+
+
+def new_investigation_id() -> str:
+    return uuid.uuid4().hex
+
+
+def investigation_config(investigation_id: str, telemetry=None, priority=None) -> dict:
+    """
+    The graph run config for one investigation; the ID doubles as the checkpoint
+    thread. With an InvestigationTelemetry, every node, LLM and tool call is traced.
+    `priority` (options.priority) orders its LLM calls in the gateway's queue.
+    """
+    config = {"recursion_limit": 25, "configurable": {"thread_id": investigation_id}}
+    if priority is not None:
+        config["configurable"]["priority"] = priority
+    if telemetry is not None:
+        config["configurable"]["telemetry"] = telemetry
+        config["callbacks"] = [telemetry.callback_handler()]
+    return config
+
+
+def alert_fingerprint(initial_state: dict) -> str:
+    """
+    Identifies alerts that would produce the same investigation: the indicator,
+    the normalized signature of the logs (same events, IOCs and order of
+    magnitude of repetitions) and the options that affect the result (e.g.
+    `mode`, `intel_prose`), so a scanner's near-identical alerts share one
+    fingerprint.
+    """
+    options = {k: v for k, v in (initial_state.get("options") or {}).items() if k not in FINGERPRINT_IGNORED_OPTIONS}
+    key = "\0".join([
+        (initial_state.get("indicator") or "").strip().lower(),
+        log_signature(initial_state.get("logs") or ""),
+        json.dumps(options, sort_keys=True, default=str),
+    ])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class InflightRegistry:
+    """
+    The running investigations by alert fingerprint, and the clients following
+    each one: duplicate alerts subscribe to the running investigation instead of
+    starting their own. The events emitted so far are kept too, so a new
+    subscriber catches up without reading the store. Only touched from the event
+    loop, so it needs no lock.
+    """
+
+    def __init__(self):
+        self._by_fingerprint = {}
+        self._fingerprints = {}
+        self._subscribers = {}
+        self._events = {}
+
+    def __contains__(self, investigation_id: str) -> bool:
+        return investigation_id in self._subscribers
+
+    def start(self, investigation_id: str, fingerprint: str, sid: str):
+        self._by_fingerprint[fingerprint] = investigation_id
+        self._fingerprints[investigation_id] = fingerprint
+        self._subscribers[investigation_id] = [sid]
+        self._events[investigation_id] = []
+
+    def find(self, fingerprint: str) -> str:
+        """Returns the ID of the running investigation with this fingerprint, or None."""
+        return self._by_fingerprint.get(fingerprint)
+
+    def subscribe(self, investigation_id: str, sid: str):
+        subscribers = self._subscribers[investigation_id]
+        if sid not in subscribers:
+            subscribers.append(sid)
+
+    def subscribers(self, investigation_id: str) -> list:
+        return list(self._subscribers.get(investigation_id, ()))
+
+    def add_event(self, investigation_id: str, payload):
+        self._events[investigation_id].append(payload)
+
+    def events(self, investigation_id: str) -> list:
+        """The serialized events emitted so far by a running investigation."""
+        return list(self._events.get(investigation_id, ()))
+
+    def finish(self, investigation_id: str):
+        self._subscribers.pop(investigation_id, None)
+        self._events.pop(investigation_id, None)
+        fingerprint = self._fingerprints.pop(investigation_id, None)
+        if self._by_fingerprint.get(fingerprint) == investigation_id:
+            del self._by_fingerprint[fingerprint]
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._subscribers),
+            "subscribers": sum(len(sids) for sids in self._subscribers.values()),
+        }
+
+
+class InvestigationStore:
+    """
+    Records every investigation (status, alert fingerprint and the events that
+    were emitted for it), so interrupted ones can be resumed and finished ones
+    replayed instead of recomputed.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30)
+        # Switch the shared file to WAL up front, before other processes use it
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS investigations (
+                    id TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS investigations_fingerprint ON investigations (fingerprint, status)")
+            # One row per event, so recording one costs the same however long the
+            # investigation already is
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS investigation_events (
+                    investigation_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    PRIMARY KEY (investigation_id, seq)
+                )"""
+            )
+
+    def create(self, investigation_id: str, fingerprint: str):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO investigations (id, fingerprint, status, created_at, updated_at) VALUES (?, ?, 'running', ?, ?)",
+                (investigation_id, fingerprint, now, now),
+            )
+
+    def set_status(self, investigation_id: str, status: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE investigations SET status = ?, updated_at = ? WHERE id = ?",
+                (status, time.time(), investigation_id),
+            )
+
+    def append_event(self, investigation_id: str, event):
+        """`event` is a dict, or the event already serialized to JSON (str or bytes)."""
+        if isinstance(event, bytes):
+            event = event.decode()
+        elif not isinstance(event, str):
+            event = json.dumps(event)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO investigation_events (investigation_id, seq, payload) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM investigation_events WHERE investigation_id = ?",
+                (investigation_id, event, investigation_id),
+            )
+            self._conn.execute("UPDATE investigations SET updated_at = ? WHERE id = ?", (time.time(), investigation_id))
+
+    def get(self, investigation_id: str) -> dict:
+        """Returns the investigation record (with its events), or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, fingerprint, status, created_at, updated_at FROM investigations WHERE id = ?",
+                (investigation_id,),
+            ).fetchone()
+            events = self._conn.execute(
+                "SELECT payload FROM investigation_events WHERE investigation_id = ? ORDER BY seq",
+                (investigation_id,),
+            ).fetchall() if row is not None else []
+        if row is None:
+            return None
+        return {
+            "id": row[0], "fingerprint": row[1], "status": row[2], "events": [json.loads(e[0]) for e in events],
+            "created_at": row[3], "updated_at": row[4],
+        }
+
+    def purge(self, max_age: float) -> int:
+        """
+        Deletes the finished investigations last updated more than `max_age` seconds
+        ago, with their checkpoints. Returns how many were deleted.
+        """
+        cutoff = time.time() - max_age
+        with self._lock, self._conn:
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT id FROM investigations WHERE status != 'running' AND updated_at < ?", (cutoff,))]
+            # The LangGraph checkpointer shares the file (see app/main.py)
+            tables = {row[0] for row in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                self._conn.execute(f"DELETE FROM investigations WHERE id IN ({marks})", chunk)
+                self._conn.execute(f"DELETE FROM investigation_events WHERE investigation_id IN ({marks})", chunk)
+                for table in ("checkpoints", "writes"):
+                    if table in tables:
+                        self._conn.execute(f"DELETE FROM {table} WHERE thread_id IN ({marks})", chunk)
+        return len(ids)
+
+    def find_completed(self, fingerprint: str, max_age: float = None) -> dict:
+        """Returns the latest completed investigation with this fingerprint, or None."""
+        oldest = time.time() - max_age if max_age is not None else 0
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM investigations WHERE fingerprint = ? AND status = 'completed' AND updated_at >= ? "
+                "ORDER BY updated_at DESC LIMIT 1",
+                (fingerprint, oldest),
+            ).fetchone()
+        return self.get(row[0]) if row else None
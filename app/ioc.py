@@ -0,0 +1,114 @@
+import os
+import re
+import ipaddress
+from typing import Dict, List
+
+# --- Indicator of Compromise Extraction ---
+# One pass over the alert and its logs pulls out every IP address, domain and file
+# hash, so the Threat_Analyst can look them all up at once. IOC_MAX_LOOKUPS caps
+# how many are taken from one alert, as each costs a request against the quota.
+MAX_IOCS = int(os.getenv("IOC_MAX_LOOKUPS", "20"))
+
+_IPV4 = re.compile(r"(?<![\w.])(?:\d{1,3}\.){3}\d{1,3}(?![\w.])")
+_IPV6 = re.compile(r"(?<![\w:.])(?:[0-9A-Fa-f]{0,4}:){2,7}[0-9A-Fa-f]{0,4}(?![\w:])")
+_HASH = re.compile(r"\b(?:[0-9A-Fa-f]{64}|[0-9A-Fa-f]{40}|[0-9A-Fa-f]{32})\b")
+_DOMAIN = re.compile(r"\b(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,24}\b")
+
+# Internal names mean nothing to VirusTotal, and looking them up would disclose the
+# internal network to it, so they are never extracted or sent. IOC_INTERNAL_DOMAINS
+# adds the organisation's own suffixes (comma-separated, e.g. "corp.example.com").
+INTERNAL_DOMAIN_SUFFIXES = {
+    "local", "localdomain", "localhost", "internal", "intranet", "private", "corp", "lan", "home",
+    "home.arpa", "test", "example", "invalid",
+} | {s.strip().lower().strip(".") for s in os.getenv("IOC_INTERNAL_DOMAINS", "").split(",") if s.strip()}
+
+# Logs are full of dotted names that are not domains (java.lang.NullPointerException,
+# session.opened), and each one would spend a lookup from the quota. So only names
+# under a known top-level domain are extracted: every country code, plus the
+# generic ones common in traffic and threat feeds.
+_COUNTRY_TLDS = (
+    "ac ad ae af ag ai al am ao aq ar as at au aw ax az ba bb bd be bf bg bh bi bj bm bn bo br bs bt bw by bz "
+    "ca cc cd cf cg ch ci ck cl cm cn co cr cu cv cw cx cy cz de dj dk dm do dz ec ee eg er es et eu fi fj fk "
+    "fm fo fr ga gd ge gf gg gh gi gl gm gn gp gq gr gs gt gu gw gy hk hm hn hr ht hu id ie il im in io iq ir "
+    "is it je jm jo jp ke kg kh ki km kn kp kr kw ky kz la lb lc li lk lr ls lt lu lv ly ma mc md me mg mh mk "
+    "ml mm mn mo mp mq mr ms mt mu mv mw mx my mz na nc ne nf ng ni nl no np nr nu nz om pa pe pf pg ph pk pl "
+    "pm pn pr ps pt pw py qa re ro rs ru rw sa sb sc sd se sg sh si sk sl sm sn so sr ss st su sv sx sy sz tc "
+    "td tf tg th tj tk tl tm tn to tr tt tv tw tz ua ug uk us uy uz va vc ve vg vi vn vu wf ws ye yt za zm zw"
+)
+_GENERIC_TLDS = (
+    "com net org edu gov mil int arpa info biz name pro mobi asia tel travel jobs aero coop museum cat xxx "
+    "app dev xyz top online site club shop store tech website space live life world today news blog cloud link "
+    "click download win bid loan work party review stream trade date racing science cricket faith accountant "
+    "icu buzz fun vip ltd group email network digital services solutions agency company zip mov lol best "
+    "host hosting server systems support security center media global tokyo moscow"
+)
+PUBLIC_TLDS = set(_COUNTRY_TLDS.split()) | set(_GENERIC_TLDS.split())
+
+# Things that look like domains in logs but are file names
+_FILE_EXTENSIONS = {
+    "bak", "bin", "cfg", "conf", "csv", "dll", "exe", "gz", "html", "ini", "jar", "jpg", "js", "json", "key",
+    "log", "md", "old", "pdf", "php", "png", "pub", "py", "service", "sh", "so", "sock", "tar", "tmp", "txt",
+    "xml", "yaml", "yml", "zip",
+}
+
+
+def _ip_type(value: str):
+    """Returns "ip" for a public address, None for invalid, private or reserved ones."""
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    return "ip" if address.is_global else None
+
+
+def is_internal_domain(value: str) -> bool:
+    """True for names under one of INTERNAL_DOMAIN_SUFFIXES (e.g. "dc01.corp", "nas.local")."""
+    labels = value.lower().rstrip(".").split(".")
+    return any(".".join(labels[i:]) in INTERNAL_DOMAIN_SUFFIXES for i in range(len(labels)))
+
+
+def classify(value: str):
+    """Returns the IOC type of a single value ("ip", "domain" or "hash"), or None."""
+    value = value.strip()
+    try:
+        ipaddress.ip_address(value)
+        return "ip"
+    except ValueError:
+        pass
+    if _HASH.fullmatch(value):
+        return "hash"
+    if _DOMAIN.fullmatch(value) and value.rsplit(".", 1)[-1].lower() not in _FILE_EXTENSIONS:
+        return "domain"
+    return None
+
+
+def extract_iocs(*texts: str, limit: int = MAX_IOCS) -> List[Dict[str, str]]:
+    """
+    Returns the unique IOCs found in `texts` as [{"type", "value"}], in order of
+    first appearance. Private, loopback and reserved IPs and internal domains are
+    skipped, since threat intelligence has nothing to say about them.
+    """
+    found = {}
+
+    def add(ioc_type, value):
+        if ioc_type and value not in found and len(found) < limit:
+            found[value] = {"type": ioc_type, "value": value}
+
+    for text in texts:
+        if not text:
+            continue
+        hits = []
+        for match in _IPV4.finditer(text):
+            hits.append((match.start(), _ip_type(match.group()), match.group()))
+        for match in _IPV6.finditer(text):
+            hits.append((match.start(), _ip_type(match.group()), match.group().lower()))
+        for match in _HASH.finditer(text):
+            hits.append((match.start(), "hash", match.group().lower()))
+        for match in _DOMAIN.finditer(text):
+            value = match.group().lower()
+            tld = value.rsplit(".", 1)[-1]
+            if tld in PUBLIC_TLDS and tld not in _FILE_EXTENSIONS and not is_internal_domain(value):
+                hits.append((match.start(), "domain", value))
+        for _, ioc_type, value in sorted(hits, key=lambda hit: hit[0]):
+            add(ioc_type, value)
+    return list(found.values())
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+# --- Scale-Out Settings ---
+# With JOB_QUEUE_DB set, the API server only queues investigations; `python -m
+# app.worker` processes claim and run them, and their events reach the clients
+# through the same SQLite file (see app/api/pubsub.py). No broker is needed, so any
+# number of API and worker processes can share one machine.
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "")
+# A claimed job goes back to the queue if its worker stops renewing the lease
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.05"))
+
+
+class JobQueue:
+    """
+    A durable queue of investigations in SQLite. Jobs are claimed in priority
+    order under a lease, so the jobs of a crashed worker are picked up by another
+    one (and resumed from their last checkpoint).
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        # Autocommit, so claim() can hold an IMMEDIATE transaction across processes
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    investigation_id TEXT NOT NULL,
+                    fingerprint TEXT,
+                    initial_state TEXT,
+                    priority INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority, id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_fingerprint ON jobs (fingerprint, status)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_investigation ON jobs (investigation_id, status)")
+
+    def put(self, investigation_id: str, initial_state, fingerprint: str = None, priority: int = 2) -> int:
+        """Queues an investigation; an `initial_state` of None resumes it from its checkpoint."""
+        now = time.time()
+        state = json.dumps(initial_state) if initial_state is not None else None
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (investigation_id, fingerprint, initial_state, priority, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (investigation_id, fingerprint, state, priority, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker: str, lease: float = JOB_LEASE_SECONDS) -> dict:
+        """Takes the next queued (or abandoned) job for `worker`, or returns None."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, investigation_id, initial_state, attempts FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY priority, id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, lease_until = ?, "
+                        "updated_at = ? WHERE id = ?",
+                        (worker, now + lease, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return {
+            "id": row[0], "investigation_id": row[1], "attempts": row[3] + 1,
+            "initial_state": json.loads(row[2]) if row[2] is not None else None,
+        }
+
+    def renew(self, job_ids: list, worker: str, lease: float = JOB_LEASE_SECONDS):
+        """Extends the lease of the jobs `worker` is still running."""
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE worker = ? AND status = 'running' "
+                f"AND id IN ({','.join('?' * len(job_ids))})",
+                (time.time() + lease, worker, *job_ids),
+            )
+
+    def finish(self, job_id: int, status: str):
+        """Marks a job "done" or "failed"."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, lease_until = NULL, updated_at = ? WHERE id = ?",
+                               (status, time.time(), job_id))
+
+    def find_active(self, fingerprint: str) -> str:
+        """Returns the ID of a queued or running investigation with this fingerprint, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT investigation_id FROM jobs WHERE fingerprint = ? AND status IN ('queued', 'running') "
+                "ORDER BY id DESC LIMIT 1",
+                (fingerprint,),
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_active(self, investigation_id: str) -> bool:
+        """Whether the investigation is queued or running."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE investigation_id = ? AND status IN ('queued', 'running') LIMIT 1",
+                (investigation_id,),
+            ).fetchone()
+        return row is not None
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"queued": 0, "running": 0, "done": 0, "failed": 0, **dict(rows)}
@@ -0,0 +1,312 @@
+import os
+import math
+import time
+import heapq
+import random
+import itertools
+import threading
+from collections import deque
+from typing import List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage, get_buffer_string
+from langchain_core.outputs import ChatResult
+from langchain_core.runnables import RunnableBinding, RunnableSequence
+
+from app.tokens import count_tokens
+from app.telemetry import (
+    registry, current_telemetry, LLM_RETRIES, LLM_QUEUE_SECONDS, LLM_RATE_LIMITED, LLM_DOWNGRADED,
+)
+
+# --- 1. Budget Settings ---
+# Every agent's LLM calls go through one gateway that keeps the process within the
+# Groq plan's requests- and tokens-per-minute limits (0 disables a limit). Calls
+# wait in a queue ordered by the alert's priority (options.priority), so critical
+# alerts go first when the budget runs out.
+LLM_RPM = int(os.getenv("LLM_RPM", "30"))
+LLM_TPM = int(os.getenv("LLM_TPM", "12000"))
+# The limits are per API key, but each process keeps its own budget: with several
+# API server or app.worker processes on one key, set LLM_BUDGET_SHARES to how many
+# there are and each gets that share of LLM_RPM / LLM_TPM
+LLM_BUDGET_SHARES = max(1, int(os.getenv("LLM_BUDGET_SHARES", "1")))
+# Tokens reserved for the completion until the real usage is known
+LLM_COMPLETION_ESTIMATE = int(os.getenv("LLM_COMPLETION_ESTIMATE", "300"))
+# Low-stakes calls switch to the small model once the budget is this full
+LLM_SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "llama-3.1-8b-instant")
+LLM_DOWNGRADE_AT = float(os.getenv("LLM_DOWNGRADE_AT", "0.8"))
+# Retries of rate-limited (429) calls, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+# A waiting call moves up one priority level every LLM_PRIORITY_AGING seconds, so
+# a steady stream of critical alerts cannot starve the low ones (0: strict priority)
+LLM_PRIORITY_AGING = float(os.getenv("LLM_PRIORITY_AGING", "30"))
+
+PRIORITIES = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+DEFAULT_PRIORITY = "medium"
+WINDOW_SECONDS = 60.0
+
+
+def budget_share(limit: int, shares: int = LLM_BUDGET_SHARES) -> int:
+    """This process's share of a per-minute limit (0, unlimited, stays 0)."""
+    return max(1, limit // shares) if limit else 0
+
+
+def priority_level(priority) -> int:
+    """Maps options.priority (a name or a number, lower first) to a queue level."""
+    if isinstance(priority, (int, float)) and not isinstance(priority, bool):
+        if not math.isfinite(priority):
+            return PRIORITIES[DEFAULT_PRIORITY]
+        # Clamped to the named levels: a negative number must not jump the queue
+        return min(max(int(priority), min(PRIORITIES.values())), max(PRIORITIES.values()))
+    return PRIORITIES.get(str(priority or DEFAULT_PRIORITY).lower(), PRIORITIES[DEFAULT_PRIORITY])
+
+
+def _current_priority() -> int:
+    # investigation_config() puts the alert's priority into the run config
+    try:
+        from langgraph.config import get_config
+        return priority_level((get_config().get("configurable") or {}).get("priority"))
+    except RuntimeError:
+        return priority_level(None)
+
+
+# --- 2. The Gateway ---
+class LLMGateway:
+    """
+    A sliding-window RPM/TPM budget with a priority queue in front of it.
+    `acquire()` blocks until the call is at the head of the queue and fits in the
+    budget; `settle()` replaces the token estimate with the real usage.
+    """
+
+    def __init__(self, rpm: int = budget_share(LLM_RPM), tpm: int = budget_share(LLM_TPM),
+                 aging: float = LLM_PRIORITY_AGING):
+        self.rpm, self.tpm = rpm, tpm
+        self.aging = aging
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._calls = deque()  # [admitted at, tokens] within the window
+        self._paused_until = 0.0
+        self.admitted = 0
+        self.rate_limited = 0
+        self.downgraded = 0
+
+    def _prune(self, now: float):
+        while self._calls and self._calls[0][0] <= now - WINDOW_SECONDS:
+            self._calls.popleft()
+
+    def _tokens_used(self) -> int:
+        return sum(call[1] for call in self._calls)
+
+    def _delay(self, now: float, tokens: int) -> float:
+        """Seconds until a call of `tokens` fits in the budget."""
+        wait = self._paused_until - now
+        if self.rpm and len(self._calls) >= self.rpm:
+            wait = max(wait, self._calls[len(self._calls) - self.rpm][0] + WINDOW_SECONDS - now)
+        if self.tpm:
+            excess = self._tokens_used() + tokens - self.tpm
+            for admitted_at, used in self._calls:
+                if excess <= 0:
+                    break
+                excess -= used
+                wait = max(wait, admitted_at + WINDOW_SECONDS - now)
+        return wait
+
+    def acquire(self, priority: int, tokens: int):
+        """Waits for budget. Returns (reservation, seconds waited)."""
+        started = time.monotonic()
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+        # Every waiting call ages at the same rate, so ordering by level plus the
+        # time it was queued ranks them as their aged levels would
+        rank = (priority * self.aging + started) if self.aging > 0 else priority
+        key = (rank, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, key)
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                if self._waiting[0] == key:
+                    delay = self._delay(now, tokens)
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+            heapq.heappop(self._waiting)
+            reservation = [now, tokens]
+            self._calls.append(reservation)
+            self.admitted += 1
+            self._cond.notify_all()
+        return reservation, time.monotonic() - started
+
+    def settle(self, reservation: list, tokens: int):
+        with self._cond:
+            reservation[1] = tokens
+            self._cond.notify_all()
+
+    def release(self, reservation: list):
+        """Gives back the budget of a call that was rejected (429) and so used none."""
+        with self._cond:
+            try:
+                self._calls.remove(reservation)
+            except ValueError:
+                pass  # Already out of the window
+            self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Holds every call back after a 429, instead of letting them all fail too."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.rate_limited += 1
+
+    def utilization(self) -> dict:
+        """Share of the RPM and TPM budgets used in the last minute (0 when unlimited)."""
+        with self._cond:
+            self._prune(time.monotonic())
+            return {
+                "requests": round(len(self._calls) / self.rpm, 3) if self.rpm else 0.0,
+                "tokens": round(self._tokens_used() / self.tpm, 3) if self.tpm else 0.0,
+            }
+
+    def tight(self) -> bool:
+        # _cond's lock is reentrant, so utilization() can take it again
+        with self._cond:
+            return bool(self._waiting) or max(self.utilization().values()) >= LLM_DOWNGRADE_AT
+
+    def downgrade(self) -> bool:
+        """True (and counted) if a low-stakes call should use the small model now."""
+        with self._cond:
+            if not self.tight():
+                return False
+            self.downgraded += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "queued": len(self._waiting),
+                "admitted": self.admitted,
+                "rate_limited": self.rate_limited,
+                "downgraded": self.downgraded,
+                "utilization": self.utilization(),
+            }
+
+
+gateway = LLMGateway()
+
+
+def _collect_gauges():
+    stats = gateway.stats()
+    yield ("cypher_llm_queue_depth", "LLM calls waiting for budget.", {}, stats["queued"])
+    for budget, value in stats["utilization"].items():
+        yield ("cypher_llm_budget_utilization", "Share of the per-minute LLM budget used.", {"budget": budget}, value)
+
+registry.register_gauges(_collect_gauges)
+
+
+# --- 3. Chat Model Wrapper ---
+def _retry_after(error: Exception) -> Optional[float]:
+    """The Retry-After seconds of a 429 error (0 if absent), or None for other errors."""
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    if status != 429:
+        return None
+    try:
+        return float((getattr(response, "headers", None) or {}).get("retry-after") or 0)
+    except ValueError:
+        return 0.0
+
+
+def _total_tokens(result: ChatResult) -> Optional[int]:
+    usage = (result.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("total_tokens") or usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+    metadata = getattr(result.generations[0].message, "usage_metadata", None) if result.generations else None
+    return metadata.get("total_tokens") if metadata else None
+
+
+class GatewayChatModel(BaseChatModel):
+    """
+    Wraps a chat client so every call, including those of chains built with
+    `bind_tools` / `with_structured_output`, waits for the gateway's budget and is
+    retried on 429. Low-stakes calls (`small` set) go to the small model when the
+    budget is tight.
+    """
+
+    inner: BaseChatModel
+    small: Optional[BaseChatModel] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self) -> dict:
+        return self.inner._identifying_params
+
+    def _get_invocation_params(self, stop=None, **kwargs) -> dict:
+        return self.inner._get_invocation_params(stop=stop, **kwargs)
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        return self.inner._get_ls_params(stop=stop, **kwargs)
+
+    def _rebind(self, runnable):
+        """Points a runnable the wrapped client built on itself back at this wrapper."""
+        if isinstance(runnable, RunnableBinding) and runnable.bound is self.inner:
+            return self.bind(**runnable.kwargs)
+        if isinstance(runnable, RunnableSequence):
+            first = self._rebind(runnable.first)
+            if first is not None:
+                return RunnableSequence(first, *runnable.middle, runnable.last)
+        return None
+
+    def bind_tools(self, tools, **kwargs):
+        return self._rebind(self.inner.bind_tools(tools, **kwargs))
+
+    def with_structured_output(self, schema, **kwargs):
+        rebound = self._rebind(self.inner.with_structured_output(schema, **kwargs))
+        return rebound if rebound is not None else super().with_structured_output(schema, **kwargs)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        priority = _current_priority()
+        estimate = count_tokens(get_buffer_string(messages)) + LLM_COMPLETION_ESTIMATE
+        telemetry = current_telemetry.get()
+
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            reservation, waited = gateway.acquire(priority, estimate)
+            LLM_QUEUE_SECONDS.observe(waited, priority=priority)
+            if telemetry is not None:
+                with telemetry._lock:
+                    telemetry.llm_wait_s += waited
+
+            client = self.inner
+            if self.small is not None and gateway.downgrade():
+                client = self.small
+                LLM_DOWNGRADED.inc(model=getattr(client, "model_name", None) or getattr(client, "model", "unknown"))
+            try:
+                result = client._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is None:
+                    gateway.settle(reservation, estimate)
+                    raise
+                # The rejected call used no budget; the retry reserves its own
+                gateway.release(reservation)
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                # Full jitter keeps the retries of many investigations apart
+                delay = max(retry_after, random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt)))
+                gateway.pause(delay)
+                LLM_RATE_LIMITED.inc()
+                LLM_RETRIES.inc()
+                if telemetry is not None:
+                    with telemetry._lock:
+                        telemetry.retries += 1
+                continue
+            gateway.settle(reservation, _total_tokens(result) or estimate)
+            return result
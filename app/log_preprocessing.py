@@ -0,0 +1,255 @@
+import io
+import re
+import math
+import heapq
+from collections import Counter, OrderedDict, deque
+
+from app.tokens import clip_tokens, count_tokens
+
+# --- 1. Line Templates ---
+# Variable parts of a log line are masked so that repetitive lines (the same
+# event with a different timestamp, port or PID) share one template.
+_MASKS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<TS>"),
+    (re.compile(r"\b[A-Z][a-z]{2} +\d{1,2} \d{2}:\d{2}:\d{2}\b"), "<TS>"),
+    (re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b"), "<IP>"),
+    (re.compile(r"\b[0-9a-fA-F]{8,}\b"), "<HEX>"),
+    (re.compile(r"\b\d+\b"), "<NUM>"),
+]
+
+def templatize(line: str) -> str:
+    """Returns the line with timestamps, IPs, hex strings and numbers masked."""
+    for pattern, placeholder in _MASKS:
+        line = pattern.sub(placeholder, line)
+    return line
+
+# --- 2. Detectors ---
+# Fast regex checks for the patterns the Log_Analyst prompt asks about.
+FAILED_LOGIN = re.compile(r"failed (?:password|login|logon)|authentication failure|invalid (?:user|password)|login failed", re.I)
+SUCCESSFUL_LOGIN = re.compile(r"accepted (?:password|publickey)|login succe|logged in|successful login|session opened", re.I)
+SENSITIVE_FILE = re.compile(r"/etc/(?:passwd|shadow|sudoers)|\.ssh/|id_rsa|\.bash_history", re.I)
+UNUSUAL_COMMAND = re.compile(
+    r"(?:wget|curl)\b[^|]*\|\s*(?:ba)?sh|\bnc\b[^\n]*\s-e\b|/dev/tcp/|base64\s+(?:-d|--decode)|chmod\s+(?:\+x|777)"
+    r"|\buseradd\b|\busermod\b|\bsudo\s+su\b|\bhistory\s+-c\b|\brm\s+-rf\s+/|\bcrontab\b|\bmkfifo\b",
+    re.I,
+)
+# Weight of each detector when ranking windows: when a log has more suspicious
+# windows than the LLM budget allows, the most severe ones are kept.
+SEVERITY = {
+    "unusual_command": 4,
+    "failed_then_successful_login": 4,
+    "sensitive_file_access": 3,
+    "repeated_failed_logins": 1,
+}
+_ACTOR = re.compile(r"(?:user[= ]'?|for (?:invalid user )?)([\w.@-]+)|\b((?:\d{1,3}\.){3}\d{1,3})\b", re.I)
+
+
+def iter_lines(logs):
+    """Yields the lines of a log string or file-like object without loading them all at once."""
+    stream = io.StringIO(logs) if isinstance(logs, str) else logs
+    for line in stream:
+        line = line.rstrip("\r\n")
+        if line.strip():
+            yield line
+
+
+# IPs, hashes and domains stay in the signature: the same event from another
+# address is another alert
+_SIGNATURE_IOCS = re.compile(
+    r"\b(?:\d{1,3}\.){3}\d{1,3}\b|\b(?:[0-9a-fA-F]{64}|[0-9a-fA-F]{40}|[0-9a-fA-F]{32})\b"
+    r"|\b(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,24}\b"
+)
+
+
+def _signature_line(line: str) -> str:
+    """Like templatize, but keeps the IPs, hashes and domains of the line."""
+    parts, last = [], 0
+    for match in _SIGNATURE_IOCS.finditer(line):
+        parts.append(templatize(line[last:match.start()]))
+        parts.append(match.group().lower())
+        last = match.end()
+    parts.append(templatize(line[last:]))
+    return "".join(parts)
+
+
+def log_signature(logs) -> str:
+    """
+    The distinct lines of the logs with timestamps, ports and PIDs masked (but
+    not IPs, hashes or domains), each with the log2 of its count, sorted. Alerts
+    whose logs differ only in timestamps, ports, PIDs or a few repetitions have
+    the same signature; ten failed logins and a thousand do not.
+    """
+    counts = Counter(_signature_line(line.strip()) for line in iter_lines(logs or ""))
+    return "\n".join(sorted(f"{line}\t{int(math.log2(n))}" for line, n in counts.items()))
+
+
+class LogDigest:
+    """
+    Streaming pre-processor for large logs. It count-collapses runs of lines with
+    the same template, runs the detectors on every line and yields only the
+    suspicious windows (the flagged lines plus a few lines of context).
+
+    Memory stays bounded regardless of log size: template and per-actor counters
+    are capped, and at most one window is buffered at a time.
+    """
+
+    def __init__(self, context_lines: int = 2, failure_threshold: int = 3,
+                 max_window_lines: int = 200, max_templates: int = 1000, max_actors: int = 10000):
+        self.context_lines = context_lines
+        self.failure_threshold = failure_threshold
+        self.max_window_lines = max_window_lines
+        self.max_templates = max_templates
+        self.max_actors = max_actors
+        self.total_lines = 0
+        self.dropped_windows = 0
+        self.templates = Counter()
+        self.examples = {}  # template -> its first line
+        self.detections = Counter()
+        self._failures = OrderedDict()  # actor -> consecutive failed logins
+
+    def _detect(self, line: str) -> set:
+        hits = set()
+        if SENSITIVE_FILE.search(line):
+            hits.add("sensitive_file_access")
+        if UNUSUAL_COMMAND.search(line):
+            hits.add("unusual_command")
+
+        failed = FAILED_LOGIN.search(line)
+        succeeded = not failed and SUCCESSFUL_LOGIN.search(line)
+        if failed or succeeded:
+            match = _ACTOR.search(line)
+            actor = (match.group(1) or match.group(2)) if match else "<unknown>"
+            if failed:
+                self._failures[actor] = self._failures.pop(actor, 0) + 1
+                if len(self._failures) > self.max_actors:
+                    self._failures.popitem(last=False)
+                if self._failures[actor] >= self.failure_threshold:
+                    hits.add("repeated_failed_logins")
+            elif self._failures.pop(actor, 0) >= self.failure_threshold:
+                hits.add("failed_then_successful_login")
+
+        self.detections.update(hits)
+        return hits
+
+    def _collapse(self, lines):
+        """Groups consecutive lines with the same template into (line, count, hits)."""
+        line, template, count, hits = None, None, 0, set()
+        for raw in lines:
+            self.total_lines += 1
+            raw_template = templatize(raw)
+            if raw_template in self.templates or len(self.templates) < self.max_templates:
+                self.templates[raw_template] += 1
+                self.examples.setdefault(raw_template, raw[:500])
+            raw_hits = self._detect(raw)
+            if raw_template == template:
+                count += 1
+                hits |= raw_hits
+                continue
+            if line is not None:
+                yield line, count, hits
+            line, template, count, hits = raw, raw_template, 1, raw_hits
+        if line is not None:
+            yield line, count, hits
+
+    def scored_windows(self, lines):
+        """Yields the suspicious windows of the log as (severity, text block)."""
+        before = deque(maxlen=self.context_lines)
+        window, score, after = None, 0, 0
+        for line, count, hits in self._collapse(lines):
+            rendered = line if count == 1 else f"{line}  [repeated {count}x]"
+            if hits:
+                rendered += f"  <-- {', '.join(sorted(hits))}"
+                if window is None:
+                    window, score = list(before), 0
+                window.append(rendered)
+                score += sum(SEVERITY.get(hit, 1) for hit in hits)
+                after = self.context_lines
+            elif window is not None:
+                window.append(rendered)
+                after -= 1
+                if after <= 0:
+                    yield score, "\n".join(window)
+                    window = None
+                    before.clear()
+                    continue
+            else:
+                before.append(rendered)
+
+            if window is not None and len(window) >= self.max_window_lines:
+                yield score, "\n".join(window)
+                window = None
+                before.clear()
+        if window:
+            yield score, "\n".join(window)
+
+    def windows(self, lines):
+        """Yields the suspicious windows of the log as text blocks."""
+        for _, window in self.scored_windows(lines):
+            yield window
+
+    def top_windows(self, lines, token_budget: int, window_budget: int) -> list:
+        """
+        The most severe windows (each clipped to `window_budget` tokens) that fit in
+        `token_budget` tokens in total, in log order. Only that many windows are
+        held in memory; the others are counted in `dropped_windows`.
+        """
+        kept, total = [], 0
+        for position, (score, window) in enumerate(self.scored_windows(lines)):
+            window, tokens = clip_window(window, window_budget)
+            heapq.heappush(kept, (score, position, window, tokens))
+            total += tokens
+            while total > token_budget:
+                total -= heapq.heappop(kept)[3]
+                self.dropped_windows += 1
+        return [window for _, _, window, _ in sorted(kept, key=lambda item: item[1])]
+
+    def rare_lines(self, token_budget: int) -> str:
+        """
+        One line of each of the least frequent templates, rarest first, within
+        `token_budget` tokens: what stands out in a log no detector flagged.
+        """
+        lines, total = [], 0
+        for template, n in sorted(self.templates.items(), key=lambda item: item[1]):
+            line = f"{n}x {self.examples[template]}"
+            tokens = count_tokens(line) + 1
+            if total + tokens > token_budget:
+                break
+            lines.append(line)
+            total += tokens
+        return "\n".join(lines)
+
+    def overview(self) -> str:
+        """A short description of the whole log, for the final LLM prompt."""
+        detections = ", ".join(f"{name}: {n}" for name, n in self.detections.most_common()) or "none"
+        repeated = "\n".join(f"  {n}x {template[:200]}" for template, n in self.templates.most_common(5))
+        dropped = (f"{self.dropped_windows} lower-severity suspicious windows were left out of the analysis.\n"
+                   if self.dropped_windows else "")
+        return (
+            f"Log digest: {self.total_lines} lines, {len(self.templates)} distinct line templates.\n"
+            f"Detector hits: {detections}\n"
+            f"{dropped}"
+            f"Most frequent line templates:\n{repeated}"
+        )
+
+
+def clip_window(window: str, token_budget: int):
+    """Returns (window, tokens), keeping the head of a window over `token_budget` rather than dropping it."""
+    tokens = count_tokens(window)
+    if tokens > token_budget:
+        window = clip_tokens(window, token_budget)
+        tokens = count_tokens(window)
+    return window, tokens
+
+
+def pack_windows(windows, token_budget: int):
+    """Packs windows into text batches of at most `token_budget` tokens each."""
+    batch, batch_tokens = [], 0
+    for window in windows:
+        window, tokens = clip_window(window, token_budget)
+        if batch and batch_tokens + tokens > token_budget:
+            yield "\n...\n".join(batch)
+            batch, batch_tokens = [], 0
+        batch.append(window)
+        batch_tokens += tokens
+    if batch:
+        yield "\n...\n".join(batch)
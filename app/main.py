@@ -6,13 +6,22 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from dotenv import load_dotenv
 load_dotenv()
 
+import sqlite3
+from functools import lru_cache
 from langgraph.graph import START, StateGraph, END
 from app.state import GraphState
+from app.investigations import CHECKPOINT_DB
+from app.telemetry import traced_node
+from app.trace import render_trace, trace_entry
 from app.agents.threat_analyst import run_threat_analyst
 from app.agents.log_analyst import run_log_analyst
 from app.agents.consultant_agent import run_consultant_agent
 from app.agents.policy_agent import run_policy_agent
-from app.agents.supervisor import supervisor_chain
+from app.agents.supervisor import get_supervisor_chain, route_by_rules
+
+# The supervisor routes with the deterministic rule table. Set SUPERVISOR_LLM_FALLBACK=1
+# to let the LLM decide the (rare) states the table does not cover.
+SUPERVISOR_LLM_FALLBACK = os.getenv("SUPERVISOR_LLM_FALLBACK", "0") == "1"
 
 def run_supervisor(state: GraphState):
     """Runs the supervisor to decide the next step."""
@@ -20,14 +29,38 @@ def run_supervisor(state: GraphState):
     
     threat_detected = (state.get('intel') and state['intel'].is_malicious) or \
                       (state.get('log_summary') and state['log_summary'].contains_anomaly)
+    # With no logs attached there is nothing for the Log_Analyst to do, so treat the
+    # log analysis as complete instead of routing to it again and again.
+    log_summary_available = state.get('log_summary') or not state.get('logs')
+
+    next_node = route_by_rules(
+        intel_available=bool(state.get('intel')),
+        log_summary_available=bool(log_summary_available),
+        threat_detected=bool(threat_detected),
+        playbook_consulted=bool(state.get('playbook_steps')),
+        policy_generated=bool(state.get('policy')),
+    )
+    if next_node == "end_investigation" and not threat_detected and \
+            getattr(state.get('intel'), 'lookup_failed', False):
+        # No verdict is not a benign verdict: hand the alert to an analyst
+        print("---SUPERVISOR: NO THREAT INTELLIGENCE VERDICT, ESCALATING TO AN ANALYST---")
+        return {"next_node": next_node, "needs_analyst": True, "investigation_trace": [trace_entry(
+            "Supervisor", "No threat found in the logs, but the indicator could not be assessed. Needs analyst review.")]}
+    if next_node is not None:
+        return {"next_node": next_node}
 
-    response = supervisor_chain.invoke({
+    if not SUPERVISOR_LLM_FALLBACK:
+        print("---SUPERVISOR: STATE NOT COVERED BY RULES, ENDING INVESTIGATION---")
+        return {"next_node": "end_investigation"}
+
+    response = get_supervisor_chain().invoke({
         "intel_available": 'Yes' if state.get('intel') else 'No',
-        "log_summary_available": 'Yes' if state.get('log_summary') else 'No',
+        "log_summary_available": 'Yes' if log_summary_available else 'No',
         "policy_generated": 'Yes' if state.get('policy') else 'No',
         "threat_detected": 'Yes' if threat_detected else 'No',
-        "playbook_consulted": 'Yes' if state.get('playbook_steps') else 'No', # <-- ADD THIS LINE
-        "investigation_trace": "\n".join(state.get('investigation_trace', []))
+        "playbook_consulted": 'Yes' if state.get('playbook_steps') else 'No',
+        # Bounded to TRACE_TOKEN_BUDGET by the state's reducer (app/trace.py)
+        "investigation_trace": render_trace(state.get('investigation_trace')),
     })
     return {"next_node": response.next}
 
@@ -36,14 +69,31 @@ def route(state: GraphState) -> str:
     print(f"---ROUTING TO: {state['next_node']}---")
     return state.get('next_node', 'end_investigation')
 
+# "sequential" lets the supervisor call the analysts one after the other.
+# "parallel" runs Threat_Analyst and Log_Analyst at the same time, and the
+# supervisor only routes once both have finished. Selectable per investigation
+# with options.mode; INVESTIGATION_MODE sets the default.
+# The modes do not run the same agents: parallel always runs Log_Analyst, while
+# sequential skips it once the intel is malicious (a threat is already detected),
+# leaving log_summary None.
+INVESTIGATION_MODE = os.getenv("INVESTIGATION_MODE", "sequential")
+
+def route_start(state: GraphState):
+    """Picks the entry point(s) of the investigation."""
+    mode = (state.get('options') or {}).get('mode', INVESTIGATION_MODE)
+    if mode == "parallel":
+        print("---ROUTING TO: Threat_Analyst + Log_Analyst (parallel)---")
+        return ["threat_analyst", "log_analyst"]
+    return "supervisor"
 
-graph = (StateGraph(GraphState)
-        .add_node("threat_analyst", run_threat_analyst)
-        .add_node("log_analyst", run_log_analyst)
-        .add_node("consultant_agent", run_consultant_agent)
-        .add_node("policy_agent", run_policy_agent)
-        .add_node("supervisor", run_supervisor)
-        .add_edge(START, "supervisor")
+
+builder = (StateGraph(GraphState)
+        .add_node("threat_analyst", traced_node("threat_analyst", run_threat_analyst))
+        .add_node("log_analyst", traced_node("log_analyst", run_log_analyst))
+        .add_node("consultant_agent", traced_node("consultant_agent", run_consultant_agent))
+        .add_node("policy_agent", traced_node("policy_agent", run_policy_agent))
+        .add_node("supervisor", traced_node("supervisor", run_supervisor))
+        .add_conditional_edges(START, route_start, ["supervisor", "threat_analyst", "log_analyst"])
         .add_conditional_edges(
             "supervisor",
             route,
@@ -58,7 +108,23 @@ graph = (StateGraph(GraphState)
         .add_edge("threat_analyst", "supervisor")
         .add_edge("log_analyst", "supervisor")
         .add_edge("consultant_agent", "supervisor")
-        .add_edge("policy_agent", "supervisor")).compile()
+        .add_edge("policy_agent", "supervisor"))
+
+# Every finished node is checkpointed under the investigation's thread_id, so an
+# interrupted investigation (Groq 429, server restart) resumes where it stopped.
+# The checkpointer opens CHECKPOINT_DB, so the graph using it is built on first use.
+@lru_cache(maxsize=None)
+def get_graph():
+    """Returns the investigation graph, checkpointed to CHECKPOINT_DB unless it is empty."""
+    checkpointer = None
+    if CHECKPOINT_DB:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+        # The generous lock timeout is for worker processes sharing the file (app/worker.py)
+        checkpointer = SqliteSaver(sqlite3.connect(CHECKPOINT_DB, check_same_thread=False, timeout=30))
+    return builder.compile(checkpointer=checkpointer)
+
+# Batch runs are never resumed, so they are not checkpointed
+batch_graph = builder.compile()
 
 print("Graph Compiled Successfully!")
 
@@ -0,0 +1,219 @@
+import os
+import json
+import threading
+import time
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Get the root project directory (parent of app/)
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DB_PATH = os.path.join(root_dir, "vector_store")
+DEFAULT_LLM_MODEL = "llama-3.3-70b-versatile"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Embeddings are cached on disk by model + text hash, shared by ingestion and
+# queries. Set EMBEDDING_CACHE_DIR to an empty string to disable the cache.
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(root_dir, ".embedding_cache"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))
+# Texts per forward pass of the embedding model (scripts/ingest.py --encode-batch-size)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+# --- Shared, Lazily Built Resources ---
+# Nothing expensive happens at import time: the LLM clients, the embedding model
+# and the FAISS index are built on first use and shared by every agent.
+_lock = threading.RLock()
+_llms = {}
+_embeddings = None
+# Embedding models other than EMBEDDING_MODEL, for indexes ingested with them
+_other_embeddings = {}
+_vector_store = None
+_index_version = None
+
+# Seconds spent building each resource, for startup reporting
+load_timings = {}
+
+# Builds the chat client for (model, temperature); None means ChatGroq
+_llm_factory = None
+
+
+def _timed(name: str, build):
+    started = time.perf_counter()
+    resource = build()
+    load_timings[name] = round(time.perf_counter() - started, 3)
+    print(f"---LOADED {name.upper()} IN {load_timings[name]}s---")
+    return resource
+
+
+def _build_llm(model: str, temperature: float):
+    if _llm_factory is not None:
+        return _llm_factory(model=model, temperature=temperature)
+    from langchain_groq import ChatGroq
+    # 429s are retried by the LLM gateway, which also holds back the other calls
+    return ChatGroq(model=model, temperature=temperature, max_retries=0)
+
+
+def get_llm(model: str = DEFAULT_LLM_MODEL, temperature: float = 0, low_stakes: bool = False):
+    """
+    Returns the shared ChatGroq client for this model/temperature, behind the LLM
+    gateway (app/llm_gateway.py). Calls of a `low_stakes` client go to the small
+    model when the rate budget is tight.
+    """
+    key = (model, temperature, low_stakes)
+    if key not in _llms:
+        with _lock:
+            if key not in _llms:
+                from app.llm_gateway import GatewayChatModel, LLM_SMALL_MODEL
+
+                def build():
+                    small = _build_llm(LLM_SMALL_MODEL, temperature) if low_stakes else None
+                    return GatewayChatModel(inner=_build_llm(model, temperature), small=small)
+
+                _llms[key] = _timed(f"llm:{model}{':low-stakes' if low_stakes else ''}", build)
+    return _llms[key]
+
+
+def set_llm_factory(factory):
+    """
+    Replaces ChatGroq with `factory(model=..., temperature=...)` (e.g. a local fake
+    for benchmarks). Call it before the agent chains are first built.
+    """
+    global _llm_factory
+    with _lock:
+        _llm_factory = factory
+        _llms.clear()
+
+
+def _build_embeddings(model: str):
+    from langchain_huggingface import HuggingFaceEmbeddings
+    name = "embeddings" if model == EMBEDDING_MODEL else f"embeddings:{model}"
+    embeddings = _timed(name, lambda: HuggingFaceEmbeddings(
+        model_name=model,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE},
+    ))
+    if EMBEDDING_CACHE_DIR:
+        from app.embedding_cache import CachedEmbeddings
+        embeddings = CachedEmbeddings(embeddings, EMBEDDING_CACHE_DIR, model, max_entries=EMBEDDING_CACHE_SIZE)
+    return embeddings
+
+
+def get_embeddings(model: str = None):
+    """
+    Returns the shared sentence-transformers embedding model (EMBEDDING_MODEL unless
+    `model` names another one), wrapped in the embedding cache.
+    """
+    global _embeddings
+    if model and model != EMBEDDING_MODEL:
+        with _lock:
+            if model not in _other_embeddings:
+                _other_embeddings[model] = _build_embeddings(model)
+            return _other_embeddings[model]
+    if _embeddings is None:
+        with _lock:
+            if _embeddings is None:
+                _embeddings = _build_embeddings(EMBEDDING_MODEL)
+    return _embeddings
+
+
+def embedding_cache_stats() -> dict:
+    """Hit/miss counters of the embedding cache, or {} if it is not in use (yet)."""
+    stats = getattr(_embeddings, "stats", None)
+    return stats() if stats else {}
+
+
+def read_manifest(path: str = DB_PATH) -> dict:
+    """Returns the manifest written by scripts/ingest.py, or {} for older indexes."""
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def read_index_version(path: str = DB_PATH) -> str:
+    """Returns the version recorded by scripts/ingest.py in the index manifest."""
+    return read_manifest(path).get("version", "unversioned")
+
+
+def _load_vector_store(path: str = DB_PATH):
+    """Loads the FAISS index at `path`. Returns (store, version)."""
+    from langchain_community.vectorstores import FAISS
+    from app.faiss_index import apply_search_params
+    # DB_PATH is a symlink that scripts/ingest.py repoints: resolve it once so the
+    # manifest and both index files come from the same version
+    path = os.path.realpath(path)
+    manifest = read_manifest(path)
+    # Queries must be embedded with the model the index was built with
+    embeddings = get_embeddings((manifest.get("settings") or {}).get("embedding_model"))
+    store = _timed("vector_store", lambda: FAISS.load_local(
+        path, embeddings, allow_dangerous_deserialization=True
+    ))
+    # IVF / HNSW indexes search with the nprobe / efSearch chosen at ingest
+    apply_search_params(store.index, manifest.get("index"))
+    return store, manifest.get("version", "unversioned")
+
+
+def get_vector_store():
+    """Returns the FAISS playbook index, loading it from DB_PATH on first use."""
+    global _vector_store, _index_version
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                store, version = _load_vector_store()
+                _index_version = version
+                _vector_store = store
+    return _vector_store
+
+
+def get_index_version() -> str:
+    """Returns the version of the FAISS index currently in use."""
+    get_vector_store()
+    return _index_version
+
+
+def get_index():
+    """Returns (store, version) of the index in use, consistent even during a reload."""
+    get_vector_store()
+    with _lock:
+        return _vector_store, _index_version
+
+
+# --- Hot Reload ---
+# A new index from scripts/ingest.py is loaded next to the one serving, then
+# swapped in. Searches that already hold the old store finish on it.
+_reload_lock = threading.Lock()
+
+
+def reload_vector_store(force: bool = False) -> dict:
+    """
+    Loads the index at DB_PATH and swaps it in if its version differs from the
+    one serving (or `force`). Returns the version serving and the load time.
+    """
+    global _vector_store, _index_version
+    with _reload_lock:
+        previous = _index_version
+        if not force and _vector_store is not None and read_index_version() == previous:
+            return {"reloaded": False, "version": previous}
+        started = time.perf_counter()
+        store, version = _load_vector_store()
+        with _lock:
+            _vector_store, _index_version = store, version
+        load_s = round(time.perf_counter() - started, 3)
+        print(f"---SWAPPED VECTOR STORE {previous} -> {version} IN {load_s}s---")
+        return {"reloaded": True, "version": version, "previous_version": previous, "load_s": load_s}
+
+
+def warm_up() -> dict:
+    """
+    Builds every shared resource up front (e.g. from the server's startup event)
+    so the first investigation does not pay for it. A missing vector store is
+    reported but does not fail the warm-up.
+    """
+    get_llm()
+    try:
+        get_vector_store()
+    except Exception as e:
+        print(f"Warm-up could not load the vector store at {DB_PATH}: {e}")
+    return dict(load_timings)
@@ -0,0 +1,199 @@
+import os
+import time
+import sqlite3
+import ipaddress
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from app.investigations import CHECKPOINT_DB
+
+# Firewall rules from every investigation are collected here and exported in bulk.
+# They are kept in RULESET_DB (by default the investigations database) so they
+# survive a restart; set it to an empty string to keep them in memory only.
+RULESET_DB = os.getenv("RULESET_DB", CHECKPOINT_DB)
+IPTABLES_CHAIN = os.getenv("IPTABLES_CHAIN", "CYPHER")
+NFTABLES_TABLE = os.getenv("NFTABLES_TABLE", "cypher")
+# Both formats filter the traffic to the host and the traffic it routes
+FIREWALL_HOOKS = ("input", "forward")
+
+# ALLOW is applied before LOG and BLOCK, so an explicit allow always wins over the
+# other rules here. It does not bypass the host's own firewall rules in either
+# format: the iptables chain RETURNs to them, the nftables table is a separate one.
+ACTION_ORDER = ("ALLOW", "LOG", "BLOCK")
+IPTABLES_TARGETS = {"ALLOW": "RETURN", "LOG": "LOG", "BLOCK": "DROP"}
+NFTABLES_VERDICTS = {"ALLOW": "accept", "LOG": 'log prefix "cypher: "', "BLOCK": "drop"}
+
+
+class RuleSet:
+    """
+    The firewall rules generated across investigations. Duplicates are stored
+    once, and `compile()` collapses the source addresses of rules with the same
+    action and protocol into the fewest CIDR blocks, so the edge firewalls get
+    one compact update instead of thousands of /32 rules.
+    """
+
+    def __init__(self, path: str = None):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS firewall_rules (
+                    action TEXT NOT NULL,
+                    protocol TEXT NOT NULL,
+                    network TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    investigation_id TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (action, protocol, network)
+                )"""
+            )
+            # The version is bumped in the same transaction as every change, by any
+            # process sharing RULESET_DB, so exporters can skip unchanged rule sets
+            self._conn.execute("CREATE TABLE IF NOT EXISTS firewall_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.execute("INSERT OR IGNORE INTO firewall_meta (key, value) VALUES ('version', 0)")
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM firewall_meta WHERE key = 'version'").fetchone()[0]
+
+    def _bump_version(self):
+        self._conn.execute("UPDATE firewall_meta SET value = value + 1 WHERE key = 'version'")
+
+    def _count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM firewall_rules").fetchone()[0]
+
+    def add(self, rule, investigation_id: str = None) -> bool:
+        """Adds a FirewallRule. Returns False if it was already in the set."""
+        network = ipaddress.ip_network(rule.source_ip.strip(), strict=False)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO firewall_rules (action, protocol, network, name, investigation_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (rule.action, rule.protocol, str(network), rule.name, investigation_id, time.time()),
+            )
+            added = cursor.rowcount > 0
+            if added:
+                self._bump_version()
+        return added
+
+    def remove(self, source_ip: str) -> int:
+        """Removes every rule for this address or network. Returns how many were removed."""
+        network = str(ipaddress.ip_network(source_ip.strip(), strict=False))
+        with self._lock, self._conn:
+            removed = self._conn.execute("DELETE FROM firewall_rules WHERE network = ?", (network,)).rowcount
+            if removed:
+                self._bump_version()
+        return removed
+
+    def compile(self) -> dict:
+        """Returns {(action, protocol): [collapsed networks, IPv4 first]}."""
+        with self._lock:
+            rows = self._conn.execute("SELECT action, protocol, network FROM firewall_rules").fetchall()
+        groups = defaultdict(list)
+        for action, protocol, network in rows:
+            groups[(action, protocol)].append(ipaddress.ip_network(network))
+
+        compiled = {}
+        for key in sorted(groups, key=lambda k: (ACTION_ORDER.index(k[0]), k[1])):
+            networks = groups[key]
+            # collapse_addresses only accepts networks of one IP version at a time
+            compiled[key] = [
+                *ipaddress.collapse_addresses(n for n in networks if n.version == 4),
+                *ipaddress.collapse_addresses(n for n in networks if n.version == 6),
+            ]
+        return compiled
+
+    def stats(self) -> dict:
+        compiled = self.compile()
+        return {
+            "version": self.version,
+            "rules": self._count(),
+            "compiled_entries": sum(len(networks) for networks in compiled.values()),
+        }
+
+    def to_iptables(self, version: int = 4) -> str:
+        """
+        The rule set as `iptables-restore` (or `ip6tables-restore`, version=6) input.
+        It only replaces the IPTABLES_CHAIN chain, so it must be loaded with
+        --noflush, and the chain is hooked into INPUT and FORWARD separately
+        (iptables-restore cannot add a rule only if it is missing): see
+        `apply_script()`.
+        """
+        restore = "iptables-restore" if version == 4 else "ip6tables-restore"
+        lines = [
+            f"# Load with: {restore} --noflush < this file",
+            f"# Without --noflush, {restore} replaces the whole filter table.",
+            "*filter", f":{IPTABLES_CHAIN} - [0:0]", f"-F {IPTABLES_CHAIN}",
+        ]
+        for (action, protocol), networks in self.compile().items():
+            proto = "" if protocol == "ANY" else f" -p {protocol.lower()}"
+            for network in networks:
+                if network.version == version:
+                    lines.append(f"-A {IPTABLES_CHAIN} -s {network}{proto} -j {IPTABLES_TARGETS[action]}")
+        lines.append("COMMIT")
+        return "\n".join(lines) + "\n"
+
+    def to_nftables(self) -> str:
+        """
+        The rule set as an `nft -f` script. Addresses live in interval sets, and the
+        table is recreated so applying the script replaces the previous version.
+        """
+        sets, rules = [], []
+        for (action, protocol), networks in self.compile().items():
+            match = "" if protocol == "ANY" else f" meta l4proto {protocol.lower()}"
+            for version, family, addr_type in ((4, "ip", "ipv4_addr"), (6, "ip6", "ipv6_addr")):
+                elements = [str(n) for n in networks if n.version == version]
+                if not elements:
+                    continue
+                name = f"{action.lower()}_{protocol.lower()}_v{version}"
+                sets.append(f"\tset {name} {{\n\t\ttype {addr_type}\n\t\tflags interval\n"
+                            f"\t\telements = {{ {', '.join(elements)} }}\n\t}}")
+                rules.append(f"\t\t{family} saddr @{name}{match} {NFTABLES_VERDICTS[action]}")
+
+        chains = [f"\tchain {hook} {{\n\t\ttype filter hook {hook} priority 0; policy accept;\n"
+                  + "".join(rule + "\n" for rule in rules) + "\t}" for hook in FIREWALL_HOOKS]
+        return (f"table inet {NFTABLES_TABLE} {{}}\ndelete table inet {NFTABLES_TABLE}\n"
+                f"table inet {NFTABLES_TABLE} {{\n" + "".join(s + "\n" for s in sets)
+                + "\n".join(chains) + "\n}\n")
+
+    @staticmethod
+    def apply_script() -> str:
+        """
+        A shell script that loads iptables.rules and ip6tables.rules from its own
+        directory without touching other chains, and hooks the chain into INPUT
+        and FORWARD unless it already is. Safe to run after every export.
+        """
+        lines = ["#!/bin/sh", "set -e", 'cd "$(dirname "$0")"']
+        for command, rules in (("iptables", "iptables.rules"), ("ip6tables", "ip6tables.rules")):
+            lines.append(f"{command}-restore --noflush < {rules}")
+            for hook in FIREWALL_HOOKS:
+                jump = f"{hook.upper()} -j {IPTABLES_CHAIN}"
+                lines.append(f"{command} -C {jump} 2>/dev/null || {command} -I {jump}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: str) -> list:
+        """
+        Writes iptables.rules, ip6tables.rules, apply-iptables.sh (which loads the
+        previous two) and nftables.conf (for `nft -f`) atomically. Returns the paths.
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for filename, text in (("iptables.rules", self.to_iptables(4)), ("ip6tables.rules", self.to_iptables(6)),
+                               ("apply-iptables.sh", self.apply_script()), ("nftables.conf", self.to_nftables())):
+            path = os.path.join(directory, filename)
+            with open(path + ".tmp", "w") as f:
+                f.write(text)
+            if filename.endswith(".sh"):
+                os.chmod(path + ".tmp", 0o755)
+            os.replace(path + ".tmp", path)
+            paths.append(path)
+        return paths
+
+
+@lru_cache(maxsize=None)
+def get_ruleset() -> RuleSet:
+    """The shared rule set, opened on first use rather than at import."""
+    return RuleSet(RULESET_DB)
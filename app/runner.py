@@ -0,0 +1,48 @@
+import json
+import asyncio
+
+from app.main import get_graph
+from app.telemetry import InvestigationTelemetry
+from app.serialization import dumps
+from app.investigations import investigation_config
+
+
+async def run_investigation(executor, store, investigation_id: str, initial_state, publish) -> str:
+    """
+    Runs one investigation on `executor`, records its events in `store` and hands
+    each one to `await publish(event, payload, seq)`, where `seq` is the event's
+    position in the record (None for graph_finished / graph_error).
+    An `initial_state` of None resumes the investigation from its last checkpoint.
+    Returns the final status ("completed" or "failed").
+    """
+    telemetry = InvestigationTelemetry(investigation_id)
+    status = "failed"
+    try:
+        priority = ((initial_state or {}).get("options") or {}).get("priority")
+        config = investigation_config(investigation_id, telemetry, priority)
+        # Store calls run on a thread: the file is shared with the checkpointer and
+        # the workers, and waiting for its lock must not stall the event loop.
+        # A resumed investigation continues the numbering of its recorded events
+        record = await asyncio.to_thread(store.get, investigation_id) if initial_state is None else None
+        seq = len(record["events"]) if record else 0
+        async for event in executor.stream(get_graph(), initial_state, config):
+            # Each event is the state update of one node; serialize it once for the
+            # record and the clients
+            payload = dumps({**event, "telemetry": telemetry.summary()})
+            await asyncio.to_thread(store.append_event, investigation_id, payload)
+            seq += 1
+            await publish('graph_event', payload, seq)
+
+        status = "completed"
+        await asyncio.to_thread(store.set_status, investigation_id, "completed")
+        await publish('graph_finished', dumps({'investigation_id': investigation_id, 'telemetry': telemetry.summary()}), None)
+
+    except Exception as e:
+        print(f"Error during graph execution: {e}")
+        await asyncio.to_thread(store.set_status, investigation_id, "failed")
+        await publish('graph_error', dumps({'error': str(e), 'investigation_id': investigation_id}), None)
+    finally:
+        # One structured log line per investigation
+        print(json.dumps({"event": "investigation_finished", "investigation_id": investigation_id,
+                          "status": status, **telemetry.summary()}))
+    return status
@@ -0,0 +1,38 @@
+import orjson
+from pydantic import BaseModel
+
+def convert_pydantic_to_dict(obj):
+    """
+    Recursively converts Pydantic models in an object to dictionaries.
+    """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, dict):
+        return {k: convert_pydantic_to_dict(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [convert_pydantic_to_dict(i) for i in obj]
+    return obj
+
+def _default(obj):
+    # orjson calls this only for types it cannot serialize natively
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(obj) -> bytes:
+    """Serializes an object (Pydantic models included) to JSON in a single pass."""
+    return orjson.dumps(obj, default=_default)
+
+class OrjsonModule:
+    """
+    The `json` module interface python-socketio expects, backed by orjson. Payloads
+    that were already serialized can be emitted as `orjson.Fragment(payload)`
+    and are then embedded as-is instead of being encoded again.
+    """
+    @staticmethod
+    def dumps(obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=_default).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
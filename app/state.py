@@ -1,6 +1,8 @@
 from typing import TypedDict, Annotated, List, Dict, Any
 from pydantic import BaseModel # Import BaseModel for nested Pydantic models
 
+from app.trace import merge_trace
+
 # Forward reference for models defined later
 class ThreatIntel(BaseModel): ...
 class LogAnalysis(BaseModel): ...
@@ -15,19 +17,38 @@ class GraphState(TypedDict):
         alert: The initial security alert.
         indicator: The data being investigated.
         intel: Threat intelligence from the Threat_Analyst.
-        investigation_trace: A log of the steps taken.
+        ioc_intel: Per-indicator ThreatIntel for every IOC in the alert and logs,
+            keyed by the indicator (see app/ioc.py).
+        investigation_trace: A log of the steps taken, as structured entries kept
+            within a token budget (see app/trace.py).
         next_node: The supervisor's routing decision.
         logs: Raw logs for analysis.
         log_summary: The summary from the Log_Analyst.
         policy: The security policy generated by the Policy_Agent.
         playbook_steps: Advice and next steps retrieved from the internal knowledge base.
+        options: Per-investigation execution options (e.g. `intel_prose`, `ioc_lookups`).
+        needs_analyst: Set when the investigation ended without a verdict (e.g. the
+            threat intelligence lookup failed), so a human has to review it.
     """
     alert: Dict[str, Any]
     indicator: str
     intel: Any
-    investigation_trace: Annotated[List[str], lambda x, y: x + y]
+    ioc_intel: Dict[str, Any]
+    investigation_trace: Annotated[List[Dict[str, Any]], merge_trace]
     next_node: str
     logs: str
     log_summary: Any
     policy: Any # Will hold our FirewallRule
-    playbook_steps: List[str]
\ No newline at end of file
+    playbook_steps: List[str]
+    options: Dict[str, Any]
+    needs_analyst: bool
+
+
+def make_initial_state(data: Dict[str, Any], source: str = "manual") -> Dict[str, Any]:
+    """Builds the graph's initial state from an incoming alert payload."""
+    return {
+        "alert": {"source": source, "details": data.get("prompt")},
+        "indicator": data.get("indicator") or "",
+        "logs": data.get("logs") or "",
+        "options": data.get("options") or {},
+    }
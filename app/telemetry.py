@@ -0,0 +1,286 @@
+import time
+import threading
+from contextvars import ContextVar
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# --- 1. Prometheus Metrics ---
+# A tiny in-process registry rendered in the Prometheus text format, so the
+# backend does not need a metrics client library.
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_str(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name, self.help_text = name, help_text
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_label_str(k)} {v}" for k, v in sorted(self._values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name, self.help_text, self.buckets = name, help_text, buckets
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_label_str(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_label_str(key + (('le', '+Inf'),))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_label_str(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_label_str(key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_gauges(self, collect):
+        """`collect()` returns [(name, help, {labels}, value), ...] evaluated at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        seen = set()
+        for collect in self._collectors:
+            for name, help_text, labels, value in collect():
+                if name not in seen:
+                    lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+                    seen.add(name)
+                lines.append(f"{name}{_label_str(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+NODE_SECONDS = registry.histogram("cypher_node_duration_seconds", "Wall time of each graph node.")
+QUEUE_WAIT_SECONDS = registry.histogram("cypher_queue_wait_seconds", "Time investigations waited for a worker slot.")
+LLM_SECONDS = registry.histogram("cypher_llm_duration_seconds", "Duration of each LLM call.")
+LLM_TOKENS = registry.counter("cypher_llm_tokens_total", "LLM tokens used, by node and kind (prompt/completion).")
+LLM_RETRIES = registry.counter("cypher_llm_retries_total", "Retried LLM calls.")
+LLM_QUEUE_SECONDS = registry.histogram("cypher_llm_queue_wait_seconds", "Time LLM calls waited for budget, by priority.")
+LLM_RATE_LIMITED = registry.counter("cypher_llm_rate_limited_total", "LLM calls rejected with a 429.")
+LLM_DOWNGRADED = registry.counter("cypher_llm_downgraded_total", "Low-stakes LLM calls sent to the small model, by model.")
+TOOL_SECONDS = registry.histogram("cypher_tool_duration_seconds", "Duration of each tool call.")
+CACHE_LOOKUPS = registry.counter("cypher_cache_lookups_total", "Cache lookups, by cache and result (hit/miss).")
+EMIT_SECONDS = registry.histogram("cypher_emit_latency_seconds", "Time from an event being produced to it being sent to the client.",
+                                  buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+ALERTS = registry.counter("cypher_alerts_total", "Alerts received, by outcome (investigated/subscribed/replayed).")
+EMITTED_EVENTS = registry.counter("cypher_emitted_events_total", "Socket.IO events, by outcome (sent/coalesced/dropped).")
+
+
+# --- 2. Per-Investigation Telemetry ---
+current_telemetry = ContextVar("current_telemetry", default=None)
+
+
+class InvestigationTelemetry:
+    """Collects the timings, token counts, retries and cache hits of one investigation."""
+
+    def __init__(self, investigation_id: str = None):
+        self.investigation_id = investigation_id
+        self.started = time.perf_counter()
+        self.queue_wait_s = 0.0
+        self.llm_wait_s = 0.0
+        self.nodes = []
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.prompt_tokens_by_node = defaultdict(int)
+        self.tool_calls = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+
+    def record_node(self, node: str, seconds: float):
+        with self._lock:
+            self.nodes.append({"node": node, "seconds": round(seconds, 3)})
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "elapsed_s": round(time.perf_counter() - self.started, 3),
+                "queue_wait_s": round(self.queue_wait_s, 3),
+                "llm_wait_s": round(self.llm_wait_s, 3),
+                "nodes": list(self.nodes),
+                "llm_calls": self.llm_calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "prompt_tokens_by_node": dict(self.prompt_tokens_by_node),
+                "tool_calls": self.tool_calls,
+                "retries": self.retries,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+            }
+
+    def callback_handler(self) -> "TelemetryCallbackHandler":
+        return TelemetryCallbackHandler(self)
+
+
+def record_cache_lookup(cache: str, hit: bool, count: int = 1):
+    """Counts cache lookups globally and for the investigation running in this context."""
+    if count <= 0:
+        return
+    CACHE_LOOKUPS.inc(count, cache=cache, result="hit" if hit else "miss")
+    telemetry = current_telemetry.get()
+    if telemetry is not None:
+        with telemetry._lock:
+            if hit:
+                telemetry.cache_hits += count
+            else:
+                telemetry.cache_misses += count
+
+
+def record_tool_call(tool: str, seconds: float):
+    """
+    Records a tool call made without LangChain's tool callbacks (the Threat_Analyst
+    calls the lookups directly), globally and for the investigation in this context.
+    """
+    TOOL_SECONDS.observe(seconds, tool=tool)
+    telemetry = current_telemetry.get()
+    if telemetry is not None:
+        with telemetry._lock:
+            telemetry.tool_calls += 1
+
+
+def _token_usage(response) -> tuple:
+    """Extracts (prompt, completion) tokens from a Groq LLMResult."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+    return 0, 0
+
+
+def _model_name(kwargs: dict) -> str:
+    params = kwargs.get("invocation_params") or {}
+    return params.get("model") or params.get("model_name") or "unknown"
+
+
+def _node_name(kwargs: dict) -> str:
+    # LangGraph tags every call made inside a node with the node's name
+    return (kwargs.get("metadata") or {}).get("langgraph_node", "unknown")
+
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """Records every LLM and tool call made while an investigation runs."""
+
+    def __init__(self, telemetry: InvestigationTelemetry):
+        self.telemetry = telemetry
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), _model_name(kwargs), _node_name(kwargs))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), _model_name(kwargs), _node_name(kwargs))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started, model, node = self._started.pop(run_id, (None, "unknown", "unknown"))
+        # The gateway may have sent a low-stakes call to the small model
+        model = (response.llm_output or {}).get("model_name") or model
+        if started is not None:
+            LLM_SECONDS.observe(time.perf_counter() - started, model=model)
+        prompt_tokens, completion_tokens = _token_usage(response)
+        LLM_TOKENS.inc(prompt_tokens, model=model, node=node, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, model=model, node=node, kind="completion")
+        with self.telemetry._lock:
+            self.telemetry.llm_calls += 1
+            self.telemetry.prompt_tokens += prompt_tokens
+            self.telemetry.prompt_tokens_by_node[node] += prompt_tokens
+            self.telemetry.completion_tokens += completion_tokens
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        LLM_RETRIES.inc()
+        with self.telemetry._lock:
+            self.telemetry.retries += 1
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._started[run_id] = (time.perf_counter(), (serialized or {}).get("name", "unknown"), _node_name(kwargs))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        started, tool, _ = self._started.pop(run_id, (None, "unknown", None))
+        if started is not None:
+            TOOL_SECONDS.observe(time.perf_counter() - started, tool=tool)
+        with self.telemetry._lock:
+            self.telemetry.tool_calls += 1
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+
+# --- 3. Node Wrapper ---
+def traced_node(name: str, fn):
+    """
+    Wraps a graph node so its wall time lands in the node histogram and in the
+    investigation's telemetry (passed via config["configurable"]["telemetry"]).
+    """
+    # No functools.wraps: LangGraph inspects the signature to decide whether to pass `config`
+    def wrapper(state, config):
+        telemetry = (config.get("configurable") or {}).get("telemetry")
+        token = current_telemetry.set(telemetry)
+        started = time.perf_counter()
+        try:
+            return fn(state)
+        finally:
+            seconds = time.perf_counter() - started
+            NODE_SECONDS.observe(seconds, node=name)
+            if telemetry is not None:
+                telemetry.record_node(name, seconds)
+            current_telemetry.reset(token)
+    wrapper.__name__ = getattr(fn, "__name__", name)
+    return wrapper
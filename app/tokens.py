@@ -0,0 +1,39 @@
+from functools import lru_cache
+
+import tiktoken
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    # cl100k_base is not Llama's tokenizer, but it is close enough for budgeting
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The BPE file is downloaded on first use; fall back to an estimate offline
+        print(f"tiktoken unavailable ({e}), estimating token counts from length.")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Approximate number of LLM tokens in `text`."""
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def clip_tokens(text: str, max_tokens: int) -> str:
+    """The longest head of `text` that counts at most `max_tokens` tokens."""
+    encoding = _encoding()
+    if encoding is None:
+        return text if count_tokens(text) <= max_tokens else text[:max(0, max_tokens - 1) * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    # A cut through a multi-byte character can re-encode longer, so trim until it fits
+    while max_tokens > 0:
+        clipped = encoding.decode(tokens[:max_tokens], errors="ignore")
+        if count_tokens(clipped) <= max_tokens:
+            return clipped
+        max_tokens -= 1
+    return ""
@@ -1,23 +1,150 @@
 import os
-import requests
 import json
+import time
+import asyncio
+import threading
+
+import httpx
 from langchain_core.tools import tool
 
-@tool
-def virustotal_ip_lookup(ip_address: str) -> str:
+from app.cache import TTLCache, SQLiteStore
+from app.ioc import is_internal_domain
+from app.telemetry import record_tool_call
+
+# --- VirusTotal Client Settings ---
+# VT_API_URL can point at a local stub server for tests and benchmarks.
+VT_API_URL = os.getenv("VT_API_URL", "https://www.virustotal.com/api/v3").rstrip("/")
+VT_TIMEOUT = float(os.getenv("VT_TIMEOUT", "10"))
+VT_MAX_CONNECTIONS = int(os.getenv("VT_MAX_CONNECTIONS", "20"))
+
+# The VirusTotal endpoint for each IOC type (see app/ioc.py)
+VT_ENDPOINTS = {"ip": "ip_addresses", "domain": "domains", "hash": "files"}
+
+# --- Rate Limit ---
+# Lookups draw from a token bucket matched to the API key's quota (the public API
+# allows 4 requests a minute; raise VT_RATE_PER_MIN for a premium key, or set it
+# to 0 to disable the limit). VT_RATE_BURST is how many can go out back to back.
+VT_RATE_PER_MIN = float(os.getenv("VT_RATE_PER_MIN", "4"))
+VT_RATE_BURST = int(os.getenv("VT_RATE_BURST", "4"))
+
+# --- Lookup Deadlines ---
+# An investigated indicator waits its turn for a token for up to VT_LOOKUP_DEADLINE
+# seconds. The other IOCs of an alert are best effort: they never wait for a token
+# (and leave one for the next investigated indicator), and whatever has not
+# answered after IOC_LOOKUP_DEADLINE seconds is reported as not looked up.
+VT_LOOKUP_DEADLINE = float(os.getenv("VT_LOOKUP_DEADLINE", "120"))
+IOC_LOOKUP_DEADLINE = float(os.getenv("IOC_LOOKUP_DEADLINE", "5"))
+
+# --- Reputation Cache ---
+# Scan storms repeat the same IPs many times a minute, so lookups are cached in an
+# LRU with a per-entry TTL. Set VT_CACHE_DB to a file path to also keep the cache
+# on disk across restarts. "Not found" answers are cached for a shorter time, and
+# transient errors (429, 5xx, timeouts) are not cached at all.
+VT_CACHE_TTL = float(os.getenv("VT_CACHE_TTL", "3600"))
+VT_CACHE_NEGATIVE_TTL = float(os.getenv("VT_CACHE_NEGATIVE_TTL", "300"))
+
+reputation_cache = TTLCache(
+    max_entries=int(os.getenv("VT_CACHE_SIZE", "10000")),
+    ttl=VT_CACHE_TTL,
+    store=SQLiteStore(os.getenv("VT_CACHE_DB"), table="vt_reputation") if os.getenv("VT_CACHE_DB") else None,
+    name="virustotal",
+)
+
+
+class TokenBucket:
+    """An asyncio token bucket: `acquire()` waits until a request may be sent."""
+
+    def __init__(self, rate_per_min: float, burst: int):
+        self.rate = rate_per_min / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def try_acquire(self, reserve: int = 0) -> bool:
+        """Takes a token only if one is available now and `reserve` more are left for `acquire()`."""
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self.tokens >= 1 + reserve:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class _LookupLoop:
     """
-    Performs a lookup for a given IP address using the VirusTotal API.
-    Returns a JSON string with a summary of the findings, including analysis stats and reputation.
+    A background event loop that owns the pooled async HTTP client, so the
+    (synchronous) graph nodes can fan lookups out concurrently and wait for all
+    of them: an alert with ten indicators takes as long as its slowest lookup.
     """
-    api_key = os.getenv("VT_API_KEY")
-    if not api_key:
-        return "Error: VirusTotal API key not found in environment variables."
-    
-    url = f"https://www.virustotal.com/api/v3/ip_addresses/{ip_address}"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self.client = None
+        self.bucket = TokenBucket(VT_RATE_PER_MIN, VT_RATE_BURST)
+        # Cache key -> [future of the request in flight, callers waiting on it], so
+        # duplicates share it
+        self.inflight = {}
+
+    def run(self, coro):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self.client = httpx.AsyncClient(
+                    timeout=VT_TIMEOUT,
+                    limits=httpx.Limits(max_connections=VT_MAX_CONNECTIONS,
+                                        max_keepalive_connections=VT_MAX_CONNECTIONS),
+                )
+                threading.Thread(target=self._loop.run_forever, name="vt-lookups", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+
+_lookups = _LookupLoop()
+
+
+def _cache_key(ioc_type: str, value: str) -> str:
+    # IPs keep their bare key so existing cache entries stay valid
+    return value if ioc_type == "ip" else f"{ioc_type}:{value}"
+
+
+# Tool outputs for IOCs that were not sent to VirusTotal
+NOT_LOOKED_UP_INTERNAL = "Not looked up: internal names are not sent to VirusTotal."
+NOT_LOOKED_UP_RATE_LIMIT = "Not looked up: no VirusTotal request left in the rate limit."
+NOT_LOOKED_UP_DEADLINE = "Not looked up: the VirusTotal lookup did not finish in time."
+
+
+async def _fetch_report(ioc_type: str, value: str, api_key: str, acquired: bool = False) -> dict:
+    """
+    Calls VirusTotal and returns {"result": <tool output>, "ttl": <cache TTL or None>}.
+    Waits for a rate limit token unless the caller `acquired` one already.
+    """
+    url = f"{VT_API_URL}/{VT_ENDPOINTS[ioc_type]}/{value}"
     headers = {"x-apikey": api_key}
 
     try:
-        response = requests.get(url, headers=headers)
+        if not acquired:
+            await _lookups.bucket.acquire()
+        response = await _lookups.client.get(url, headers=headers)
         response.raise_for_status() # Raise an HTTPError for bad responses (4xx, 5xx)
         data = response.json()
 
@@ -28,7 +155,8 @@ def virustotal_ip_lookup(ip_address: str) -> str:
         reputation = attributes.get("reputation")
 
         summary = {
-            "ip_address": ip_address,
+            "indicator": value,
+            "type": ioc_type,
             "reputation": reputation,
             "analysis_stats": {
                 "harmless": analysis_stats.get("harmless", 0),
@@ -38,12 +166,107 @@ def virustotal_ip_lookup(ip_address: str) -> str:
             },
             "is_malicious": analysis_stats.get("malicious", 0) > 0 or analysis_stats.get("suspicious", 0) > 0
         }
+        if ioc_type == "ip":
+            summary["ip_address"] = value
 
-        return json.dumps(summary)
+        return {"result": json.dumps(summary), "ttl": VT_CACHE_TTL}
 
-    except requests.exceptions.HTTPError as http_err:
-        return f"HTTP error occurred: {http_err}"
+    except httpx.HTTPStatusError as http_err:
+        not_found = http_err.response.status_code == 404
+        return {"result": f"HTTP error occurred: {http_err}", "ttl": VT_CACHE_NEGATIVE_TTL if not_found else None}
     except Exception as e:
-        return f"An unexpected error occurred: {e}"
+        return {"result": f"An unexpected error occurred: {e}", "ttl": None}
+
+
+def _finish_lookup(key: str, future):
+    if _lookups.inflight.get(key, [None])[0] is future:
+        del _lookups.inflight[key]
+    if not future.cancelled() and future.result()["ttl"] is not None:
+        reputation_cache.set(key, future.result(), ttl=future.result()["ttl"])
+
+
+async def _lookup(ioc_type: str, value: str, api_key: str, best_effort: bool = False) -> str:
+    key = _cache_key(ioc_type, value)
+    entry = _lookups.inflight.get(key)
+    if entry is None:
+        # A best-effort lookup never queues for a token, and leaves one for the
+        # next investigated indicator
+        acquired = best_effort and _lookups.bucket.try_acquire(reserve=1)
+        if best_effort and not acquired:
+            return NOT_LOOKED_UP_RATE_LIMIT
+        future = asyncio.ensure_future(_fetch_report(ioc_type, value, api_key, acquired))
+        entry = _lookups.inflight[key] = [future, 0]
+        future.add_done_callback(lambda f: _finish_lookup(key, f))
+    future = entry[0]
+    entry[1] += 1
+    try:
+        # Shielded, so a caller giving up does not cancel the request for the others
+        return (await asyncio.shield(future))["result"]
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0 and not future.done():
+            # Nobody is waiting for the answer any more: do not spend a request on it
+            del _lookups.inflight[key]
+            future.cancel()
 
-        
\ No newline at end of file
+
+async def _lookup_all(iocs: list, api_key: str, best_effort: bool, deadline: float) -> list:
+    tasks = [asyncio.ensure_future(_lookup(ioc["type"], ioc["value"], api_key, best_effort)) for ioc in iocs]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+    return [task.result() if task in done else NOT_LOOKED_UP_DEADLINE for task in tasks]
+
+
+def lookup_indicators(iocs: list, best_effort: bool = False) -> dict:
+    """
+    Looks up [{"type", "value"}] IOCs concurrently, within the rate limit.
+    Returns {value: tool output}, where the output is the JSON summary or an
+    error string, as `virustotal_ip_lookup` returns it.
+
+    Best-effort lookups (an alert's secondary IOCs) are skipped when the rate
+    limit has no token to spare, and give up after IOC_LOOKUP_DEADLINE seconds
+    instead of VT_LOOKUP_DEADLINE. Each call counts as one tool call.
+    """
+    if not iocs:
+        return {}
+    started = time.perf_counter()
+    try:
+        return _lookup_indicators(iocs, best_effort)
+    finally:
+        record_tool_call("virustotal_lookup", time.perf_counter() - started)
+
+
+def _lookup_indicators(iocs: list, best_effort: bool) -> dict:
+    api_key = os.getenv("VT_API_KEY")
+    if not api_key:
+        return {ioc["value"]: "Error: VirusTotal API key not found in environment variables." for ioc in iocs}
+
+    results, missing = {}, []
+    for ioc in iocs:
+        if ioc["type"] == "domain" and is_internal_domain(ioc["value"]):
+            results[ioc["value"]] = NOT_LOOKED_UP_INTERNAL
+            continue
+        found, report = reputation_cache.get(_cache_key(ioc["type"], ioc["value"]))
+        if found:
+            results[ioc["value"]] = report["result"]
+        elif ioc["value"] not in results:
+            results[ioc["value"]] = None
+            missing.append(ioc)
+
+    if missing:
+        deadline = IOC_LOOKUP_DEADLINE if best_effort else VT_LOOKUP_DEADLINE
+        for ioc, result in zip(missing, _lookups.run(_lookup_all(missing, api_key, best_effort, deadline))):
+            results[ioc["value"]] = result
+    return results
+
+
+@tool
+def virustotal_ip_lookup(ip_address: str) -> str:
+    """
+    Performs a lookup for a given IP address using the VirusTotal API.
+    Returns a JSON string with a summary of the findings, including analysis stats and reputation.
+    """
+    ip_address = ip_address.strip()
+    # The tool callbacks already record this call
+    return _lookup_indicators([{"type": "ip", "value": ip_address}], best_effort=False)[ip_address]
@@ -0,0 +1,68 @@
+import os
+from collections import Counter
+
+from app.tokens import count_tokens
+
+# The investigation trace is kept within this many tokens. When it grows past the
+# budget, the oldest entries are folded into one short summary entry, so prompts
+# that include the trace stop growing with every hop.
+TRACE_TOKEN_BUDGET = int(os.getenv("TRACE_TOKEN_BUDGET", "300"))
+# Entries that are never compacted (the latest conclusions of the agents)
+TRACE_KEEP_RECENT = int(os.getenv("TRACE_KEEP_RECENT", "4"))
+
+SUMMARY_AGENT = "Summary"
+
+
+def trace_entry(agent: str, message: str) -> dict:
+    """A structured trace entry, with its token count precomputed for the budget."""
+    return {"agent": agent, "message": message, "tokens": count_tokens(f"{agent}: {message}")}
+
+
+def _as_entry(item) -> dict:
+    # Checkpoints written before structured entries hold plain strings
+    if isinstance(item, dict):
+        return item
+    agent, _, message = str(item).partition(" conclusion: ")
+    return trace_entry(agent, message) if message else trace_entry("Trace", str(item))
+
+
+def _shorten(message: str, limit: int = 80) -> str:
+    return message if len(message) <= limit else message[: limit - 3].rstrip() + "..."
+
+
+def compact(entries: list, budget: int = None, keep_recent: int = None) -> list:
+    """
+    Returns the entries within `budget` tokens: the newest `keep_recent` entries
+    are kept as they are and everything older is summarized in one entry.
+    """
+    budget = TRACE_TOKEN_BUDGET if budget is None else budget
+    keep_recent = TRACE_KEEP_RECENT if keep_recent is None else keep_recent
+    if sum(entry["tokens"] for entry in entries) <= budget or len(entries) <= keep_recent:
+        return entries
+
+    split = len(entries) - keep_recent
+    older, recent = entries[:split], entries[split:]
+    compacted = sum(entry.get("compacted", 1) for entry in older)
+    by_agent = Counter()
+    for entry in older:
+        by_agent.update(entry.get("by_agent") or {entry["agent"]: 1})
+
+    steps = "; ".join(_shorten(entry["message"]) for entry in older if entry["agent"] != SUMMARY_AGENT)
+    summary = trace_entry(SUMMARY_AGENT, f"{compacted} earlier steps: {steps}")
+    if summary["tokens"] + sum(entry["tokens"] for entry in recent) > budget:
+        # Still too long: keep only who did how much
+        counts = ", ".join(f"{agent} x{n}" for agent, n in by_agent.most_common())
+        summary = trace_entry(SUMMARY_AGENT, f"{compacted} earlier steps by {counts}.")
+    summary["compacted"] = compacted
+    summary["by_agent"] = dict(by_agent)
+    return [summary] + recent
+
+
+def merge_trace(existing: list, new: list) -> list:
+    """Reducer for GraphState.investigation_trace: appends, then compacts to the budget."""
+    return compact([_as_entry(item) for item in (existing or [])] + [_as_entry(item) for item in (new or [])])
+
+
+def render_trace(entries: list) -> str:
+    """The trace as prompt text, one line per entry."""
+    return "\n".join(f"{entry['agent']}: {entry['message']}" for entry in map(_as_entry, entries or []))
@@ -0,0 +1,128 @@
+"""
+Graph-executor worker for the scale-out mode. Claims investigations from the
+job queue that the API servers fill, runs them, and emits their events to the
+clients through the SQLite pub/sub channel, whichever API process holds them:
+
+    JOB_QUEUE_DB=/data/jobs.sqlite python -m app.worker --concurrency 8
+
+Start as many workers as the machine has cores to spare; the API servers run
+with the same JOB_QUEUE_DB (e.g. `uvicorn app.api.server:socket_app --workers 4`,
+clients on the websocket transport). A worker that dies leaves its jobs to be
+claimed by another one once their lease runs out.
+
+The LLM budget is per process: set LLM_BUDGET_SHARES to the number of API
+server and worker processes sharing the Groq key. Workers check the playbook
+index every INDEX_POLL_INTERVAL seconds and swap in a new one from ingest.py.
+"""
+import sys
+import os
+# Add the parent directory to Python path to enable imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uuid
+import socket
+import asyncio
+import argparse
+
+from app.investigations import CHECKPOINT_DB, InvestigationStore, investigation_config
+from app.job_queue import JOB_QUEUE_DB, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL, JobQueue
+from app.executor import MAX_CONCURRENT_INVESTIGATIONS, InvestigationExecutor
+from app.api.pubsub import SQLitePubSubManager
+from app.serialization import dumps
+from app.runner import run_investigation
+from app.main import get_graph
+from app import resources
+
+# Seconds between checks for a new playbook index (0: never reload)
+INDEX_POLL_INTERVAL = float(os.getenv("INDEX_POLL_INTERVAL", "30"))
+
+
+def has_checkpoint(investigation_id: str) -> bool:
+    return bool(get_graph().get_state(investigation_config(investigation_id)).values)
+
+
+async def run_job(job: dict, queue: JobQueue, store: InvestigationStore, manager: SQLitePubSubManager, executor):
+    investigation_id = job["investigation_id"]
+
+    async def publish(event, payload, seq=None):
+        await manager.publish_event(investigation_id, event, payload, seq)
+
+    if job["attempts"] > JOB_MAX_ATTEMPTS:
+        # Whatever it is, it keeps taking workers down with it
+        await asyncio.to_thread(store.set_status, investigation_id, "failed")
+        await publish('graph_error', dumps({'error': f"Investigation abandoned after {JOB_MAX_ATTEMPTS} attempts",
+                                            'investigation_id': investigation_id}))
+        status = "failed"
+    else:
+        initial_state = job["initial_state"]
+        if job["attempts"] > 1 and initial_state is not None and await asyncio.to_thread(has_checkpoint, investigation_id):
+            # A previous worker died mid-investigation: continue from its last node
+            initial_state = None
+        status = await run_investigation(executor, store, investigation_id, initial_state, publish)
+
+    await asyncio.to_thread(queue.finish, job["id"], "done" if status == "completed" else "failed")
+    await manager.close_room(investigation_id, namespace="/")
+
+
+async def serve(concurrency: int, worker_id: str):
+    queue = JobQueue(JOB_QUEUE_DB)
+    store = InvestigationStore(CHECKPOINT_DB)
+    manager = SQLitePubSubManager(JOB_QUEUE_DB, write_only=True)
+    executor = InvestigationExecutor(max_concurrent=concurrency)
+    running = {}
+
+    async def renew_leases():
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            await asyncio.to_thread(queue.renew, list(running), worker_id)
+
+    async def reload_index():
+        while True:
+            await asyncio.sleep(INDEX_POLL_INTERVAL)
+            # Not loaded yet: the first investigation loads the current version
+            if resources._vector_store is None:
+                continue
+            try:
+                result = await asyncio.to_thread(resources.reload_vector_store)
+            except Exception as e:
+                print(f"Could not reload the playbook index, still serving version {resources._index_version}: {e}")
+                continue
+            if result["reloaded"]:
+                print(f"Playbook index version {result['version']} is now serving (loaded in {result['load_s']}s)")
+
+    print(f"---WORKER {worker_id} READY ({concurrency} concurrent investigations)---")
+    renewer = asyncio.create_task(renew_leases())
+    reloader = asyncio.create_task(reload_index()) if INDEX_POLL_INTERVAL > 0 else None
+    try:
+        while True:
+            if len(running) < concurrency:
+                job = await asyncio.to_thread(queue.claim, worker_id)
+                if job is not None:
+                    task = asyncio.create_task(run_job(job, queue, store, manager, executor))
+                    running[job["id"]] = task
+                    task.add_done_callback(lambda _, job_id=job["id"]: running.pop(job_id, None))
+                    continue
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+    finally:
+        renewer.cancel()
+        if reloader is not None:
+            reloader.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run investigations from the shared job queue.")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_INVESTIGATIONS,
+                        help="Investigations this worker runs at the same time.")
+    parser.add_argument("--id", default=f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}",
+                        help="Worker name recorded on claimed jobs.")
+    args = parser.parse_args()
+    if not JOB_QUEUE_DB or not CHECKPOINT_DB:
+        parser.error("JOB_QUEUE_DB and CHECKPOINT_DB must point at files shared with the API servers.")
+    try:
+        asyncio.run(serve(args.concurrency, args.id))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
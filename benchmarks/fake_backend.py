@@ -0,0 +1,206 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+import http.server
+from typing import Any, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from app.tokens import count_tokens
+from app.log_preprocessing import FAILED_LOGIN, SENSITIVE_FILE, UNUSUAL_COMMAND
+
+# --- 1. Fake ChatGroq ---
+# Answers every prompt of the agents deterministically from the prompt text, after
+# sleeping for a configurable latency, and reports token usage like Groq does.
+
+def _flag(text: str, label: str) -> bool:
+    match = re.search(rf"{label}:\s*(Yes|No)", text)
+    return bool(match) and match.group(1) == "Yes"
+
+
+def _fake_route(text: str) -> dict:
+    from app.agents.supervisor import route_by_rules
+    next_node = route_by_rules(
+        intel_available=_flag(text, "Intel available"),
+        log_summary_available=_flag(text, "Log Summary available"),
+        threat_detected=_flag(text, "Threat Detected"),
+        playbook_consulted=_flag(text, "Playbook Consulted"),
+        policy_generated=_flag(text, "Policy Generated"),
+    )
+    return {"next": next_node or "end_investigation"}
+
+
+def _fake_threat_intel(text: str) -> dict:
+    malicious = int((re.search(r'"malicious":\s*(\d+)', text) or [0, 0])[1])
+    return {"summary": f"VirusTotal lists {malicious} malicious verdicts.", "is_malicious": malicious > 0}
+
+
+def _fake_log_analysis(text: str) -> dict:
+    anomaly = bool(FAILED_LOGIN.search(text) or SENSITIVE_FILE.search(text) or UNUSUAL_COMMAND.search(text))
+    return {"summary": "Suspicious activity in the logs." if anomaly else "Routine activity only.",
+            "contains_anomaly": anomaly}
+
+
+def _fake_firewall_rule(text: str) -> dict:
+    indicator = (re.search(r"Indicator:\s*(\S+)", text) or [None, "0.0.0.0"])[1]
+    return {"name": f"Block-Malicious-IP-{indicator}", "action": "BLOCK", "source_ip": indicator, "protocol": "ANY"}
+
+
+STRUCTURED_RESPONSES = {
+    "Route": _fake_route,
+    "ThreatIntel": _fake_threat_intel,
+    "LogAnalysis": _fake_log_analysis,
+    "FirewallRule": _fake_firewall_rule,
+}
+
+PLAYBOOK_ANSWER = "1. Isolate the affected host.\n2. Block the indicator at the perimeter.\n3. Reset exposed credentials."
+
+
+class FakeChatGroq(BaseChatModel):
+    """
+    Drop-in replacement for ChatGroq. Supports `with_structured_output` for the
+    repo's output models and `bind_tools` for the tool-calling agent.
+    """
+    model: str = "fake-groq"
+    temperature: float = 0
+    latency: float = 0.0
+    jitter: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-groq"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self.model}
+
+    def _get_invocation_params(self, stop=None, **kwargs) -> dict:
+        return {**super()._get_invocation_params(stop=stop, **kwargs), "model": self.model}
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tool_names=[getattr(tool, "name", str(tool)) for tool in tools], **kwargs)
+
+    def with_structured_output(self, schema, **kwargs):
+        return self.bind(structured_output=schema.__name__) | RunnableLambda(
+            lambda message: schema(**json.loads(message.content))
+        )
+
+    def _respond(self, messages: List[BaseMessage], structured_output: str = None, tool_names: list = None) -> AIMessage:
+        text = "\n".join(str(message.content) for message in messages)
+        if structured_output:
+            return AIMessage(content=json.dumps(STRUCTURED_RESPONSES[structured_output](text)))
+        if tool_names:
+            tool_results = [m for m in messages if isinstance(m, ToolMessage)]
+            if tool_results:
+                return AIMessage(content=str(tool_results[-1].content))
+            indicator = str(messages[-1].content).strip()
+            return AIMessage(content="", tool_calls=[
+                {"name": tool_names[0], "args": {"ip_address": indicator}, "id": f"call_{uuid.uuid4().hex[:8]}"}
+            ])
+        return AIMessage(content=PLAYBOOK_ANSWER)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, structured_output: str = None, tool_names: list = None, **kwargs: Any) -> ChatResult:
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        message = self._respond(messages, structured_output, tool_names)
+        prompt_tokens = sum(count_tokens(str(m.content)) for m in messages)
+        completion_tokens = count_tokens(str(message.content)) or 1
+        message.usage_metadata = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens}
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"model_name": self.model, "token_usage": {
+                "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }},
+        )
+
+
+# --- 2. Stub VirusTotal Server ---
+def is_stub_malicious(ip_address: str) -> bool:
+    """The stub flags every IP whose last octet is a multiple of 3 (domains and hashes are clean)."""
+    try:
+        return int(ip_address.rsplit(".", 1)[-1]) % 3 == 0
+    except ValueError:
+        return False
+
+
+class _VirusTotalHandler(http.server.BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        indicator = self.path.rstrip("/").rsplit("/", 1)[-1]
+        malicious = 3 if is_stub_malicious(indicator) else 0
+        body = json.dumps({"data": {"attributes": {
+            "reputation": -10 if malicious else 0,
+            "last_analysis_stats": {"harmless": 60, "malicious": malicious, "suspicious": 0, "undetected": 10},
+        }}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_virustotal_stub(latency: float = 0.0) -> http.server.ThreadingHTTPServer:
+    """Serves the VirusTotal IP, domain and file endpoints on a free local port, in a daemon thread."""
+    handler = type("VirusTotalHandler", (_VirusTotalHandler,), {"latency": latency})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- 3. Wiring ---
+PLAYBOOK_SNIPPETS = [
+    "Malware playbook: isolate the infected host from the network and collect a memory image.",
+    "Brute force playbook: block the source IP and reset the targeted account's credentials.",
+    "Phishing playbook: quarantine the message and reset credentials of users who clicked.",
+    "Data exfiltration playbook: block outbound traffic to the destination and notify legal.",
+]
+
+
+def install(llm_latency: float = 0.0, llm_jitter: float = 0.0, vt_latency: float = 0.0) -> dict:
+    """
+    Points the app at the fake backends. Must run before `app.tools` is imported,
+    because the VirusTotal URL is read at import time.
+    Returns a description of the backends for the benchmark report.
+    """
+    vt_server = start_virustotal_stub(vt_latency)
+    os.environ["VT_API_URL"] = f"http://127.0.0.1:{vt_server.server_port}"
+    os.environ.setdefault("VT_API_KEY", "benchmark")
+    # The stubs have no quota to respect (set LLM_RPM / LLM_TPM to benchmark the gateway)
+    os.environ.setdefault("VT_RATE_PER_MIN", "0")
+    os.environ.setdefault("LLM_RPM", "0")
+    os.environ.setdefault("LLM_TPM", "0")
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+    from app import resources
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_community.vectorstores import FAISS
+
+    resources.set_llm_factory(lambda model, temperature: FakeChatGroq(
+        model=model, temperature=temperature, latency=llm_latency, jitter=llm_jitter,
+    ))
+    embeddings = DeterministicFakeEmbedding(size=384)
+    with resources._lock:
+        resources._embeddings = embeddings
+        resources._vector_store = FAISS.from_texts(PLAYBOOK_SNIPPETS, embeddings)
+        resources._index_version = "benchmark"
+
+    return {"llm_latency_s": llm_latency, "llm_jitter_s": llm_jitter, "vt_latency_s": vt_latency,
+            "vt_url": os.environ["VT_API_URL"]}
@@ -0,0 +1,131 @@
+"""
+Recall@k vs. latency and memory of the FAISS index types that scripts/ingest.py
+can build, on a synthetic clustered corpus shaped like playbook embeddings:
+
+    python benchmarks/index_benchmark.py --vectors 100000 --dim 384 --k 4
+
+For every index type it reports the build time, the index size, and for each
+nprobe / efSearch setting the recall@k against exact search and the per-query
+latency. Pick the cheapest setting that reaches the recall you need and pass it
+to ingest (e.g. --index-type ivf-pq --nprobe 16).
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+from app.faiss_index import INDEX_TYPES, build_index, default_params, index_size_bytes
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def synthetic_corpus(n_vectors: int, n_queries: int, dim: int, clusters: int, seed: int = 0):
+    """Unit-length vectors around `clusters` topics, like sentence embeddings of related documents."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+
+    def sample(n):
+        points = centers[rng.integers(0, clusters, n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+    return sample(n_vectors), sample(n_queries)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    # Single-query latency is what the consultant sees
+    latencies = []
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        found[i] = ids[0]
+    latencies.sort()
+    return {
+        "recall_at_k": round(recall_at_k(found, truth), 4),
+        "latency_ms_p50": round(latencies[len(latencies) // 2] * 1000, 4),
+        "latency_ms_p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 4),
+    }
+
+
+def sweep_values(index_type: str, params: dict) -> list:
+    """The nprobe / efSearch values to try for an index."""
+    if index_type in ("ivf-flat", "ivf-pq"):
+        return [("nprobe", v) for v in (1, 2, 4, 8, 16, 32, 64, 128) if v <= params["nlist"]]
+    if index_type == "hnsw":
+        return [("efSearch", v) for v in (16, 32, 64, 128, 256)]
+    return [(None, None)]
+
+
+def run(args) -> dict:
+    faiss.omp_set_num_threads(args.threads)
+    vectors, queries = synthetic_corpus(args.vectors, args.queries, args.dim, args.clusters)
+    exact = faiss.IndexFlatL2(args.dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    results = {}
+    for index_type in args.index_types:
+        params = default_params(index_type, len(vectors), args.dim)
+        started = time.perf_counter()
+        index = build_index(index_type, vectors, params)
+        trained = time.perf_counter()
+        index.add(vectors)
+        built = time.perf_counter()
+
+        entry = {
+            "params": params,
+            "train_s": round(trained - started, 3),
+            "add_s": round(built - trained, 3),
+            "size_mb": round(index_size_bytes(index) / 2 ** 20, 2),
+            "search": [],
+        }
+        for name, value in sweep_values(index_type, params):
+            if name == "nprobe":
+                faiss.extract_index_ivf(index).nprobe = value
+            elif name == "efSearch":
+                index.hnsw.efSearch = value
+            entry["search"].append({**({name: value} if name else {}), **measure(index, queries, truth, args.k)})
+        results[index_type] = entry
+
+        print(f"\n{index_type} {params}: train {entry['train_s']}s, add {entry['add_s']}s, {entry['size_mb']} MB")
+        for row in entry["search"]:
+            setting = ", ".join(f"{k}={v}" for k, v in row.items() if k in ("nprobe", "efSearch")) or "exact"
+            print(f"  {setting:<14} recall@{args.k} {row['recall_at_k']:<7} "
+                  f"p50 {row['latency_ms_p50']} ms  p95 {row['latency_ms_p95']} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall, latency and memory of the FAISS index types.")
+    parser.add_argument("--vectors", type=int, default=50000, help="Corpus size.")
+    parser.add_argument("--queries", type=int, default=500, help="Number of queries.")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (all-MiniLM-L6-v2: 384).")
+    parser.add_argument("--clusters", type=int, default=200, help="Topics in the synthetic corpus.")
+    parser.add_argument("--k", type=int, default=4, help="Neighbours per query (the retriever's default k).")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads.")
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/index-<time>.json).")
+    args = parser.parse_args()
+
+    results = run(args)
+    output = args.output or os.path.join(RESULTS_DIR, f"index-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"settings": vars(args), "results": results}, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
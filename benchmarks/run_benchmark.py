@@ -0,0 +1,296 @@
+"""
+Offline throughput / latency benchmark of the investigation graph.
+
+Runs N synthetic alerts against the fake Groq and VirusTotal backends in
+benchmarks/fake_backend.py, both directly through app.main.get_graph() and end to end
+through the Socket.IO server, and writes the results to benchmarks/results/ as
+JSON so runs from different commits can be compared:
+
+    python benchmarks/run_benchmark.py --alerts 200 --concurrency 8 --llm-latency 0.2
+    python benchmarks/run_benchmark.py --compare benchmarks/results/<earlier run>.json
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+from collections import defaultdict
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+LOG_SAMPLES = [
+    "Oct 18 10:00:01 web01 sshd[311]: Accepted publickey for deploy from {ip} port 52113 ssh2",
+    "Oct 18 10:00:01 web01 sshd[311]: Failed password for root from {ip} port 52113 ssh2\n" * 4
+    + "Oct 18 10:00:09 web01 sshd[311]: Accepted password for root from {ip} port 52114 ssh2",
+    "Oct 18 10:02:13 web01 sudo: www-data : COMMAND=/bin/cat /etc/shadow (from {ip})",
+    "",
+]
+
+
+def synthetic_alerts(count: int, distinct: int, mode: str) -> list:
+    """`count` alerts cycling over `distinct` indicators (so the caches see repeats)."""
+    alerts = []
+    for i in range(count):
+        n = i % distinct
+        ip = f"10.{n // 62500 % 250}.{n // 250 % 250}.{n % 250 + 1}"
+        alerts.append({
+            "prompt": f"Synthetic alert {i}",
+            "indicator": ip,
+            "logs": LOG_SAMPLES[i % len(LOG_SAMPLES)].format(ip=ip),
+            "options": {"mode": mode, "replay": False},
+        })
+    return alerts
+
+
+def percentile(values, pct: float) -> float:
+    from app.batch import percentile as nearest_rank
+    return round(nearest_rank(values, pct), 4)
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process."""
+    with open("/proc/self/statm") as f:
+        return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+
+
+def peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def summarize(latencies: list, telemetries: list, failed: int, elapsed: float, rss_before: float) -> dict:
+    nodes = defaultdict(list)
+    for summary in telemetries:
+        for node in summary["nodes"]:
+            nodes[node["node"]].append(node["seconds"])
+    completed = len(latencies)
+    return {
+        "investigations": completed,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 3),
+        "investigations_per_sec": round(completed / elapsed, 2) if elapsed else 0.0,
+        "latency_s": {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                      "p99": percentile(latencies, 99), "max": round(max(latencies, default=0), 4)},
+        "nodes": {
+            name: {"count": len(values), "mean_s": round(sum(values) / len(values), 4),
+                   "p50_s": percentile(values, 50), "p95_s": percentile(values, 95)}
+            for name, values in sorted(nodes.items())
+        },
+        "per_investigation": {
+            key: round(sum(t[key] for t in telemetries) / len(telemetries), 2) if telemetries else 0
+            for key in ("llm_calls", "prompt_tokens", "completion_tokens", "tool_calls", "queue_wait_s")
+        },
+        "memory_mb": {"rss_before": rss_before, "rss_after": rss_mb(), "peak_rss": peak_rss_mb()},
+    }
+
+
+# --- 1. Direct Graph Runs ---
+async def bench_direct(alerts: list, concurrency: int) -> dict:
+    from app.main import get_graph
+    from app.state import make_initial_state
+    from app.executor import InvestigationExecutor
+    from app.telemetry import InvestigationTelemetry
+    from app.investigations import investigation_config, new_investigation_id
+
+    executor = InvestigationExecutor(max_concurrent=concurrency)
+    latencies, telemetries, failed = [], [], 0
+    rss_before = rss_mb()
+
+    def investigate(alert):
+        telemetry = InvestigationTelemetry(new_investigation_id())
+        t0 = time.perf_counter()
+        initial_state = make_initial_state(alert, source="benchmark")
+        get_graph().invoke(initial_state, investigation_config(telemetry.investigation_id, telemetry,
+                                                         initial_state["options"].get("priority")))
+        return time.perf_counter() - t0, telemetry.summary()
+
+    async def run_one(alert):
+        nonlocal failed
+        try:
+            latency, summary = await executor.run(investigate, alert)
+            latencies.append(latency)
+            telemetries.append(summary)
+        except Exception as e:
+            failed += 1
+            print(f"direct: investigation failed: {e}", file=sys.stderr)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one(alert) for alert in alerts))
+    return summarize(latencies, telemetries, failed, time.perf_counter() - started, rss_before)
+
+
+# --- 2. End-to-End Runs Through the Socket.IO Server ---
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def bench_socketio(alerts: list, concurrency: int) -> dict:
+    import uvicorn
+    import socketio
+    from app.api import server
+
+    port = _free_port()
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.socket_app, host="127.0.0.1", port=port, log_level="warning"))
+    server_thread = threading.Thread(target=uvicorn_server.run, daemon=True)
+    server_thread.start()
+    while not uvicorn_server.started:
+        await asyncio.sleep(0.05)
+
+    queue = asyncio.Queue()
+    for alert in alerts:
+        queue.put_nowait(alert)
+    latencies, telemetries, failed = [], [], 0
+    rss_before = rss_mb()
+
+    async def client_loop():
+        nonlocal failed
+        client = socketio.AsyncClient()
+        finished = defaultdict(asyncio.Future)
+
+        @client.on("graph_finished")
+        async def on_finished(data):
+            finished[data["investigation_id"]].set_result(data)
+
+        @client.on("graph_error")
+        async def on_error(data):
+            finished[data.get("investigation_id")].set_exception(RuntimeError(data.get("error")))
+
+        await client.connect(f"http://127.0.0.1:{port}", transports=["websocket"])
+        try:
+            while not queue.empty():
+                alert = queue.get_nowait()
+                t0 = time.perf_counter()
+                try:
+                    ack = await client.call("investigate", alert, timeout=120)
+                    data = await asyncio.wait_for(finished[ack["investigation_id"]], 120)
+                    latencies.append(time.perf_counter() - t0)
+                    if data.get("telemetry"):
+                        telemetries.append(data["telemetry"])
+                except Exception as e:
+                    failed += 1
+                    print(f"socketio: investigation failed: {e}", file=sys.stderr)
+        finally:
+            await client.disconnect()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    # Wait for the server to handle the disconnects, so nothing prints after the run
+    uvicorn_server.should_exit = True
+    await asyncio.to_thread(server_thread.join)
+    return summarize(latencies, telemetries, failed, elapsed, rss_before)
+
+
+# --- 3. Reporting ---
+def reset_caches():
+    """Empties the VirusTotal, playbook answer and embedding caches, so every target starts cold."""
+    from app import resources
+    from app.tools import reputation_cache
+    from app.agents.consultant_agent import answer_cache
+
+    reputation_cache.clear()
+    answer_cache.clear()
+    clear_embeddings = getattr(resources._embeddings, "clear", None)
+    if clear_embeddings:
+        clear_embeddings()
+
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR)).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def compare(current: dict, baseline_path: str):
+    """Prints the throughput and tail-latency change against an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for target, result in current["results"].items():
+        before = baseline.get("results", {}).get(target)
+        if not before:
+            continue
+        for label, path in (("investigations/sec", ("investigations_per_sec",)), ("p95 latency s", ("latency_s", "p95"))):
+            old, new = before, result
+            for key in path:
+                old, new = old[key], new[key]
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"  {target:<9} {label:<20} {old:>10} -> {new:<10} ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the investigation graph against fake Groq/VirusTotal backends.")
+    parser.add_argument("--alerts", type=int, default=100, help="Number of synthetic alerts.")
+    parser.add_argument("--distinct", type=int, default=None, help="Distinct indicators among the alerts (default: all distinct).")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent investigations (direct) / clients (socketio).")
+    parser.add_argument("--mode", choices=["sequential", "parallel"], default="sequential")
+    parser.add_argument("--targets", default="direct,socketio", help="Comma-separated: direct, socketio.")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM call.")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="Random +/- seconds added to each LLM call.")
+    parser.add_argument("--vt-latency", type=float, default=0.02, help="Seconds per stub VirusTotal request.")
+    parser.add_argument("--checkpoints", action="store_true", help="Checkpoint to SQLite, as the server does by default.")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>-<commit>.json).")
+    parser.add_argument("--compare", help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    # Settings the app reads at import time
+    workdir = tempfile.mkdtemp(prefix="cypher-bench-")
+    os.environ["CHECKPOINT_DB"] = os.path.join(workdir, "investigations.sqlite") if args.checkpoints else ""
+    os.environ["MAX_CONCURRENT_INVESTIGATIONS"] = str(args.concurrency)
+    os.environ["WARM_UP_ON_STARTUP"] = "0"
+    os.environ["REPLAY_COMPLETED_INVESTIGATIONS"] = "0"
+    os.environ["EMBEDDING_CACHE_DIR"] = ""
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import fake_backend
+    backend = fake_backend.install(args.llm_latency, args.llm_jitter, args.vt_latency)
+
+    alerts = synthetic_alerts(args.alerts, args.distinct or args.alerts, args.mode)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {**vars(args), "backend": backend},
+        "results": {},
+    }
+
+    # The agents print progress banners; keep them out of the report
+    for target in [t.strip() for t in args.targets.split(",") if t.strip()]:
+        bench = {"direct": bench_direct, "socketio": bench_socketio}[target]
+        # Otherwise the second target gets the lookups and answers cached by the first
+        reset_caches()
+        with contextlib.redirect_stdout(io.StringIO()):
+            report["results"][target] = asyncio.run(bench(alerts, args.concurrency))
+        result = report["results"][target]
+        print(f"{target:<9} {result['investigations']} investigations ({result['failed']} failed) in "
+              f"{result['elapsed_s']}s: {result['investigations_per_sec']}/s, "
+              f"p50 {result['latency_s']['p50']}s, p95 {result['latency_s']['p95']}s, "
+              f"peak RSS {result['memory_mb']['peak_rss']} MB")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
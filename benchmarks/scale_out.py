@@ -0,0 +1,200 @@
+"""
+Load test of the scale-out mode: API server and graph worker processes sharing a
+job queue (app/job_queue.py), against the fake Groq and VirusTotal backends in
+benchmarks/fake_backend.py. For each worker count it starts fresh processes on
+fresh SQLite files, spreads the Socket.IO clients over the API servers and
+measures the throughput, then writes the results to benchmarks/results/:
+
+    python benchmarks/scale_out.py --workers 1,2,4 --api-servers 2 --alerts 200
+
+A worker count of 0 runs one API server the default way (graph in-process), as
+the baseline.
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import urllib.request
+from collections import defaultdict
+
+from run_benchmark import RESULTS_DIR, _free_port, git_commit, percentile, synthetic_alerts
+
+
+# --- 1. Server and Worker Processes ---
+def serve_role(args):
+    """Entry point of the child processes: an API server or a graph worker on the fake backends."""
+    import fake_backend
+    fake_backend.install(args.llm_latency, 0.0, args.vt_latency)
+    if args.role == "worker":
+        from app.worker import serve
+        asyncio.run(serve(args.worker_concurrency, f"bench-worker-{os.getpid()}"))
+    else:
+        import uvicorn
+        from app.api import server
+        uvicorn.run(server.socket_app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def spawn(args, workdir: str, role: str, name: str, env: dict, port: int = 0) -> subprocess.Popen:
+    log = open(os.path.join(workdir, f"{name}.log"), "w")
+    command = [sys.executable, os.path.abspath(__file__), "--role", role, "--port", str(port),
+               "--worker-concurrency", str(args.worker_concurrency),
+               "--llm-latency", str(args.llm_latency), "--vt-latency", str(args.vt_latency)]
+    return subprocess.Popen(command, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until(check, process: subprocess.Popen, timeout: float = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if check():
+            return
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args[2:4])} process exited with code {process.returncode}")
+        time.sleep(0.2)
+    raise TimeoutError("A server or worker process did not start in time")
+
+
+def api_ready(port: int) -> bool:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/startup/timings", timeout=1):
+            return True
+    except OSError:
+        return False
+
+
+def worker_ready(workdir: str, name: str) -> bool:
+    with open(os.path.join(workdir, f"{name}.log")) as f:
+        return "READY" in f.read()
+
+
+# --- 2. Clients ---
+async def drive(alerts: list, ports: list, clients: int) -> dict:
+    import socketio
+
+    queue = asyncio.Queue()
+    for alert in alerts:
+        queue.put_nowait(alert)
+    latencies, failed = [], 0
+
+    async def client_loop(port):
+        nonlocal failed
+        client = socketio.AsyncClient()
+        finished = defaultdict(asyncio.Future)
+
+        @client.on("graph_finished")
+        async def on_finished(data):
+            finished[data["investigation_id"]].set_result(data)
+
+        @client.on("graph_error")
+        async def on_error(data):
+            finished[data.get("investigation_id")].set_exception(RuntimeError(data.get("error")))
+
+        await client.connect(f"http://127.0.0.1:{port}", transports=["websocket"])
+        try:
+            while not queue.empty():
+                alert = queue.get_nowait()
+                t0 = time.perf_counter()
+                try:
+                    ack = await client.call("investigate", alert, timeout=300)
+                    await asyncio.wait_for(finished[ack["investigation_id"]], 300)
+                    latencies.append(time.perf_counter() - t0)
+                except Exception as e:
+                    failed += 1
+                    print(f"scale-out: investigation failed: {e}", file=sys.stderr)
+        finally:
+            await client.disconnect()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop(ports[i % len(ports)]) for i in range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        "investigations": len(latencies),
+        "failed": failed,
+        "elapsed_s": round(elapsed, 3),
+        "investigations_per_sec": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_s": {"p50": round(percentile(latencies, 50), 3), "p95": round(percentile(latencies, 95), 3)},
+    }
+
+
+def run_config(args, workers: int, alerts: list) -> dict:
+    """Starts the API servers and `workers` graph workers, runs the alerts through them, then stops them."""
+    workdir = tempfile.mkdtemp(prefix="cypher-scale-")
+    env = {
+        "CHECKPOINT_DB": os.path.join(workdir, "investigations.sqlite"),
+        "JOB_QUEUE_DB": os.path.join(workdir, "jobs.sqlite") if workers else "",
+        "MAX_CONCURRENT_INVESTIGATIONS": str(args.worker_concurrency),
+        "WARM_UP_ON_STARTUP": "0",
+        "REPLAY_COMPLETED_INVESTIGATIONS": "0",
+        "INDEX_WATCH": "0",
+        "EMBEDDING_CACHE_DIR": "",
+    }
+    api_servers = args.api_servers if workers else 1
+    ports = [_free_port() for _ in range(api_servers)]
+    processes = [spawn(args, workdir, "api", f"api-{i}", env, port) for i, port in enumerate(ports)]
+    names = [f"worker-{i}" for i in range(workers)]
+    processes += [spawn(args, workdir, "worker", name, env) for name in names]
+    try:
+        for port, process in zip(ports, processes):
+            wait_until(lambda: api_ready(port), process)
+        for name, process in zip(names, processes[api_servers:]):
+            wait_until(lambda: worker_ready(workdir, name), process)
+        result = asyncio.run(drive(alerts, ports, args.clients))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+    return {"workers": workers, "api_servers": api_servers, "workdir": workdir, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how throughput scales with the number of graph workers.")
+    parser.add_argument("--workers", default="0,1,2,4", help="Comma-separated worker counts (0: in-process baseline).")
+    parser.add_argument("--api-servers", type=int, default=2, help="API server processes sharing the queue.")
+    parser.add_argument("--worker-concurrency", type=int, default=4, help="Concurrent investigations per process.")
+    parser.add_argument("--alerts", type=int, default=200, help="Number of synthetic alerts per run.")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent Socket.IO clients.")
+    parser.add_argument("--mode", choices=["sequential", "parallel"], default="sequential")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per fake LLM call.")
+    parser.add_argument("--vt-latency", type=float, default=0.02, help="Seconds per stub VirusTotal request.")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/scale-out-<time>-<commit>.json).")
+    parser.add_argument("--role", choices=["api", "worker"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role:
+        serve_role(args)
+        return
+
+    alerts = synthetic_alerts(args.alerts, args.alerts, args.mode)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("role", "port")},
+        "results": [],
+    }
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        result = run_config(args, workers, alerts)
+        report["results"].append(result)
+        label = f"{workers} worker(s)" if workers else "in-process"
+        print(f"{label:<12} {result['investigations']} investigations ({result['failed']} failed) in "
+              f"{result['elapsed_s']}s: {result['investigations_per_sec']}/s, "
+              f"p50 {result['latency_s']['p50']}s, p95 {result['latency_s']['p95']}s")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"scale-out-{time.strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
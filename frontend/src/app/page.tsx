@@ -114,9 +114,10 @@ export default function Home() {
               Investigation Details
             </h2>
             <div className="h-64 overflow-y-auto bg-gray-900 p-4 rounded-md font-mono text-sm mb-4">
-              {events.filter(e => !e.__end__).map((event, index) => {
-                 const nodeName = Object.keys(event)[0];
-                 const nodeOutput = event[nodeName];
+              {/* A slow connection may receive several node updates merged into one event */}
+              {events.filter(e => !e.__end__)
+                .flatMap(event => Object.entries(event).filter(([key]) => key !== "telemetry"))
+                .map(([nodeName, nodeOutput], index) => {
                  return (
                   <div key={index} className="whitespace-pre-wrap mb-2 border-b border-gray-700 pb-2">
                     <span className="text-green-400">{`> Step ${index + 1}: Running node '${nodeName}'...`}</span>
@@ -1,51 +1,342 @@
 import os
 import sys
-from langchain_community.document_loaders import DirectoryLoader
+import json
+import glob
+import shutil
+import hashlib
+import time
+import uuid
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from langchain_community.document_loaders import UnstructuredFileLoader
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from app import resources
+from app.resources import get_embeddings, EMBEDDING_MODEL
+from app.faiss_index import INDEX_TYPES, build_index, default_params, supports_removal
+
 # Get the root project directory (parent of scripts/)
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Construct absolute paths for directories in the root project folder
 DOCS_PATH = os.path.join(root_dir, "documents")
 DB_PATH = os.path.join(root_dir, "vector_store")
+# DB_PATH is a symlink to the current version in VERSIONS_PATH. Each ingest writes
+# a new version directory and repoints the link; the newest KEEP_VERSIONS stay on
+# disk, and an older one only goes PRUNE_GRACE_SECONDS after it was replaced, so a
+# reader still loading it can finish.
+VERSIONS_PATH = DB_PATH + ".versions"
+KEEP_VERSIONS = 3
+PRUNE_GRACE_SECONDS = 60
+
+# The manifest records the content hash of every ingested file and chunk, so a
+# re-run only embeds what actually changed.
+MANIFEST_FILE = "manifest.json"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# Documents are parsed by a process pool, and chunks are embedded in batches of
+# this size as soon as enough of them are ready
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+DEFAULT_BATCH_SIZE = 256
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_manifest() -> dict:
+    """Returns the manifest of the current index, or None if there is none."""
+    try:
+        with open(os.path.join(os.path.realpath(DB_PATH), MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def split_file(path: str, rel_path: str, text_splitter) -> list:
+    """
+    Loads and splits one document. Each chunk gets a content-hash ID so that an
+    unchanged chunk keeps its ID (and its vector) when other parts of the file change.
+    """
+    documents = UnstructuredFileLoader(path).load()
+    chunks = text_splitter.split_documents(documents)
+
+    seen = {}
+    for chunk in chunks:
+        chunk_id = sha256(f"{rel_path}\0{chunk.page_content}".encode())
+        # Identical chunks within one file still need distinct IDs
+        seen[chunk_id] = seen.get(chunk_id, 0) + 1
+        if seen[chunk_id] > 1:
+            chunk_id = f"{chunk_id}-{seen[chunk_id]}"
+        chunk.metadata["source"] = rel_path
+        chunk.metadata["chunk_id"] = chunk_id
+    return chunks
+
 
-def create_vector_store():
+def build_store(index_type: str, params: dict, texts: list, vectors, metadatas: list, ids: list, embeddings):
+    """Creates a FAISS store of the given index type, trained on and filled with `vectors`."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    index = build_index(index_type, vectors, params)
+    db = FAISS(embeddings, index, InMemoryDocstore(), {})
+    db.add_embeddings(list(zip(texts, vectors.tolist())), metadatas=metadatas, ids=ids)
+    return db
+
+
+def save_atomically(db, manifest: dict):
+    """
+    Writes the index and manifest to a new version directory and points the
+    DB_PATH symlink at it with one os.replace, so readers (and the server's
+    watcher) see either the old or the new index, never a missing or half-written
+    one, even if ingestion crashes half way.
+    """
+    parent = os.path.dirname(DB_PATH)
+    os.makedirs(VERSIONS_PATH, exist_ok=True)
+    target = tempfile.mkdtemp(prefix=f"{time.strftime('%Y%m%d-%H%M%S')}-{manifest['version']}-", dir=VERSIONS_PATH)
+    db.save_local(target)
+    with open(os.path.join(target, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.isdir(DB_PATH) and not os.path.islink(DB_PATH):
+        # An index saved before versioned directories: move it aside, once
+        os.rename(DB_PATH, os.path.join(VERSIONS_PATH, f"legacy-{uuid.uuid4().hex[:8]}"))
+    link = os.path.join(parent, f".{os.path.basename(DB_PATH)}-{uuid.uuid4().hex[:8]}")
+    os.symlink(os.path.relpath(target, parent), link)
+    os.replace(link, DB_PATH)
+    prune_versions()
+
+
+def prune_versions(keep: int = KEEP_VERSIONS, grace: float = None):
+    """
+    Deletes all but the newest `keep` version directories (never the current one).
+    A version is replaced when the next newer one is created: it is only deleted
+    once that happened `grace` seconds ago (default PRUNE_GRACE_SECONDS).
+    """
+    grace = PRUNE_GRACE_SECONDS if grace is None else grace
+    current = os.path.realpath(DB_PATH)
+    versions = sorted(((os.path.getmtime(path), path) for path in
+                       (os.path.join(VERSIONS_PATH, name) for name in os.listdir(VERSIONS_PATH))), reverse=True)
+    for (replaced_at, _), (_, path) in zip(versions[keep - 1:], versions[keep:]):
+        if os.path.realpath(path) != current and time.time() - replaced_at >= grace:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class IndexWriter:
+    """
+    Adds embedding batches to the index as they complete. A new flat or HNSW index
+    is created from the first batch; a new IVF index needs training on the whole
+    corpus, so its (float32) vectors are buffered until `finish()`.
+    """
+
+    def __init__(self, db, index_type: str, index_params: dict, index_meta: dict, embeddings):
+        self.db = db
+        self.index_type = index_type
+        self.index_params = index_params
+        self.index_meta = index_meta
+        self.embeddings = embeddings
+        self._pending = []  # (texts, vectors, metadatas, ids) batches awaiting IVF training
+
+    def add(self, chunks: list):
+        texts = [c.page_content for c in chunks]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        ids = [c.metadata["chunk_id"] for c in chunks]
+        metadatas = [c.metadata for c in chunks]
+        if self.db is not None:
+            self.db.add_embeddings(list(zip(texts, vectors.tolist())), metadatas=metadatas, ids=ids)
+        elif self.index_type.startswith("ivf"):
+            self._pending.append((texts, vectors, metadatas, ids))
+        else:
+            self._create(texts, vectors, metadatas, ids)
+
+    def _create(self, texts, vectors, metadatas, ids):
+        params = {**default_params(self.index_type, len(vectors), vectors.shape[1]), **self.index_params}
+        self.db = build_store(self.index_type, params, texts, vectors, metadatas, ids, self.embeddings)
+        self.index_meta = {"type": self.index_type, "params": params}
+
+    def finish(self):
+        """Returns (db, index metadata) once every batch was added."""
+        if self._pending:
+            # Train on all the buffered vectors, then add them
+            batches, self._pending = self._pending, []
+            self._create(
+                [t for batch in batches for t in batch[0]],
+                np.concatenate([batch[1] for batch in batches]),
+                [m for batch in batches for m in batch[2]],
+                [i for batch in batches for i in batch[3]],
+            )
+        return self.db, self.index_meta
+
+
+def load_and_split(path: str, rel_path: str) -> list:
+    """Process pool task: parses and splits one document."""
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return split_file(path, rel_path, text_splitter)
+
+
+def iter_split_files(jobs: list, workers: int):
+    """Yields (rel_path, file_hash, chunks) for every (path, rel_path, file_hash) job as it finishes."""
+    if workers <= 1:
+        for path, rel_path, file_hash in jobs:
+            yield rel_path, file_hash, load_and_split(path, rel_path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(load_and_split, path, rel_path): (rel_path, file_hash)
+                   for path, rel_path, file_hash in jobs}
+        for future in as_completed(futures):
+            rel_path, file_hash = futures[future]
+            yield rel_path, file_hash, future.result()
+
+
+def create_vector_store(full: bool = False, index_type: str = "flat", index_params: dict = None,
+                        workers: int = DEFAULT_WORKERS, batch_size: int = DEFAULT_BATCH_SIZE):
     """
     Loads documents, splits them into chunks, creates embeddings,
     and saves them to a FAISS vector store.
+
+    Unless `full` is set, only new or changed chunks are embedded: unchanged files
+    are skipped entirely, and vectors of chunks that disappeared are deleted.
+
+    `index_type` is one of app.faiss_index.INDEX_TYPES; `index_params` override
+    the defaults chosen for the corpus size (e.g. {"nlist": 1024}).
+
+    Documents are parsed by a pool of `workers` processes, and their chunks are
+    embedded and added to the index in batches of `batch_size` as they arrive.
     """
     print("Starting document ingestion process...")
+    started = time.perf_counter()
+
+    index_params = index_params or {}
+    settings = {"embedding_model": EMBEDDING_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                "index_type": index_type, "index_params": index_params}
+    manifest = None if full else load_manifest()
+    if manifest is not None and manifest.get("settings") != settings:
+        print("Ingestion settings changed since the last run, doing a full rebuild.")
+        manifest = None
+    old_files = manifest["files"] if manifest else {}
+    indexed_ids = {chunk_id for entry in old_files.values() for chunk_id in entry["chunks"]}
+
+    # 1. Find new and changed documents by their content hash
+    files = {}
+    jobs = []
+    paths = sorted(glob.glob(os.path.join(DOCS_PATH, "**/*.md"), recursive=True))
+    for path in paths:
+        rel_path = os.path.relpath(path, DOCS_PATH)
+        with open(path, "rb") as f:
+            file_hash = sha256(f.read())
+
+        previous = old_files.get(rel_path)
+        if previous is not None and previous["sha256"] == file_hash:
+            files[rel_path] = previous
+        else:
+            jobs.append((path, rel_path, file_hash))
+    print(f"Found {len(paths)} documents, {len(paths) - len(jobs)} unchanged.")
+
+    if not paths:
+        print(f"No documents found in {DOCS_PATH}, nothing to index.")
+        return
+    if manifest is not None and not jobs and files.keys() == old_files.keys():
+        print(f"Vector store is up to date ({len(indexed_ids)} chunks reused), nothing to save.")
+        return
+
+    embeddings = get_embeddings()
+    db = None
+    if manifest is not None:
+        db = FAISS.load_local(os.path.realpath(DB_PATH), embeddings, allow_dangerous_deserialization=True)
+    writer = IndexWriter(db, index_type, index_params, manifest.get("index") if manifest else None, embeddings)
+
+    # 2. Split changed documents in parallel and embed their unseen chunks in batches
+    pending = []
+    added = 0
+    for rel_path, file_hash, chunks in iter_split_files(jobs, workers):
+        files[rel_path] = {"sha256": file_hash, "chunks": [c.metadata["chunk_id"] for c in chunks]}
+        pending.extend(c for c in chunks if c.metadata["chunk_id"] not in indexed_ids)
+        while len(pending) >= batch_size:
+            writer.add(pending[:batch_size])
+            added += batch_size
+            pending = pending[batch_size:]
+    if pending:
+        writer.add(pending)
+        added += len(pending)
+    parsed_s = time.perf_counter() - started
+
+    current_ids = {chunk_id for entry in files.values() for chunk_id in entry["chunks"]}
+    if not current_ids:
+        print(f"No chunks found in {DOCS_PATH}, nothing to index.")
+        return
+
+    # 3. Delete vectors of chunks that no longer exist
+    removed_ids = sorted(indexed_ids - current_ids)
+    if removed_ids:
+        if supports_removal(index_type):
+            writer.db.delete(removed_ids)
+        else:
+            # IVF/HNSW indexes cannot drop vectors in place: rebuild them from the
+            # remaining chunks (their vectors come from the embedding cache)
+            print(f"Rebuilding the {index_type} index without {len(removed_ids)} deleted chunks...")
+            removed = set(removed_ids)
+            remaining = [writer.db.docstore.search(chunk_id) for chunk_id in writer.db.index_to_docstore_id.values()
+                         if chunk_id not in removed]
+            writer = IndexWriter(None, index_type, index_params, None, embeddings)
+            for i in range(0, len(remaining), batch_size):
+                writer.add(remaining[i:i + batch_size])
+    db, index_meta = writer.finish()
+
+    # 4. Swap the updated index into place
+    print("Saving vector store...")
+    new_manifest = {
+        "version": sha256("\n".join(sorted(current_ids)).encode())[:16],
+        "settings": settings,
+        "index": index_meta,
+        "files": files,
+    }
+    save_atomically(db, new_manifest)
+
+    elapsed = time.perf_counter() - started
+    reused = len(current_ids) - added
+    print(f"Embedded {added} new chunks, reused {reused}, deleted {len(removed_ids)}.")
+    print(f"Split and embedded {len(jobs)} documents in {parsed_s:.1f}s ({len(jobs) / elapsed:.1f} docs/sec, "
+          f"{added / elapsed:.1f} chunks/sec overall, {elapsed:.1f}s total).")
+    if hasattr(embeddings, "stats"):
+        print(f"Embedding cache: {embeddings.stats()}")
+    print(f"Vector store version {new_manifest['version']} ({index_type} index, {index_meta['params']}) saved at: {DB_PATH}")
 
-    # 1. Load documents from the specified directory
-    loader = DirectoryLoader(DOCS_PATH, glob="**/*.md")
-    documents = loader.load()
-    print(f"Loaded {len(documents)} documents.")
-
-    # 2. Split documents into smaller chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    texts = text_splitter.split_documents(documents)
-    print(f"Split documents into {len(texts)} chunks.")
-
-    # 3. Create embeddings for the text chunks
-    # This uses a popular, open-source embedding model.
-    # The first time you run this, it will download the model (a few hundred MB).
-    print("Loading embedding model...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={"device": "cpu"},
-    )
-    print("Embedding model loaded.")
-
-    # 4. Create a FAISS vector store from the chunks and embeddings
-    print("Creating and saving vector store...")
-    db = FAISS.from_documents(texts, embeddings)
-    db.save_local(DB_PATH)
-    print(f"Vector store created and saved at: {DB_PATH}")
 
 if __name__ == "__main__":
-    create_vector_store()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest the playbooks in documents/ into the FAISS vector store.")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and rebuild the whole index.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="FAISS index to build (see benchmarks/index_benchmark.py to choose one).")
+    parser.add_argument("--nlist", type=int, help="IVF: number of inverted lists.")
+    parser.add_argument("--nprobe", type=int, help="IVF: lists searched per query.")
+    parser.add_argument("--pq-m", type=int, help="IVF-PQ: sub-quantizers (must divide the embedding dimension).")
+    parser.add_argument("--pq-bits", type=int, help="IVF-PQ: bits per sub-quantizer code.")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW: neighbours per node.")
+    parser.add_argument("--ef-search", type=int, help="HNSW: candidate list size at search time.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Processes parsing and splitting documents.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per embedding batch.")
+    parser.add_argument("--encode-batch-size", type=int, help="Batch size of the embedding model's encode().")
+    parser.add_argument("--threads", type=int, help="Torch and FAISS threads used for embedding and training.")
+    args = parser.parse_args()
+
+    if args.encode_batch_size:
+        resources.EMBEDDING_BATCH_SIZE = args.encode_batch_size
+    if args.threads:
+        import faiss
+        faiss.omp_set_num_threads(args.threads)
+        try:
+            import torch
+            torch.set_num_threads(args.threads)
+        except ImportError:
+            pass
+
+    overrides = {"nlist": args.nlist, "nprobe": args.nprobe, "m": args.pq_m, "nbits": args.pq_bits,
+                 "M": args.hnsw_m, "efSearch": args.ef_search}
+    create_vector_store(full=args.full, index_type=args.index_type,
+                        index_params={k: v for k, v in overrides.items() if v is not None},
+                        workers=args.workers, batch_size=args.batch_size)
@@ -0,0 +1,97 @@
+"""
+Prompt tokens per hop of real investigations, measured from the graph's own
+telemetry (InvestigationTelemetry.prompt_tokens_by_node) against the fake Groq
+and VirusTotal backends of benchmarks/fake_backend.py, for a few trace budgets:
+
+    python scripts/trace_token_report.py --budgets 0 100 300 1000
+    python scripts/trace_token_report.py --llm-routing
+
+The supervisor routes with its rule table, so by default its prompt (the one
+that reads the trace) is not sent at all. --llm-routing sends every routing
+decision to the supervisor LLM instead, the worst case for the trace.
+"""
+import os
+import sys
+import argparse
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+sys.path.insert(0, os.path.join(root_dir, "benchmarks"))
+
+# Keep the measured runs (and the rules they generate) out of the local databases
+os.environ.setdefault("CHECKPOINT_DB", "")
+os.environ.setdefault("RULESET_DB", "")
+
+# An indicator the VirusTotal stub reports malicious, and a clean one that goes
+# through the Log_Analyst
+ALERTS = [
+    {"prompt": "Outbound connection to a known C2 server", "indicator": "203.0.113.9",
+     "logs": "Oct 18 10:02:13 web01 sudo: www-data : COMMAND=/bin/cat /etc/shadow (from 203.0.113.9)\n"
+             "Oct 18 10:02:15 web01 kernel: conn from 203.0.113.9:4444 to 10.0.0.5:22"},
+    {"prompt": "Login from a new address", "indicator": "203.0.113.10",
+     "logs": "Oct 18 10:00:01 web01 sshd[311]: Accepted publickey for deploy from 203.0.113.10 port 52113 ssh2"},
+]
+
+
+def run(alert: dict, mode: str) -> list:
+    """Runs one investigation; returns (node, prompt tokens, trace tokens) for every hop."""
+    from app.main import batch_graph
+    from app.state import make_initial_state
+    from app.tokens import count_tokens
+    from app.trace import merge_trace, render_trace
+    from app.telemetry import InvestigationTelemetry
+    from app.investigations import investigation_config, new_investigation_id
+
+    from run_benchmark import reset_caches
+
+    # A cached playbook answer would hide the consultant's prompt after the first run
+    reset_caches()
+    telemetry = InvestigationTelemetry(new_investigation_id())
+    initial_state = make_initial_state({**alert, "options": {"mode": mode}}, source="trace_token_report")
+    hops, trace, seen = [], [], {}
+    for update in batch_graph.stream(initial_state, investigation_config(telemetry.investigation_id, telemetry)):
+        for node, values in update.items():
+            by_node = telemetry.summary()["prompt_tokens_by_node"]
+            prompt_tokens = sum(by_node.values()) - sum(seen.values())
+            seen = by_node
+            # Mirrors the state's reducer, so this is the trace the next prompt would get
+            trace = merge_trace(trace, (values or {}).get("investigation_trace"))
+            hops.append((node, prompt_tokens, count_tokens(render_trace(trace)) if trace else 0))
+    return hops
+
+
+def report(budgets: list, mode: str):
+    from app import trace as trace_module
+
+    for alert in ALERTS:
+        print(f"\n{alert['prompt']} ({alert['indicator']}, mode={mode})")
+        runs = {}
+        for budget in budgets:
+            trace_module.TRACE_TOKEN_BUDGET = budget
+            runs[budget] = run(alert, mode)
+
+        header = "".join(f"{f'budget {budget}':>14} {'trace':>6}" for budget in budgets)
+        print(f"{'hop':>4} {'node':<17}{header}")
+        for hop, steps in enumerate(zip(*runs.values()), start=1):
+            cells = "".join(f"{prompt_tokens:>14} {trace_tokens:>6}" for _, prompt_tokens, trace_tokens in steps)
+            print(f"{hop:>4} {steps[0][0]:<17}{cells}")
+        totals = "  ".join(f"budget {budget}: {sum(step[1] for step in steps)}" for budget, steps in runs.items())
+        print(f"Prompt tokens: {totals}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure prompt tokens per hop for several investigation trace budgets.")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 100, 300, 1000],
+                        help="TRACE_TOKEN_BUDGET values to compare.")
+    parser.add_argument("--mode", default="sequential", choices=["sequential", "parallel"])
+    parser.add_argument("--llm-routing", action="store_true",
+                        help="Send every routing decision to the supervisor LLM (the prompt that reads the trace).")
+    args = parser.parse_args()
+
+    import fake_backend
+    fake_backend.install()
+    if args.llm_routing:
+        from app import main
+        main.SUPERVISOR_LLM_FALLBACK = True
+        main.route_by_rules = lambda **flags: None
+    report(args.budgets, args.mode)
@@ -0,0 +1,33 @@
+import sys
+import os
+# Add the project root (and the benchmark fakes) to Python path to enable imports
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+sys.path.insert(0, os.path.join(root_dir, "benchmarks"))
+
+import pytest
+
+from app import tools
+from app.tools import TokenBucket
+from fake_backend import start_virustotal_stub
+
+
+@pytest.fixture
+def virustotal(monkeypatch):
+    """Points the lookups at the benchmark's VirusTotal stub, with an empty cache and no rate limit."""
+    servers = []
+
+    def start(latency=0.0):
+        server = start_virustotal_stub(latency)
+        servers.append(server)
+        monkeypatch.setattr(tools, "VT_API_URL", f"http://127.0.0.1:{server.server_port}")
+        return server
+
+    monkeypatch.setenv("VT_API_KEY", "test")
+    monkeypatch.setattr(tools._lookups, "bucket", TokenBucket(0, 1))
+    tools.reputation_cache.clear()
+    start()
+    yield start
+    tools.reputation_cache.clear()
+    for server in servers:
+        server.shutdown()
@@ -0,0 +1,27 @@
+import pytest
+
+from app.batch import batch_key, percentile
+
+
+@pytest.mark.parametrize("values,pct,expected", [
+    ([1, 2, 3, 4, 5], 50, 3),
+    ([1, 2, 3, 4], 50, 2),
+    ([5, 1, 4, 2, 3], 95, 5),
+    ([5, 1, 4, 2, 3], 0, 1),
+    ([5, 1, 4, 2, 3], 100, 5),
+    (list(range(1, 101)), 95, 95),
+    ([7], 50, 7),
+    ([], 50, 0.0),
+])
+def test_percentile_is_nearest_rank(values, pct, expected):
+    assert percentile(values, pct) == expected
+
+
+def test_batch_key_accepts_null_fields():
+    assert batch_key({"indicator": None, "logs": None}) == batch_key({})
+
+
+def test_batch_key_separates_options():
+    alert = {"indicator": "203.0.113.7", "logs": "sshd: Failed password for root"}
+    assert batch_key(alert) == batch_key({**alert, "options": {"priority": "high"}})
+    assert batch_key(alert) != batch_key({**alert, "options": {"mode": "parallel"}})
@@ -0,0 +1,89 @@
+import time
+import threading
+
+import pytest
+
+from app.cache import TTLCache
+
+
+def test_clear_on_change_clears_once_per_generation():
+    cache = TTLCache()
+    assert cache.clear_on_change("v1")
+    cache.set("a", 1)
+    assert not cache.clear_on_change("v1")
+    assert cache.get("a") == (True, 1)
+
+    cleared = []
+    threads = [threading.Thread(target=lambda: cleared.append(cache.clear_on_change("v2"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cleared.count(True) == 1
+    assert cache.get("a") == (False, None)
+
+
+def test_concurrent_misses_compute_once():
+    cache = TTLCache()
+    calls, release = [], threading.Event()
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.coalesced < 7:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == ["value"] * 8
+    assert cache.stats()["misses"] == 1
+
+
+def test_waiters_retry_when_the_computation_fails():
+    cache = TTLCache()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("backend down")
+
+    def first():
+        with pytest.raises(RuntimeError):
+            cache.get_or_compute("k", failing)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    started.wait(5)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_compute("k", lambda: "retried")))
+    waiter.start()
+    while cache.coalesced < 1:
+        time.sleep(0.01)
+    release.set()
+    thread.join()
+    waiter.join()
+    assert results == ["retried"]
+
+
+def test_negative_results_use_their_own_ttl():
+    cache = TTLCache(ttl=3600)
+    negative_ttl = lambda value: 0.05 if value is None else None if value == "skip" else 3600
+
+    assert cache.get_or_compute("missing", lambda: None, ttl=negative_ttl) is None
+    assert cache.get("missing") == (True, None)
+    time.sleep(0.1)
+    assert cache.get("missing") == (False, None)
+
+    # A TTL of None leaves the value uncached
+    assert cache.get_or_compute("error", lambda: "skip", ttl=negative_ttl) == "skip"
+    assert cache.get("error") == (False, None)
+    assert cache.get_or_compute("found", lambda: "hit", ttl=negative_ttl) == "hit"
+    assert cache.get("found") == (True, "hit")
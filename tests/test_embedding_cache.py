@@ -0,0 +1,80 @@
+import hashlib
+import multiprocessing
+import random
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app.embedding_cache import CachedEmbeddings
+
+
+def vector(text):
+    digest = hashlib.sha256(text.encode()).digest()
+    return [b / 255 for b in digest[:8]]
+
+
+class HashEmbeddings(Embeddings):
+    def embed_documents(self, texts):
+        return [vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return vector(text)
+
+
+def cache(path, max_entries=64):
+    return CachedEmbeddings(HashEmbeddings(), str(path), "test-model", max_entries=max_entries)
+
+
+def same(a, b):
+    return all(abs(x - y) < 1e-6 for x, y in zip(a, b))
+
+
+def hammer(path, seed, rounds):
+    """Embeds random batches from a pool larger than the cache, checking every vector."""
+    rng = random.Random(seed)
+    embeddings = cache(path)
+    pool = [f"log line {i}" for i in range(200)]
+    for _ in range(rounds):
+        texts = rng.sample(pool, 10)
+        for text, got in zip(texts, embeddings.embed_documents(texts)):
+            if not same(got, vector(text)):
+                raise SystemExit(f"wrong vector for {text!r}")
+
+
+def test_second_instance_does_not_truncate_the_vectors(tmp_path):
+    first = cache(tmp_path)
+    first.embed_documents(["a", "b"])
+    second = cache(tmp_path)
+    assert same(first.embed_documents(["a"])[0], vector("a"))
+    assert same(second.embed_documents(["b"])[0], vector("b"))
+    assert second.hits == 1
+
+
+def test_instance_opened_before_the_first_store_sees_it(tmp_path):
+    first, second = cache(tmp_path), cache(tmp_path)
+    first.embed_documents(["a"])
+    assert same(second.embed_documents(["a"])[0], vector("a"))
+    assert second.hits == 1
+
+
+def test_changed_capacity_starts_over_without_breaking_other_instances(tmp_path):
+    old = cache(tmp_path)
+    old.embed_documents(["a"])
+    new = cache(tmp_path, max_entries=128)
+    assert new.stats()["entries"] == 0
+    new.embed_documents(["b"])
+    assert same(old.embed_documents(["b"])[0], vector("b"))
+    assert same(old.embed_documents(["a"])[0], vector("a"))
+
+
+def test_two_processes_share_the_cache(tmp_path):
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("needs the fork start method")
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=hammer, args=(tmp_path, seed, 150)) for seed in range(2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(120)
+    assert [process.exitcode for process in processes] == [0, 0]
+    assert cache(tmp_path).stats()["entries"] == 64
@@ -0,0 +1,47 @@
+import asyncio
+
+import orjson
+
+from app.api.emitter import EventEmitter
+
+
+class StubManager:
+    def is_connected(self, sid, namespace):
+        return True
+
+    def eio_sid_from_sid(self, sid, namespace):
+        return None
+
+
+class StubServer:
+    """Accepts emits but never lets the sender loop run, like a stalled client."""
+
+    def __init__(self):
+        self.manager = StubManager()
+        self.disconnected = []
+
+    async def emit(self, *args, **kwargs):
+        await asyncio.sleep(3600)
+
+    async def disconnect(self, sid):
+        self.disconnected.append(sid)
+
+
+def test_slow_client_events_are_coalesced_then_bounded():
+    async def scenario():
+        sio = StubServer()
+        emitter = EventEmitter(sio, max_pending=2, max_queue=4)
+        emitter.emit("sid", "graph_event", orjson.dumps({"a": {"x": 1}}), "inv-1", coalescable=True)
+        emitter.emit("sid", "graph_event", orjson.dumps({"b": {"x": 2}}), "inv-1", coalescable=True)
+        emitter.emit("sid", "graph_event", orjson.dumps({"c": {"x": 3}}), "inv-1", coalescable=True)
+        assert emitter.coalesced == 1
+        # Events of new investigations cannot be coalesced, up to the hard limit
+        for i in range(2, 10):
+            emitter.emit("sid", "graph_event", orjson.dumps({"a": {}}), f"inv-{i}", coalescable=True)
+        await asyncio.sleep(0)
+        assert emitter.stats()["pending"] <= 4
+        assert sio.disconnected == ["sid"]
+        assert emitter.disconnected == 1
+        emitter.close("sid")
+
+    asyncio.run(scenario())
@@ -0,0 +1,33 @@
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+
+from app import resources
+from app.agents import log_analyst
+from app.main import builder
+from app.state import make_initial_state
+from fake_backend import FakeChatGroq
+
+
+@pytest.fixture
+def fake_llm():
+    """Answers every agent prompt with the benchmark's fake ChatGroq."""
+    resources.set_llm_factory(lambda model, temperature: FakeChatGroq(model=model, temperature=temperature))
+    log_analyst.get_log_analyst_chain.cache_clear()
+    yield
+    resources.set_llm_factory(None)
+    log_analyst.get_log_analyst_chain.cache_clear()
+
+
+def test_parallel_mode_runs_both_analysts_before_the_supervisor(virustotal, fake_llm):
+    graph = builder.compile(checkpointer=MemorySaver(), interrupt_before=["supervisor"])
+    config = {"configurable": {"thread_id": "parallel"}}
+    alert = {"prompt": "Suspicious login", "indicator": "203.0.113.9",
+             "logs": "sshd[311]: Failed password for root from 203.0.113.9 port 52113 ssh2",
+             "options": {"mode": "parallel"}}
+    graph.invoke(make_initial_state(alert), config)
+
+    # Stopped before the supervisor's first routing decision
+    snapshot = graph.get_state(config)
+    assert snapshot.next == ("supervisor",)
+    assert snapshot.values["intel"].is_malicious
+    assert snapshot.values["log_summary"] is not None
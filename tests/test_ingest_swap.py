@@ -0,0 +1,66 @@
+import os
+import json
+import threading
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def ingest(tmp_path, monkeypatch):
+    spec = importlib.util.spec_from_file_location("ingest", os.path.join(ROOT, "scripts", "ingest.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "DB_PATH", str(tmp_path / "vector_store"))
+    monkeypatch.setattr(module, "VERSIONS_PATH", str(tmp_path / "vector_store.versions"))
+    return module
+
+
+class FakeStore:
+    def save_local(self, path):
+        with open(os.path.join(path, "index.faiss"), "w") as f:
+            f.write("index")
+
+
+def test_swap_replaces_a_legacy_directory(ingest):
+    os.makedirs(ingest.DB_PATH)
+    with open(os.path.join(ingest.DB_PATH, "manifest.json"), "w") as f:
+        json.dump({"version": "old"}, f)
+
+    ingest.save_atomically(FakeStore(), {"version": "new"})
+    assert os.path.islink(ingest.DB_PATH)
+    assert ingest.load_manifest()["version"] == "new"
+    assert any(name.startswith("legacy-") for name in os.listdir(ingest.VERSIONS_PATH))
+
+
+def test_readers_never_see_a_missing_index(ingest):
+    ingest.save_atomically(FakeStore(), {"version": "v0"})
+    misses = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            if ingest.load_manifest() is None:
+                misses.append(1)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for i in range(1, 30):
+        ingest.save_atomically(FakeStore(), {"version": f"v{i}"})
+    done.set()
+    reader.join()
+
+    assert not misses
+    assert ingest.load_manifest()["version"] == "v29"
+
+
+def test_prune_keeps_recently_replaced_versions(ingest):
+    for i in range(6):
+        ingest.save_atomically(FakeStore(), {"version": f"v{i}"})
+    assert len(os.listdir(ingest.VERSIONS_PATH)) == 6
+
+    ingest.prune_versions(grace=0)
+    assert len(os.listdir(ingest.VERSIONS_PATH)) == ingest.KEEP_VERSIONS
+    assert ingest.load_manifest()["version"] == "v5"
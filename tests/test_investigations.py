@@ -0,0 +1,69 @@
+import time
+
+from app.investigations import InvestigationStore, alert_fingerprint
+
+
+def alert(**overrides):
+    return {"indicator": "203.0.113.7", "logs": "sshd: Accepted publickey for deploy", "options": {}, **overrides}
+
+
+def test_fingerprint_ignores_priority_and_replay():
+    assert alert_fingerprint(alert()) == alert_fingerprint(alert(options={"priority": "critical", "replay": False}))
+
+
+def test_fingerprint_separates_options_that_change_the_result():
+    assert alert_fingerprint(alert()) != alert_fingerprint(alert(options={"mode": "parallel"}))
+    assert alert_fingerprint(alert()) != alert_fingerprint(alert(options={"intel_prose": True}))
+
+
+def test_fingerprint_accepts_missing_fields():
+    assert alert_fingerprint({"indicator": None, "logs": None, "options": None}) == alert_fingerprint({})
+
+
+def failed_logins(ips, times=1, port=52113):
+    return "\n".join(f"Oct 18 10:00:{i % 60:02d} web01 sshd[{300 + i}]: Failed password for root from {ip} port {port + i}"
+                     for ip in ips for i in range(times))
+
+
+def test_fingerprint_ignores_timestamps_ports_and_pids():
+    assert alert_fingerprint(alert(logs=failed_logins(["203.0.113.9"], 5))) == \
+        alert_fingerprint(alert(logs=failed_logins(["203.0.113.9"], 6, port=40000)))
+
+
+def test_fingerprint_separates_a_brute_force_from_one_failed_login():
+    one = alert_fingerprint(alert(logs=failed_logins(["203.0.113.9"])))
+    assert one != alert_fingerprint(alert(logs=failed_logins([f"198.51.100.{i}" for i in range(50)])))
+    assert one != alert_fingerprint(alert(logs=failed_logins(["203.0.113.9"], 50)))
+    assert one != alert_fingerprint(alert(logs=failed_logins(["198.51.100.7"])))
+
+
+def test_purge_deletes_old_finished_investigations(tmp_path):
+    store = InvestigationStore(str(tmp_path / "investigations.sqlite"))
+    store.create("done", "f")
+    store.set_status("done", "completed")
+    store.create("running", "f")
+    time.sleep(0.02)
+    store.create("recent", "f")
+    store.set_status("recent", "failed")
+
+    assert store.purge(0.01) == 1
+    assert store.get("done") is None
+    assert store.get("running") is not None and store.get("recent") is not None
+
+
+def test_events_are_recorded_in_order(tmp_path):
+    store = InvestigationStore(str(tmp_path / "investigations.sqlite"))
+    store.create("a", "f")
+    store.create("b", "f")
+    for i in range(3):
+        store.append_event("a", {"node": i})
+    store.append_event("b", b'{"node": "b"}')
+
+    assert store.get("a")["events"] == [{"node": 0}, {"node": 1}, {"node": 2}]
+    assert store.get("b")["events"] == [{"node": "b"}]
+    store.set_status("a", "completed")
+    time.sleep(0.02)
+    assert store.purge(0.01) == 1
+    assert store.get("a") is None
+    store.create("a", "f")
+    assert store.get("a")["events"] == []
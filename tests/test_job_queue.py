@@ -0,0 +1,51 @@
+from app.job_queue import JobQueue
+
+
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite"))
+
+
+def test_jobs_are_claimed_in_priority_order(tmp_path):
+    jobs = queue(tmp_path)
+    jobs.put("low", {"alert": 1}, priority=3)
+    jobs.put("critical", {"alert": 2}, priority=0)
+    jobs.put("resume", None, priority=0)
+
+    first, second = jobs.claim("w1"), jobs.claim("w1")
+    assert (first["investigation_id"], first["initial_state"]) == ("critical", {"alert": 2})
+    assert (second["investigation_id"], second["initial_state"]) == ("resume", None)
+    assert jobs.claim("w1")["investigation_id"] == "low"
+    assert jobs.claim("w1") is None
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    jobs = queue(tmp_path)
+    jobs.put("inv", {"alert": 1})
+    assert jobs.claim("crashed", lease=-1)["attempts"] == 1
+
+    # Another process sharing the file picks it up, counting the attempt
+    job = queue(tmp_path).claim("w2")
+    assert (job["investigation_id"], job["attempts"]) == ("inv", 2)
+    assert jobs.claim("w3") is None
+
+
+def test_only_the_holder_renews_a_lease(tmp_path):
+    jobs = queue(tmp_path)
+    jobs.put("inv", {"alert": 1})
+    job = jobs.claim("w1", lease=-1)
+    jobs.renew([job["id"]], "w2")
+    assert jobs.claim("w2")["attempts"] == 2
+
+    jobs.renew([job["id"]], "w2", lease=60)
+    assert jobs.claim("w3") is None
+
+
+def test_finished_jobs_are_not_claimed(tmp_path):
+    jobs = queue(tmp_path)
+    jobs.put("inv", {"alert": 1}, fingerprint="fp")
+    job = jobs.claim("w1", lease=-1)
+    assert jobs.find_active("fp") == "inv"
+    jobs.finish(job["id"], "done")
+    assert jobs.claim("w2") is None
+    assert jobs.find_active("fp") is None
+    assert jobs.stats()["done"] == 1
@@ -0,0 +1,69 @@
+import time
+import threading
+
+import pytest
+
+from app.llm_gateway import LLMGateway, budget_share, priority_level
+
+
+@pytest.mark.parametrize("priority,level", [
+    ("critical", 0), ("LOW", 3), (None, 2), ("bogus", 2), (1, 1),
+    (-5, 0), (99, 3), (1e309, 2), (float("nan"), 2), (True, 2),
+])
+def test_priority_level_is_clamped_to_the_named_levels(priority, level):
+    assert priority_level(priority) == level
+
+
+@pytest.mark.parametrize("limit,shares,share", [(30, 1, 30), (12000, 4, 3000), (30, 8, 3), (2, 8, 1), (0, 8, 0)])
+def test_processes_split_the_budget(limit, shares, share):
+    assert budget_share(limit, shares) == share
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def admission_order(gateway, priorities, gap=0.0):
+    """Queues one call per priority behind a full budget, then frees the budget one call at a time."""
+    blocker, _ = gateway.acquire(0, 1)
+    admitted = []
+
+    def call(priority):
+        reservation, _ = gateway.acquire(priority, 1)
+        admitted.append((priority, reservation))
+
+    threads = []
+    for priority in priorities:
+        threads.append(threading.Thread(target=call, args=(priority,)))
+        threads[-1].start()
+        wait_for(lambda: len(gateway._waiting) == len(threads))
+        time.sleep(gap)
+    gateway.release(blocker)
+    for count in range(1, len(priorities) + 1):
+        wait_for(lambda: len(admitted) == count)
+        gateway.release(admitted[-1][1])
+    for thread in threads:
+        thread.join()
+    return [priority for priority, _ in admitted]
+
+
+def test_acquire_admits_the_most_urgent_call_first():
+    assert admission_order(LLMGateway(rpm=1, tpm=0), [3, 1, 2, 0]) == [0, 1, 2, 3]
+
+
+def test_waiting_calls_age_past_newer_urgent_ones():
+    # One level per 10ms: the low call queued 50ms earlier is ahead of the critical one
+    assert admission_order(LLMGateway(rpm=1, tpm=0, aging=0.01), [3, 0], gap=0.05) == [3, 0]
+
+
+def test_released_reservation_frees_the_budget():
+    gateway = LLMGateway(rpm=1, tpm=0)
+    reservation, _ = gateway.acquire(2, 10)
+    assert gateway.utilization()["requests"] == 1
+    gateway.release(reservation)
+    assert gateway.utilization()["requests"] == 0
+    _, waited = gateway.acquire(2, 10)
+    assert waited < 1
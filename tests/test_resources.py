@@ -0,0 +1,43 @@
+import json
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app import resources
+
+
+@pytest.fixture
+def built(monkeypatch):
+    """Replaces the sentence-transformers models with fakes, recording the models built."""
+    models = []
+
+    def build(model):
+        models.append(model)
+        return DeterministicFakeEmbedding(size=8)
+
+    monkeypatch.setattr(resources, "_build_embeddings", build)
+    monkeypatch.setattr(resources, "_embeddings", None)
+    monkeypatch.setattr(resources, "_other_embeddings", {})
+    return models
+
+
+def save_index(path, model):
+    from langchain_community.vectorstores import FAISS
+    FAISS.from_texts(["block the address", "isolate the host"], DeterministicFakeEmbedding(size=8)).save_local(str(path))
+    with open(path / "manifest.json", "w") as f:
+        json.dump({"version": model, "settings": {"embedding_model": model}}, f)
+
+
+def test_index_is_queried_with_the_model_it_was_built_with(tmp_path, built):
+    save_index(tmp_path, "other-model")
+    store, version = resources._load_vector_store(str(tmp_path))
+    assert built == ["other-model"]
+    assert store.embedding_function is resources.get_embeddings("other-model")
+    assert store.embedding_function is not resources.get_embeddings()
+
+
+def test_index_of_the_serving_model_shares_its_embeddings(tmp_path, built):
+    save_index(tmp_path, resources.EMBEDDING_MODEL)
+    store, _ = resources._load_vector_store(str(tmp_path))
+    assert store.embedding_function is resources.get_embeddings()
+    assert built == [resources.EMBEDDING_MODEL]
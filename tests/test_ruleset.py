@@ -0,0 +1,76 @@
+import os
+
+from app.agents.policy_agent import FirewallRule
+from app.ruleset import RuleSet
+
+
+def rule(source_ip, action="BLOCK", protocol="ANY"):
+    return FirewallRule(name=f"{action}-{source_ip}", action=action, source_ip=source_ip, protocol=protocol)
+
+
+def test_iptables_export_only_replaces_its_chain():
+    ruleset = RuleSet()
+    ruleset.add(rule("203.0.113.7"))
+    text = ruleset.to_iptables(4)
+    assert "--noflush" in text
+    assert "-A CYPHER -s 203.0.113.7/32 -j DROP" in text
+    # The built-in chains are not declared, so --noflush leaves their rules alone
+    assert ":INPUT" not in text and ":FORWARD" not in text
+
+
+def test_apply_script_hooks_the_chain_idempotently():
+    script = RuleSet.apply_script()
+    for command in ("iptables", "ip6tables"):
+        assert f"{command}-restore --noflush" in script
+        for hook in ("INPUT", "FORWARD"):
+            assert f"{command} -C {hook} -j CYPHER 2>/dev/null || {command} -I {hook} -j CYPHER" in script
+
+
+def test_both_formats_filter_input_and_forward():
+    ruleset = RuleSet()
+    ruleset.add(rule("203.0.113.7"))
+    ruleset.add(rule("198.51.100.1", action="ALLOW"))
+    nft = ruleset.to_nftables()
+    assert "hook input" in nft and "hook forward" in nft
+    # An allow skips the remaining rules here, but not the host's own firewall
+    assert "-A CYPHER -s 198.51.100.1/32 -j RETURN" in ruleset.to_iptables(4)
+
+
+def test_export_writes_every_format(tmp_path):
+    ruleset = RuleSet()
+    ruleset.add(rule("2001:db8::1"))
+    paths = ruleset.export(str(tmp_path))
+    assert sorted(os.path.basename(p) for p in paths) == \
+        ["apply-iptables.sh", "ip6tables.rules", "iptables.rules", "nftables.conf"]
+    assert os.access(tmp_path / "apply-iptables.sh", os.X_OK)
+    assert "2001:db8::1/128" in (tmp_path / "ip6tables.rules").read_text()
+
+
+def test_version_is_shared_by_every_process_using_the_database(tmp_path):
+    path = str(tmp_path / "rules.sqlite")
+    server, worker = RuleSet(path), RuleSet(path)
+    assert server.version == 0
+    assert worker.add(rule("203.0.113.7"))
+    assert server.version == 1
+    assert not worker.add(rule("203.0.113.7"))
+    assert server.version == 1
+    assert server.remove("203.0.113.7") == 1
+    assert worker.version == 2
+    assert RuleSet(path).version == 2
+
+
+def test_compile_collapses_networks_per_action_and_protocol():
+    ruleset = RuleSet()
+    for host in range(256):
+        ruleset.add(rule(f"198.51.100.{host}"))
+    ruleset.add(rule("198.51.100.0/25"))  # Already covered
+    ruleset.add(rule("203.0.113.9", protocol="TCP"))
+    ruleset.add(rule("2001:db8::1"))
+    ruleset.add(rule("2001:db8::/64"))
+    ruleset.add(rule("192.0.2.1", action="ALLOW"))
+
+    compiled = {key: [str(n) for n in networks] for key, networks in ruleset.compile().items()}
+    assert list(compiled) == [("ALLOW", "ANY"), ("BLOCK", "ANY"), ("BLOCK", "TCP")]
+    assert compiled[("BLOCK", "ANY")] == ["198.51.100.0/24", "2001:db8::/64"]
+    assert compiled[("BLOCK", "TCP")] == ["203.0.113.9/32"]
+    assert ruleset.stats()["compiled_entries"] == 4
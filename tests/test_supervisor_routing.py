@@ -0,0 +1,36 @@
+import inspect
+import itertools
+
+import pytest
+
+from app.agents.supervisor import route_by_rules, supervisor_prompt
+
+FLAGS = list(inspect.signature(route_by_rules).parameters)
+
+
+def prompt_decisions(intel_available, log_summary_available, threat_detected, playbook_consulted, policy_generated):
+    """Every next step one of the five rules of the supervisor prompt calls for, read off the prompt."""
+    decisions = set()
+    if not intel_available:
+        decisions.add("Threat_Analyst")  # Rule 1
+    if intel_available and not threat_detected and not log_summary_available:
+        decisions.add("Log_Analyst")  # Rule 2
+    if threat_detected and not playbook_consulted:
+        decisions.add("Consultant_Agent")  # Rule 3
+    if threat_detected and playbook_consulted and not policy_generated:
+        decisions.add("Policy_Agent")  # Rule 4
+    if (intel_available and log_summary_available and not threat_detected) or (threat_detected and policy_generated):
+        decisions.add("end_investigation")  # Rule 5
+    return decisions
+
+
+@pytest.mark.parametrize("flags", list(itertools.product([False, True], repeat=len(FLAGS))))
+def test_rule_table_matches_prompt(flags):
+    decisions = prompt_decisions(*flags)
+    # States where rules compete are left to the LLM fallback
+    expected = decisions.pop() if len(decisions) == 1 else None
+    assert route_by_rules(**dict(zip(FLAGS, flags))) == expected
+
+
+def test_prompt_and_table_share_the_state_flags():
+    assert set(supervisor_prompt.input_variables) - {"investigation_trace"} == set(FLAGS)
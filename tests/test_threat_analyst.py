@@ -0,0 +1,42 @@
+import json
+
+from app.agents.threat_analyst import ThreatIntel, assess_report
+from app.agents.log_analyst import LogAnalysis
+from app.main import run_supervisor
+
+
+def vt_report(malicious=0, suspicious=0, reputation=0):
+    return json.dumps({"indicator": "203.0.113.7", "type": "ip", "reputation": reputation,
+                       "analysis_stats": {"harmless": 60, "malicious": malicious, "suspicious": suspicious,
+                                          "undetected": 10}})
+
+
+def test_detections_are_malicious():
+    assert assess_report(vt_report(malicious=1)).is_malicious
+    assert assess_report(vt_report(suspicious=2)).is_malicious
+    assert assess_report(vt_report(reputation=-5)).is_malicious
+
+
+def test_clean_report_is_benign():
+    intel = assess_report(vt_report())
+    assert not intel.is_malicious and not intel.lookup_failed
+
+
+def test_failed_lookup_has_no_verdict():
+    for raw in ("Error: VirusTotal API key not found in environment variables.",
+                "HTTP error occurred: 503 Service Unavailable", None):
+        intel = assess_report(raw)
+        assert intel.lookup_failed and not intel.is_malicious
+
+
+def test_supervisor_escalates_when_there_is_no_verdict():
+    intel = assess_report("An unexpected error occurred: timed out")
+    state = {"intel": intel, "logs": "routine", "log_summary": LogAnalysis(summary="ok", contains_anomaly=False)}
+    update = run_supervisor(state)
+    assert update["next_node"] == "end_investigation"
+    assert update["needs_analyst"] is True
+
+
+def test_supervisor_ends_benign_investigations_normally():
+    state = {"intel": ThreatIntel(summary="clean", is_malicious=False), "logs": ""}
+    assert run_supervisor(state) == {"next_node": "end_investigation"}
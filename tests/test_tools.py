@@ -0,0 +1,62 @@
+from app import tools
+from app.ioc import extract_iocs
+from app.tools import TokenBucket, lookup_indicators
+
+
+def ip(value):
+    return {"type": "ip", "value": value}
+
+
+def test_stub_verdicts_are_cached(virustotal):
+    reports = lookup_indicators([ip("203.0.113.9"), ip("203.0.113.10")])
+    assert '"is_malicious": true' in reports["203.0.113.9"]
+    assert '"is_malicious": false' in reports["203.0.113.10"]
+    assert tools.reputation_cache.get("203.0.113.9")[0]
+
+
+def test_internal_domains_are_not_sent():
+    assert extract_iocs("dns query for dc01.corp and nas.local and evil.example.net") == \
+        [{"type": "domain", "value": "evil.example.net"}]
+
+
+def test_dotted_log_tokens_are_not_domains():
+    line = ("2024-05-01 12:00:01 ERROR [app.worker] java.lang.NullPointerException at "
+            "com.example.Handler.run(Handler.java:42): pam_unix session.opened for user root, "
+            "config.yaml reloaded, beacon to update.evil-cdn.xyz from 93.184.216.34")
+    assert extract_iocs(line) == [{"type": "domain", "value": "update.evil-cdn.xyz"},
+                                  {"type": "ip", "value": "93.184.216.34"}]
+
+
+def test_internal_domain_lookup_is_refused(virustotal):
+    report = lookup_indicators([{"type": "domain", "value": "fileserver.internal"}])["fileserver.internal"]
+    assert report == tools.NOT_LOOKED_UP_INTERNAL
+
+
+def test_best_effort_lookups_leave_a_token_for_the_investigated_indicator(virustotal, monkeypatch):
+    monkeypatch.setattr(tools._lookups, "bucket", TokenBucket(1, 2))
+    secondary = lookup_indicators([ip("203.0.113.1"), ip("203.0.113.2")], best_effort=True)
+    assert secondary["203.0.113.2"] == tools.NOT_LOOKED_UP_RATE_LIMIT
+    assert "is_malicious" in secondary["203.0.113.1"]
+    # The reserved token is still there for the next investigated indicator
+    assert "is_malicious" in lookup_indicators([ip("203.0.113.3")])["203.0.113.3"]
+
+
+def test_best_effort_lookups_give_up_at_the_deadline(virustotal, monkeypatch):
+    virustotal(latency=1.0)
+    monkeypatch.setattr(tools, "IOC_LOOKUP_DEADLINE", 0.1)
+    report = lookup_indicators([ip("203.0.113.4")], best_effort=True)["203.0.113.4"]
+    assert report == tools.NOT_LOOKED_UP_DEADLINE
+    assert not tools.reputation_cache.get("203.0.113.4")[0]
+
+
+def test_threat_analyst_lookups_are_recorded_as_tool_calls(virustotal):
+    from app.agents.threat_analyst import run_threat_analyst
+    from app.telemetry import InvestigationTelemetry, registry, traced_node
+
+    telemetry = InvestigationTelemetry("tools")
+    state = {"indicator": "203.0.113.9", "alert": {}, "logs": "connection from 93.184.216.34", "options": {}}
+    traced_node("threat_analyst", run_threat_analyst)(state, {"configurable": {"telemetry": telemetry}})
+
+    # The investigated indicator, then the other IOCs of the alert
+    assert telemetry.summary()["tool_calls"] == 2
+    assert 'cypher_tool_duration_seconds_count{tool="virustotal_lookup"}' in registry.render()